@@ -9,6 +9,7 @@ from rest_framework.permissions import AllowAny
 from rest_framework.parsers import MultiPartParser, JSONParser
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 import numpy as np
 import logging
 
@@ -19,6 +20,8 @@ from core.models import (
     LoginDetectionResult, CustomYoloModel
 )
 from apps.detection.compliance_rules import check_full_compliance
+from apps.detection.box_store import BoxSet
+from apps.detection.inference_scheduler import checkin_priority
 
 
 class TripViewSet(viewsets.ViewSet):
@@ -79,10 +82,26 @@ class TripViewSet(viewsets.ViewSet):
             return None
         
         def get_vehicle_image_url(vehicle):
+            """Annotated view: cached render, lazy-render endpoint, or the stored image."""
+            if not vehicle or not vehicle.vehicle_image:
+                return None
+            if vehicle.annotated_image:
+                return vehicle.annotated_image.url
+            if vehicle.box_data:
+                return reverse('trip-vehicle-annotated', args=[vehicle.id])
+            return vehicle.vehicle_image.url
+        
+        def get_vehicle_original_url(vehicle):
             if vehicle and vehicle.vehicle_image:
                 return vehicle.vehicle_image.url
             return None
         
+        def get_vehicle_boxes(vehicle):
+            """Stored boxes, bbox normalized to the original image (0..1)."""
+            if not vehicle:
+                return None
+            return BoxSet.from_record(vehicle).to_dicts()
+        
         data = []
         for trip in trips:
             data.append({
@@ -111,12 +130,16 @@ class TripViewSet(viewsets.ViewSet):
                 'checkin_driver_image': get_image_url(trip.checkin_driver_detection),
                 'checkin_helper_image': get_image_url(trip.checkin_helper_detection),
                 'checkin_vehicle_image': get_vehicle_image_url(trip.checkin_vehicle),
+                'checkin_vehicle_original_image': get_vehicle_original_url(trip.checkin_vehicle),
+                'checkin_vehicle_boxes': get_vehicle_boxes(trip.checkin_vehicle),
                 'checkin_vehicle_detections': trip.checkin_vehicle.detections if trip.checkin_vehicle else None,
                 'checkin_compliance_details': trip.checkin_vehicle.compliance_details if trip.checkin_vehicle else None,
                 # Check-out images
                 'checkout_driver_image': get_image_url(trip.checkout_driver_detection),
                 'checkout_helper_image': get_image_url(trip.checkout_helper_detection),
                 'checkout_vehicle_image': get_vehicle_image_url(trip.checkout_vehicle),
+                'checkout_vehicle_original_image': get_vehicle_original_url(trip.checkout_vehicle),
+                'checkout_vehicle_boxes': get_vehicle_boxes(trip.checkout_vehicle),
                 'checkout_vehicle_detections': trip.checkout_vehicle.detections if trip.checkout_vehicle else None,
                 'checkout_compliance_details': trip.checkout_vehicle.compliance_details if trip.checkout_vehicle else None,
                 # GPS Locations
@@ -193,7 +216,25 @@ class TripViewSet(viewsets.ViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=500)
     
+    @action(detail=False, methods=['get'], url_path=r'vehicle-records/(?P<record_id>[^/.]+)/annotated')
+    def vehicle_annotated_image(self, request, record_id=None):
+        """
+        Annotated vehicle image, drawn from the stored boxes on first request
+        and cached on the record. Redirects to the image file.
+        
+        GET /trips/vehicle-records/{record_id}/annotated/
+        """
+        from django.http import HttpResponseRedirect
+        from apps.detection.annotation import get_annotated_image
+        
+        record = get_object_or_404(VehicleComplianceRecord, pk=record_id)
+        image = get_annotated_image(record)
+        if not image:
+            return Response({'error': 'No image for this record'}, status=404)
+        return HttpResponseRedirect(image.url)
+
     @action(detail=False, methods=['post'], url_path='driver-checkin')
+    @checkin_priority
     def driver_checkin(self, request):
         """
         Step 1: Driver checks in with face verification.
@@ -373,6 +414,7 @@ class TripViewSet(viewsets.ViewSet):
         })
     
     @action(detail=True, methods=['post'], url_path='helper-checkin')
+    @checkin_priority
     def helper_checkin(self, request, pk=None):
         """
         Step 2: Helper checks in with face verification.
@@ -470,6 +512,7 @@ class TripViewSet(viewsets.ViewSet):
         })
     
     @action(detail=True, methods=['post'], url_path='vehicle-checkin')
+    @checkin_priority
     def vehicle_checkin(self, request, pk=None):
         """
         Step 3: Capture vehicle image and run YOLO compliance check.
@@ -490,13 +533,10 @@ class TripViewSet(viewsets.ViewSet):
         # Run YOLO detection
         yolo_result = self._run_yolo_detection(trip.organization, image_file)
         
-        # Check compliance (pass yolo_model for dynamic requirements)
-        from core.models import CustomYoloModel
-        yolo_model = CustomYoloModel.objects.filter(
-            organization=trip.organization,
-            is_active=True
-        ).first()
-        compliance_result = check_full_compliance(yolo_result['detections'], yolo_model)
+        # Check compliance on the boxes (per-class confidence rules) with the profile the detection used
+        compliance_result = check_full_compliance(
+            yolo_result['boxes'], yolo_result.get('yolo_model'), profile=yolo_result.get('profile')
+        )
         
         # Save VehicleComplianceRecord
         now = timezone.now()
@@ -505,26 +545,20 @@ class TripViewSet(viewsets.ViewSet):
             organization=trip.organization,
             yolo_model_id=yolo_result.get('model_id'),
             detections=yolo_result['detections'],
+            box_data=yolo_result['boxes'].to_bytes(),
+            box_classes=yolo_result['boxes'].classes,
             compliance_passed=compliance_result['passed'],
             compliance_details=compliance_result
         )
         
-        # Save image (Annotated if available, else original)
-        if yolo_result.get('annotated_image'):
-            from django.core.files.base import ContentFile
-            vehicle_record.vehicle_image.save(
-                f'vehicle_checkin_{now.strftime("%Y%m%d_%H%M%S")}.jpg',
-                ContentFile(yolo_result['annotated_image']),
-                save=True
-            )
-        else:
-            from django.core.files.base import ContentFile
-            image_file.seek(0)
-            vehicle_record.vehicle_image.save(
-                f'vehicle_checkin_{now.strftime("%Y%m%d_%H%M%S")}.jpg',
-                ContentFile(image_file.read()),
-                save=True
-            )
+        # Save the original photo; the annotated view is rendered on first request
+        from django.core.files.base import ContentFile
+        image_file.seek(0)
+        vehicle_record.vehicle_image.save(
+            f'vehicle_checkin_{now.strftime("%Y%m%d_%H%M%S")}.jpg',
+            ContentFile(image_file.read()),
+            save=True
+        )
         
         # Update trip
         trip.checkin_vehicle = vehicle_record
@@ -545,6 +579,7 @@ class TripViewSet(viewsets.ViewSet):
     # ... (driver_checkout, helper_checkout, skip_helper_checkout omitted, assume unchanged) ...
 
     @action(detail=True, methods=['post'], url_path='driver-checkout')
+    @checkin_priority
     def driver_checkout(self, request, pk=None):
         """
         Step 4: Driver checks out with face verification.
@@ -646,6 +681,7 @@ class TripViewSet(viewsets.ViewSet):
         })
     
     @action(detail=True, methods=['post'], url_path='helper-checkout')
+    @checkin_priority
     def helper_checkout(self, request, pk=None):
         """
         Step 5: Helper checks out with face verification.
@@ -724,6 +760,7 @@ class TripViewSet(viewsets.ViewSet):
         })
     
     @action(detail=True, methods=['post'], url_path='vehicle-checkout')
+    @checkin_priority
     def vehicle_checkout(self, request, pk=None):
         """
         Step 6: Capture vehicle image and complete trip.
@@ -743,13 +780,10 @@ class TripViewSet(viewsets.ViewSet):
         # Run YOLO detection
         yolo_result = self._run_yolo_detection(trip.organization, image_file)
         
-        # Check compliance (pass yolo_model for dynamic requirements)
-        from core.models import CustomYoloModel
-        yolo_model = CustomYoloModel.objects.filter(
-            organization=trip.organization,
-            is_active=True
-        ).first()
-        compliance_result = check_full_compliance(yolo_result['detections'], yolo_model)
+        # Check compliance on the boxes (per-class confidence rules) with the profile the detection used
+        compliance_result = check_full_compliance(
+            yolo_result['boxes'], yolo_result.get('yolo_model'), profile=yolo_result.get('profile')
+        )
         
         # Save VehicleComplianceRecord
         now = timezone.now()
@@ -758,26 +792,20 @@ class TripViewSet(viewsets.ViewSet):
             organization=trip.organization,
             yolo_model_id=yolo_result.get('model_id'),
             detections=yolo_result['detections'],
+            box_data=yolo_result['boxes'].to_bytes(),
+            box_classes=yolo_result['boxes'].classes,
             compliance_passed=compliance_result['passed'],
             compliance_details=compliance_result
         )
         
-        # Save image (Annotated if available, else original)
-        if yolo_result.get('annotated_image'):
-            from django.core.files.base import ContentFile
-            vehicle_record.vehicle_image.save(
-                f'vehicle_checkout_{now.strftime("%Y%m%d_%H%M%S")}.jpg',
-                ContentFile(yolo_result['annotated_image']),
-                save=True
-            )
-        else:
-            from django.core.files.base import ContentFile
-            image_file.seek(0)
-            vehicle_record.vehicle_image.save(
-                f'vehicle_checkout_{now.strftime("%Y%m%d_%H%M%S")}.jpg',
-                ContentFile(image_file.read()),
-                save=True
-            )
+        # Save the original photo; the annotated view is rendered on first request
+        from django.core.files.base import ContentFile
+        image_file.seek(0)
+        vehicle_record.vehicle_image.save(
+            f'vehicle_checkout_{now.strftime("%Y%m%d_%H%M%S")}.jpg',
+            ContentFile(image_file.read()),
+            save=True
+        )
         
         # Complete trip
         trip.checkout_vehicle = vehicle_record
@@ -951,40 +979,15 @@ class TripViewSet(viewsets.ViewSet):
             if not distances:
                  return {'success': False, 'error': 'No valid embeddings to compare against'}
             
-            distances.sort()  # Sort ascending (best matches first)
-            
-            # Use central threshold from service
+            # k-NN voting against the central threshold (shared with 1:N identification)
             from apps.faces.deepface_service import DeepFaceService
-            
-            # --- k-NN Logic (Voting) ---
-            # If we have enough data (>= 5 samples), use voting
-            if len(distances) >= 5:
-                k = 3
-                top_k = distances[:k]
-                avg_distance = sum(top_k) / len(top_k)
-                
-                # Check 1: Average of top 3 is good
-                # We expect average to be slightly higher than best, so we use the relaxed threshold 
-                is_match = avg_distance < DeepFaceService.THRESHOLD
-                
-                # Check 2: At least 2 are VERY good (strict match)
-                # This saves cases where 1 match is bad but 2 are excellent
-                strict_threshold = 0.15
-                strong_matches = len([d for d in top_k if d < strict_threshold])
-                if strong_matches >= 2:
-                    is_match = True
-                    
-                match_score = round(1 - avg_distance, 3)
-                final_distance = round(avg_distance, 3)
-                match_type = f"k-NN (avg top {k})"
-            else:
-                # Not enough data, fall back to single best match
-                # But use a slightly stricter check since we lack voting confidence
-                best_distance = distances[0]
-                is_match = best_distance < DeepFaceService.THRESHOLD
-                match_score = round(1 - best_distance, 3)
-                final_distance = round(best_distance, 3)
-                match_type = "Single Best (Low Data)"
+            from apps.faces.identification import knn_vote
+
+            vote = knn_vote(distances, DeepFaceService.THRESHOLD)
+            is_match = vote['is_match']
+            match_score = round(vote['confidence'], 3)
+            final_distance = round(vote['distance'], 3)
+            match_type = vote['method']
 
             if not is_match:
                 return {
@@ -1006,10 +1009,11 @@ class TripViewSet(viewsets.ViewSet):
                 os.remove(temp_path)
     
     def _run_yolo_detection(self, org, image_file):
-        """Run YOLO detection on vehicle image, return detections AND annotated image.
-        Only detects classes that user has marked as 'required' in the YOLO model settings.
+        """Run YOLO detection on vehicle image, return class counts AND per-box detections.
+        Only classes the compliance rules look at (the 'required' classes by default) are counted;
+        'boxes' (BoxSet) keeps every detection for storage.
         """
-        from core.models import DetectionRequirement
+        from apps.detection.detection_profile import get_detection_profile
         
         # Get active YOLO model for org
         yolo_model = CustomYoloModel.objects.filter(
@@ -1020,32 +1024,29 @@ class TripViewSet(viewsets.ViewSet):
         if not yolo_model:
             return {
                 'detections': {},
+                'boxes': BoxSet(),
                 'model_id': None,
-                'annotated_image': None,
+                'yolo_model': None,
                 'message': 'No YOLO model configured'
             }
         
-        # Get required classes from database (only detect what user selected)
-        required_classes = list(
-            DetectionRequirement.objects.filter(
-                yolo_model=yolo_model,
-                is_required=True
-            ).values_list('class_name', flat=True)
-        )
+        # Required classes / compiled rules from the cached detection profile
+        profile = get_detection_profile(yolo_model)
+        required_classes = profile.required
         
-        if not required_classes:
+        if not profile.counted_lower:
             return {
                 'detections': {},
+                'boxes': BoxSet(),
                 'model_id': str(yolo_model.id),
-                'annotated_image': None,
+                'yolo_model': yolo_model,
+                'profile': profile,
                 'message': 'No classes marked as required'
             }
         
         # Save temp file
         import tempfile
         import os
-        import cv2
-        import numpy as np
         
         with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
             for chunk in image_file.chunks():
@@ -1053,51 +1054,60 @@ class TripViewSet(viewsets.ViewSet):
             temp_path = temp_file.name
         
         try:
-            from ultralytics import YOLO
-            model = YOLO(yolo_model.model_file.path)
-            
-            # Get class IDs for required classes only
-            class_ids = []
-            required_lower = [c.lower() for c in required_classes]
-            for idx, name in model.names.items():
-                if name.lower() in required_lower:
-                    class_ids.append(idx)
+            from apps.detection.yolo_service import get_yolo_service
             
-            print(f"YOLO filtering to classes: {required_classes} -> IDs: {class_ids}")
+            # Shared, already-loaded model (fastest validated runtime) instead of a fresh YOLO() per request
+            service = get_yolo_service()
+            model_id = str(yolo_model.id)
+            if not service.load_custom_model(yolo_model):
+                raise RuntimeError('YOLO model could not be loaded')
             
-            # Run detection with class filter
-            results = model(temp_path, classes=class_ids if class_ids else None)
+            # Keep every box (all classes) so later rule changes can be re-evaluated
+            # from the stored boxes; only the required classes count towards compliance
+            from apps.detection.tiled_inference import TILING_ENABLED, detect_tiled
             
-            # Count detections by class
-            detections = {}
-            if results and len(results) > 0:
-                for r in results:
-                    for box in r.boxes:
-                        class_id = int(box.cls[0])
-                        class_name = r.names[class_id]
-                        detections[class_name] = detections.get(class_name, 0) + 1
+            def run_detection():
+                if TILING_ENABLED:
+                    # Reduced-size coarse pass + full-resolution crops for small objects
+                    boxes, tiling = detect_tiled(service, model_id, temp_path, profile)
+                    logger.info(f"Tiled YOLO: {tiling}")
+                    return boxes
+                import cv2
+                img = cv2.imread(temp_path)
+                if img is None:
+                    raise ValueError('Could not decode vehicle image')
+                (pixel_boxes,) = service.detect_batch([img], model_id)
+                return BoxSet.from_dicts(pixel_boxes, image_size=(img.shape[1], img.shape[0]))
             
-            # Generate Annotated Image (with boxes, without confidence scores for cleaner UX)
-            annotated_image = None
-            if results and len(results) > 0:
-                im_array = results[0].plot(conf=False)  # conf=False removes confidence percentages
-                success, encoded_img = cv2.imencode('.jpg', im_array)
-                if success:
-                    annotated_image = encoded_img.tobytes()
+            runtime_path = service.get_loaded_path(model_id)
+            try:
+                boxes = run_detection()
+            except Exception as e:
+                # A failing exported runtime is dropped by the service: retry once on the .pt
+                # rather than recording "nothing detected"
+                if not service.load_custom_model(yolo_model) or service.get_loaded_path(model_id) == runtime_path:
+                    raise
+                logger.warning(f"YOLO runtime {runtime_path} failed ({e}), retrying with {service.get_loaded_path(model_id)}")
+                boxes = run_detection()
+            detections = boxes.counts(classes=profile.counted_lower)
             
             return {
                 'detections': detections,
+                'boxes': boxes,
                 'model_id': str(yolo_model.id),
                 'model_name': yolo_model.name,
-                'annotated_image': annotated_image,
+                'yolo_model': yolo_model,
+                'profile': profile,
                 'required_classes': required_classes
             }
         except Exception as e:
             print(f"YOLO Error: {e}")
             return {
                 'detections': {},
+                'boxes': BoxSet(),
                 'model_id': str(yolo_model.id) if yolo_model else None,
-                'annotated_image': None,
+                'yolo_model': yolo_model,
+                'profile': profile,
                 'error': str(e)
             }
         finally:
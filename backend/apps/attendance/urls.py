@@ -39,6 +39,7 @@ trip_driver_checkout = TripViewSet.as_view({'post': 'driver_checkout'})
 trip_helper_checkout = TripViewSet.as_view({'post': 'helper_checkout'})
 trip_skip_helper_checkout = TripViewSet.as_view({'post': 'skip_helper_checkout'})
 trip_vehicle_checkout = TripViewSet.as_view({'post': 'vehicle_checkout'})
+trip_vehicle_annotated = TripViewSet.as_view({'get': 'vehicle_annotated_image'})
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -55,6 +56,7 @@ urlpatterns = [
     path('trips/<uuid:pk>/helper-checkout/', trip_helper_checkout, name='trip-helper-checkout'),
     path('trips/<uuid:pk>/skip-helper-checkout/', trip_skip_helper_checkout, name='trip-skip-helper-checkout'),
     path('trips/<uuid:pk>/vehicle-checkout/', trip_vehicle_checkout, name='trip-vehicle-checkout'),
+    path('trips/vehicle-records/<uuid:record_id>/annotated/', trip_vehicle_annotated, name='trip-vehicle-annotated'),
     path('login/', OrgLoginView.as_view(), name='org-login'),
     path('verify-employee/', VerifyEmployeeView.as_view(), name='verify-employee'),
     
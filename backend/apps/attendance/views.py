@@ -19,6 +19,7 @@ import numpy as np
 
 from core.models import Organization, SaaSEmployee as Employee, SaaSAttendance as AttendanceRecord, Trip, Area, Ward, Route
 from django.db.models import Q
+from apps.detection.inference_scheduler import checkin_priority
 
 
 class OrganizationListView(APIView):
@@ -597,6 +598,7 @@ class CaptureImagesView(APIView):
                 print(f"Warning: Could not chmod directory: {e}")
             
             new_heavy_embeddings = []  # 512-d from DeepFace
+            saved_embeddings = {}  # filename -> embedding, reused by training (embedding manifest)
             faces_detected = 0
             current_count = employee.image_count or 0
             
@@ -607,7 +609,7 @@ class CaptureImagesView(APIView):
                     temp_path = f.name
                 
                 # Generate 512-d embedding with DeepFace
-                embedding = service.get_embedding(temp_path)
+                embedding = service.get_embedding(temp_path, profile='training')
                 if embedding is not None:
                     new_heavy_embeddings.append(list(embedding))
                     faces_detected += 1
@@ -616,6 +618,7 @@ class CaptureImagesView(APIView):
                     img_filename = f"{current_count + faces_detected:04d}.jpg"
                     img_path = os.path.join(images_dir, img_filename)
                     shutil.copy(temp_path, img_path)
+                    saved_embeddings[img_filename] = embedding
                     try:
                         os.chmod(img_path, 0o644) # Ensure file is readable by others (Nginx)
                     except Exception as e:
@@ -626,6 +629,9 @@ class CaptureImagesView(APIView):
             if faces_detected == 0:
                 return Response({'error': 'No faces detected. Please ensure good lighting and face visibility.'}, status=400)
             
+            from apps.faces.embedding_manifest import record_embeddings
+            record_embeddings(images_dir, saved_embeddings)
+            
             # Store 512-d embeddings (for heavy model)
             current_heavy = employee.captured_embeddings or []
             current_heavy.extend(new_heavy_embeddings)
@@ -721,6 +727,9 @@ class TrainModelView(APIView):
         
         trained_count = 0
         total_embeddings = 0
+        selection = {'retained': 0, 'dropped': 0}  # Heavy mode embedding selection totals
+        inference = {'embedded': 0, 'reused': 0}  # Heavy mode: images run through the model vs taken from the manifest
+        chroma_rows = []  # Written to ChromaDB in one bulk upsert after the loop
         
         # Import ChromaDB service
         from services.vector_db import vector_db
@@ -728,8 +737,13 @@ class TrainModelView(APIView):
         if mode == 'heavy':
             # HEAVY MODE: Re-process images with DeepFace for better accuracy
             from apps.faces.deepface_service import get_deepface_service
+            from apps.faces.embedding_selection import select_diverse_embeddings
+            from apps.faces.embedding_manifest import embed_images
             service = get_deepface_service()
             
+            def embed(path):
+                return service.get_embedding(path, profile='training', raise_errors=True)
+            
             for emp in employees:
                 # Get images from disk
                 images_dir = os.path.join(settings.MEDIA_ROOT, 'employee_faces', org_code, emp.employee_id)
@@ -737,23 +751,24 @@ class TrainModelView(APIView):
                 if not os.path.exists(images_dir):
                     continue
                 
-                deep_embeddings = []
-                for filename in os.listdir(images_dir):
-                    if filename.endswith(('.jpg', '.jpeg', '.png')):
-                        img_path = os.path.join(images_dir, filename)
-                        embedding = service.get_embedding(img_path)
-                        if embedding is not None:
-                            deep_embeddings.append(list(embedding))
+                # Only new or changed images are run through the model
+                deep_embeddings, report = embed_images(images_dir, embed)
+                inference['embedded'] += report['embedded']
+                inference['reused'] += report['reused']
                 
                 if len(deep_embeddings) >= 3:
+                    # Keep a bounded, diverse set (consecutive frames are near-duplicates)
+                    kept, report = select_diverse_embeddings(deep_embeddings)
+                    deep_embeddings = [deep_embeddings[i] for i in kept]
+                    selection['retained'] += report['retained']
+                    selection['dropped'] += report['dropped']
+                    
                     # Store in ChromaDB for fast similarity search
-                    vector_db.add_embeddings(
-                        org_code=org_code,
-                        model_type='heavy',
-                        employee_id=emp.employee_id,
-                        embeddings=deep_embeddings,
-                        employee_name=emp.full_name
-                    )
+                    chroma_rows.append({
+                        'employee_id': emp.employee_id,
+                        'employee_name': emp.full_name,
+                        'embeddings': deep_embeddings
+                    })
                     
                     # Update employee status (keep embeddings in MySQL as backup)
                     emp.heavy_embeddings = deep_embeddings
@@ -783,13 +798,11 @@ class TrainModelView(APIView):
                     continue
                 
                 # Store in ChromaDB for fast similarity search
-                vector_db.add_embeddings(
-                    org_code=org_code,
-                    model_type='light',
-                    employee_id=emp.employee_id,
-                    embeddings=embeddings,
-                    employee_name=emp.full_name
-                )
+                chroma_rows.append({
+                    'employee_id': emp.employee_id,
+                    'employee_name': emp.full_name,
+                    'embeddings': embeddings
+                })
                 
                 # Store in LIGHT model fields (128-d embeddings) - keep as backup
                 emp.light_embeddings = embeddings
@@ -808,6 +821,8 @@ class TrainModelView(APIView):
                 trained_count += 1
                 total_embeddings += len(embeddings)
         
+        vector_db.bulk_upsert_embeddings(org_code, mode, chroma_rows)
+        
         model_name = 'DeepFace/ArcFace (512-d)' if mode == 'heavy' else 'face-api.js (128-d)'
         
         return Response({
@@ -816,6 +831,8 @@ class TrainModelView(APIView):
             'model': model_name,
             'employees_trained': trained_count,
             'total_embeddings': total_embeddings,
+            'selection': selection,
+            'images': inference,
             'message': f'{trained_count} employees trained with {model_name}!'
         })
 
@@ -961,8 +978,10 @@ class DeleteEmployeeDataView(APIView):
         images_dir = os.path.join(settings.MEDIA_ROOT, 'employee_faces', org_code, employee_id)
         deleted_images = 0
         if os.path.exists(images_dir):
-            deleted_images = len(os.listdir(images_dir))
+            deleted_images = len([f for f in os.listdir(images_dir) if f.endswith(('.jpg', '.jpeg', '.png'))])
             shutil.rmtree(images_dir)
+        from apps.faces.embedding_manifest import delete_manifest
+        delete_manifest(images_dir)
         
         # Reset employee model data
         employee.face_embeddings = []
@@ -1076,6 +1095,7 @@ class CheckInView(APIView):
     parser_classes = [MultiPartParser]
     permission_classes = [AllowAny]
     
+    @checkin_priority
     def post(self, request):
         org_code = request.data.get('org_code', '').upper().strip()
         image = request.FILES.get('image')
@@ -1102,7 +1122,7 @@ class CheckInView(APIView):
                 temp_path = f.name
             
             # Get embedding for query
-            query_embedding = service.get_embedding(temp_path)
+            query_embedding = service.get_embedding(temp_path, profile='checkin')
             os.unlink(temp_path)
             
             if query_embedding is None:
@@ -1140,26 +1160,14 @@ class CheckInView(APIView):
                 except Employee.DoesNotExist:
                     pass
             
-            # Fallback to MySQL-based search if ChromaDB fails
+            # Fallback to MySQL-based search if ChromaDB fails:
+            # prototype shortlist, then k-NN vote on the candidates' full embedding sets
             if best_match is None:
-                employees = Employee.objects.filter(organization=org, face_enrolled=True, status='active')
-                best_distance = float('inf')
-                
-                for emp in employees:
-                    for stored in (emp.face_embeddings or []):
-                        stored = np.array(stored)
-                        if len(stored) != len(query_embedding):
-                            continue  # Skip dimension mismatch
-                        distance = 1 - np.dot(query_embedding, stored) / (
-                            np.linalg.norm(query_embedding) * np.linalg.norm(stored)
-                        )
-                        if distance < best_distance:
-                            best_distance = distance
-                            best_match = emp
-                            best_confidence = 1 - distance
-                
-                if best_distance > 0.4:
-                    best_match = None
+                from apps.faces.identification import identify
+                match = identify(org_code, query_embedding, threshold=0.4)
+                if match:
+                    best_match = Employee.objects.filter(pk=match['employee_pk'], status='active').first()
+                    best_confidence = match['confidence']
             
             if best_match is None:
                 return Response({
@@ -1208,6 +1216,7 @@ class CheckOutView(APIView):
     parser_classes = [MultiPartParser]
     permission_classes = [AllowAny]
     
+    @checkin_priority
     def post(self, request):
         org_code = request.data.get('org_code', '').upper().strip()
         image = request.FILES.get('image')
@@ -1229,7 +1238,7 @@ class CheckOutView(APIView):
                     f.write(chunk)
                 temp_path = f.name
             
-            query_embedding = service.get_embedding(temp_path)
+            query_embedding = service.get_embedding(temp_path, profile='checkin')
             os.unlink(temp_path)
             
             if query_embedding is None:
@@ -1262,26 +1271,14 @@ class CheckOutView(APIView):
                 except Employee.DoesNotExist:
                     pass
             
-            # Fallback to MySQL-based search if ChromaDB fails
+            # Fallback to MySQL-based search if ChromaDB fails:
+            # prototype shortlist, then k-NN vote on the candidates' full embedding sets
             if best_match is None:
-                employees = Employee.objects.filter(organization=org, face_enrolled=True, status='active')
-                best_distance = float('inf')
-                
-                for emp in employees:
-                    for stored in (emp.face_embeddings or []):
-                        stored = np.array(stored)
-                        if len(stored) != len(query_embedding):
-                            continue
-                        distance = 1 - np.dot(query_embedding, stored) / (
-                            np.linalg.norm(query_embedding) * np.linalg.norm(stored)
-                        )
-                        if distance < best_distance:
-                            best_distance = distance
-                            best_match = emp
-                            best_confidence = 1 - distance
-                
-                if best_distance > 0.4:
-                    best_match = None
+                from apps.faces.identification import identify
+                match = identify(org_code, query_embedding, threshold=0.4)
+                if match:
+                    best_match = Employee.objects.filter(pk=match['employee_pk'], status='active').first()
+                    best_confidence = match['confidence']
             
             if best_match is None:
                 return Response({'success': False, 'message': 'Face not recognized'}, status=400)
@@ -1631,17 +1628,20 @@ class TrainSingleEmployeeView(APIView):
             if not os.path.exists(images_dir):
                 return Response({'error': 'No images found for this employee'}, status=400)
             
-            deep_embeddings = []
-            for filename in os.listdir(images_dir):
-                if filename.endswith(('.jpg', '.jpeg', '.png')):
-                    img_path = os.path.join(images_dir, filename)
-                    embedding = service.get_embedding(img_path)
-                    if embedding is not None:
-                        deep_embeddings.append(list(embedding))
+            # Only new or changed images are run through the model
+            from apps.faces.embedding_manifest import embed_images
+            deep_embeddings, inference = embed_images(
+                images_dir, lambda path: service.get_embedding(path, profile='training', raise_errors=True)
+            )
             
             if len(deep_embeddings) < 3:
                 return Response({'error': f'Need at least 3 images, found {len(deep_embeddings)}'}, status=400)
             
+            # Keep a bounded, diverse set (consecutive frames are near-duplicates)
+            from apps.faces.embedding_selection import select_diverse_embeddings
+            kept, selection = select_diverse_embeddings(deep_embeddings)
+            deep_embeddings = [deep_embeddings[i] for i in kept]
+            
             # Store in heavy model fields
             emp.heavy_embeddings = deep_embeddings
             emp.heavy_trained = True
@@ -1657,6 +1657,8 @@ class TrainSingleEmployeeView(APIView):
                 'success': True,
                 'message': f'{emp.full_name} trained with Heavy (DeepFace) model!',
                 'embeddings_count': len(deep_embeddings),
+                'selection': selection,
+                'images': inference,
                 'mode': 'heavy'
             })
         else:
@@ -1689,27 +1691,29 @@ class TrainSingleEmployeeView(APIView):
             else:
                 print(f"⚡ Processing all {total_images} images")
             
-            light_embeddings = []
             print(f"\n🧠 Starting InsightFace embedding generation...")
             
-            for idx, filename in enumerate(image_files, 1):
-                img_path = os.path.join(images_dir, filename)
-                print(f"  [{idx}/{len(image_files)}] Processing {filename}...", end=' ')
-                
-                # Use same 512d embeddings from DeepFace for light model too
-                embedding = service.get_embedding(img_path)
-                if embedding is not None:
-                    light_embeddings.append(list(embedding))
-                    print(f"✅ Face detected")
-                else:
-                    print(f"❌ No face")
+            # Use same 512d embeddings from DeepFace for light model too;
+            # images already embedded (capture / previous training) come from the manifest
+            from apps.faces.embedding_manifest import embed_images
+            light_embeddings, inference = embed_images(
+                images_dir, lambda path: service.get_embedding(path, profile='training', raise_errors=True),
+                filenames=image_files
+            )
             
-            print(f"\n✅ Generated {len(light_embeddings)} embeddings from {len(image_files)} images")
+            print(f"\n✅ Generated {len(light_embeddings)} embeddings from {len(image_files)} images "
+                  f"({inference['embedded']} new, {inference['reused']} reused)")
             
             if len(light_embeddings) < 3:
                 print(f"❌ ERROR: Need at least 3 images with faces, found {len(light_embeddings)}")
                 return Response({'error': f'Need at least 3 images with faces, found {len(light_embeddings)}'}, status=400)
             
+            # Keep a bounded, diverse set (consecutive frames are near-duplicates)
+            from apps.faces.embedding_selection import select_diverse_embeddings
+            kept, selection = select_diverse_embeddings(light_embeddings)
+            light_embeddings = [light_embeddings[i] for i in kept]
+            print(f"🧹 Kept {selection['retained']} diverse embeddings, dropped {selection['dropped']}")
+            
             # Store in light model fields
             emp.light_embeddings = light_embeddings
             emp.light_trained = True
@@ -1730,6 +1734,8 @@ class TrainSingleEmployeeView(APIView):
                 'embeddings_count': len(light_embeddings),
                 'total_images': total_images,
                 'processed_images': len(image_files),
+                'selection': selection,
+                'images': inference,
                 'mode': 'light'
             })
 
@@ -1742,10 +1748,16 @@ class GetEmployeeEmbeddingsView(APIView):
     - org_code: Organization code (required)
     - mode: 'light' or 'heavy' - determines which embeddings to return
     - employee_id: Optional - get specific employee
+    - encoding: 'float32' (JSON float lists, default), 'float16' or 'int8'
+      (quantized, base64 - see apps/faces/embedding_payload.py)
+    - raw: 1 for the binary application/octet-stream layout (float16 / int8)
+    - since_version: Optional - only employees changed after this version,
+      plus employee_ids of everyone current (delta sync)
     
     Returns:
     - light mode: 128-d embeddings from light_embeddings (face-api.js compatible)
     - heavy mode: 512-d embeddings from heavy_embeddings (DeepFace)
+    - version + ETag header; If-None-Match with the current ETag returns 304
     """
     permission_classes = [AllowAny]
     
@@ -1792,31 +1804,66 @@ class GetEmployeeEmbeddingsView(APIView):
                 'expected_dimension': expected_dim
             })
         
+        from apps.faces import embedding_payload
+
+        encoding = request.GET.get('encoding', 'float32').lower()
+        raw = request.GET.get('raw', '').lower() in ('1', 'true')
+        since_version = request.GET.get('since_version')
+        if encoding != 'float32' and encoding not in embedding_payload.ENCODINGS:
+            return Response({'error': f"encoding must be float32, {' or '.join(embedding_payload.ENCODINGS)}"}, status=400)
+        if raw and encoding == 'float32':
+            return Response({'error': 'raw requires encoding float16 or int8'}, status=400)
+        try:
+            since_version = int(since_version) if since_version else None
+        except ValueError:
+            return Response({'error': 'since_version must be an integer'}, status=400)
+
         # Get all trained employees for this mode
         filter_kwargs = {
             'organization': org,
             trained_field: True
         }
         employees = Employee.objects.filter(**filter_kwargs)
-        
-        result = []
-        for emp in employees:
-            embeddings = getattr(emp, embeddings_field) or []
-            if embeddings:
-                result.append({
-                    'employee_id': emp.employee_id,
-                    'name': emp.full_name,
-                    'embeddings': embeddings[:5],  # Limit for performance
-                    'embedding_dimension': len(embeddings[0]) if embeddings else 0
-                })
-        
-        return Response({
-            'success': True,
-            'mode': mode,
-            'expected_dimension': expected_dim,
-            'employees': result,
-            'count': len(result)
-        })
+
+        # Nothing is loaded or encoded when the kiosk already has this version
+        version, count = embedding_payload.payload_version(employees)
+        etag = embedding_payload.make_etag(org_code, mode, encoding, raw, version, count, since_version)
+        if embedding_payload.etag_matches(request.headers.get('If-None-Match'), etag):
+            response = HttpResponse(status=304)
+            response['ETag'] = etag
+            return response
+
+        meta = {'success': True, 'mode': mode, 'version': version, 'expected_dimension': expected_dim}
+        if since_version is not None:
+            meta['delta'] = True
+            meta['employee_ids'] = list(employees.values_list('employee_id', flat=True))
+            employees = embedding_payload.changed_since(employees, since_version)
+
+        if encoding == 'float32':
+            result = []
+            for emp in employees:
+                embeddings = getattr(emp, embeddings_field) or []
+                if embeddings:
+                    result.append({
+                        'employee_id': emp.employee_id,
+                        'name': emp.full_name,
+                        'embeddings': embeddings[:5],  # Limit for performance
+                        'embedding_dimension': len(embeddings[0]) if embeddings else 0
+                    })
+            response = Response({**meta, 'employees': result, 'count': len(result)})
+            response['ETag'] = etag
+            return response
+
+        payload = embedding_payload.cached_payload(
+            f"kiosk_embeddings:{etag[1:-1]}",
+            lambda: embedding_payload.build_payload(employees, embeddings_field, expected_dim, encoding, raw, meta)
+        )
+        if raw:
+            response = HttpResponse(payload, content_type='application/octet-stream')
+        else:
+            response = Response(payload)
+        response['ETag'] = etag
+        return response
 
 
 class AutoCheckinView(APIView):
@@ -1954,7 +2001,7 @@ class EmployeeFaceCheckinView(APIView):
             from apps.faces.deepface_service import get_deepface_service
             service = get_deepface_service()
             
-            query_embedding = service.get_embedding(temp_path)
+            query_embedding = service.get_embedding(temp_path, profile='checkin')
             
             if query_embedding is None:
                 return Response({'error': 'No face detected in image'}, status=400)
@@ -2257,6 +2304,8 @@ class DeleteAllEmployeeImagesView(APIView):
                 deleted_count = len([f for f in os.listdir(images_dir) if f.endswith(('.jpg', '.jpeg', '.png'))])
                 # Remove entire directory
                 shutil.rmtree(images_dir)
+            from apps.faces.embedding_manifest import delete_manifest
+            delete_manifest(images_dir)
             
             # Reset employee image count and status
             employee.image_count = 0
@@ -2349,64 +2398,68 @@ class DeleteChromaDBEmbeddingView(APIView):
             return Response({'error': 'Failed to delete embedding'}, status=500)
 class MigrateToInsightFaceView(APIView):
     """
-    Migrate tool: Regenerate embeddings for all employees using new InsightFace engine.
-    This reads images from disk and updates the `face_embeddings` field.
+    Migrate tool: Regenerate embeddings for all employees with the configured
+    InsightFace pack (FACE_ENGINE['MODEL_PACK']).
+    POST queues throttled, resumable background jobs (one per organization,
+    see apps/faces/embedding_versions.py); search keeps using the current
+    embeddings until every organization is re-embedded. GET reports progress.
     """
     permission_classes = [AllowAny]
-    
+
+    @staticmethod
+    def _job_data(job):
+        return {
+            'id': str(job.id),
+            'org_code': job.organization.org_code,
+            'source_model': job.source_model.version_tag if job.source_model else None,
+            'target_model': job.target_model.version_tag,
+            'status': job.status,
+            'processed': job.processed,
+            'total': job.total,
+            'skipped': job.skipped,
+            'error': job.error,
+        }
+
+    def get(self, request):
+        from apps.ml_models.models import ReembeddingJob
+        from apps.faces.embedding_versions import serving_tag, target_version
+
+        target = target_version()
+        jobs = ReembeddingJob.objects.filter(target_model=target).select_related(
+            'organization', 'source_model', 'target_model'
+        )
+        org_code = request.query_params.get('org_code')
+        if org_code:
+            jobs = jobs.filter(organization__org_code=org_code)
+
+        return Response({
+            'success': True,
+            'serving_model': serving_tag(),
+            'target_model': target.version_tag,
+            'jobs': [self._job_data(job) for job in jobs]
+        })
+
     def post(self, request):
-        from apps.faces.deepface_service import get_deepface_service
-        from django.conf import settings
-        import os
-        
-        service = get_deepface_service()
-        employees = Employee.objects.filter(is_active=True)
-        results = []
-        success_count = 0
-        
-        for employee in employees:
+        from apps.faces.embedding_versions import start_reembedding, serving_tag
+
+        org = None
+        org_code = request.data.get('org_code')
+        if org_code:
             try:
-                org_code = employee.organization.org_code
-                employee_id = employee.employee_id
-                
-                # Path: media/employee_faces/{org_code}/{employee_id}
-                images_dir = os.path.join(settings.MEDIA_ROOT, 'employee_faces', org_code, employee_id)
-                
-                if not os.path.exists(images_dir):
-                    results.append(f"⚠️ {employee.full_name}: No images found at {images_dir}")
-                    continue
-                    
-                images = [os.path.join(images_dir, f) for f in os.listdir(images_dir) 
-                         if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-                
-                if not images:
-                    results.append(f"⚠️ {employee.full_name}: Empty image directory")
-                    continue
-                
-                # Regenerate
-                try:
-                    res = service.train_person(employee_id, employee.full_name, images)
-                    
-                    # Update Employee Model
-                    employee.face_embeddings = res['active_embeddings']
-                    employee.embeddings_count = res['active_count']
-                    # Clear heavy embeddings to force use of new light ones
-                    employee.heavy_embeddings = [] 
-                    employee.face_enrolled = True
-                    employee.save()
-                    
-                    success_count += 1
-                    results.append(f"✅ {employee.full_name}: Regenerated {res['active_count']} embeddings.")
-                    
-                except Exception as e:
-                    results.append(f"❌ {employee.full_name}: Training failed - {str(e)}")
-                    
-            except Exception as e:
-                results.append(f"❌ Error processing {employee.employee_id}: {e}")
-        
+                org = Organization.objects.get(org_code=org_code)
+            except Organization.DoesNotExist:
+                return Response({'success': False, 'error': 'Organization not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        jobs = start_reembedding(org)
+        if not jobs:
+            return Response({
+                'success': True,
+                'message': f"Already on {serving_tag()}, nothing to re-embed",
+                'jobs': []
+            })
+
         return Response({
             'success': True,
-            'processed': len(employees),
-            'migrated': success_count,
-            'details': results
-        })
+            'message': f"Re-embedding queued for {len(jobs)} organizations",
+            'jobs': [self._job_data(job) for job in jobs]
+        }, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,96 @@
+"""
+Lazy Annotated Images
+Vehicle checks store the original photo + packed detection boxes. The
+annotated JPEG is only drawn when someone actually looks at it, then cached
+on VehicleComplianceRecord.annotated_image.
+"""
+import zlib
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# BGR palette; a class always gets the same colour (crc32, not the salted str hash)
+PALETTE = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+    (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+    (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+    (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255),
+]
+JPEG_QUALITY = 85
+
+
+def class_color(class_name):
+    return PALETTE[zlib.crc32(class_name.encode('utf-8')) % len(PALETTE)]
+
+
+def draw_boxes(img, boxes):
+    """
+    Draw boxes with class labels (no confidence, like results.plot(conf=False)).
+
+    Args:
+        img: BGR image (modified in place)
+        boxes: [{'class': str, 'bbox': [x1, y1, x2, y2], ...}] in image pixels
+    """
+    thickness = max(round(sum(img.shape[:2]) / 2 * 0.003), 2)
+    font_scale = thickness / 3
+    for box in boxes:
+        x1, y1, x2, y2 = [int(round(v)) for v in box['bbox'][:4]]
+        color = class_color(box['class'])
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, thickness, cv2.LINE_AA)
+
+        label = box['class']
+        (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, max(thickness - 1, 1))
+        outside = y1 - th - 3 >= 0
+        ty = y1 - th - 3 if outside else y1 + th + 3
+        cv2.rectangle(img, (x1, y1), (x1 + tw, ty), color, -1, cv2.LINE_AA)
+        cv2.putText(
+            img, label, (x1, y1 - 2 if outside else y1 + th + 2),
+            cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), max(thickness - 1, 1), cv2.LINE_AA
+        )
+    return img
+
+
+def render_annotated_jpeg(image_path, box_set, classes=None):
+    """
+    Original image + stored BoxSet -> annotated JPEG bytes (None if the image can't be read).
+
+    Args:
+        classes: Only draw these classes (None = all)
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    draw_boxes(img, box_set.to_dicts(image_size=(w, h), classes=classes))
+    success, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return encoded.tobytes() if success else None
+
+
+def get_annotated_image(record):
+    """
+    Annotated image file for a VehicleComplianceRecord, rendered and cached
+    on first request. Falls back to the stored image (older records stored
+    the annotated render directly, without boxes).
+    """
+    from django.core.files.base import ContentFile
+    from .box_store import BoxSet
+
+    if record.annotated_image:
+        return record.annotated_image
+    box_set = BoxSet.from_record(record)
+    if not len(box_set) or not record.vehicle_image:
+        return record.vehicle_image
+
+    try:
+        # Draw what the compliance check counted (required classes), not every stored box
+        content = render_annotated_jpeg(record.vehicle_image.path, box_set, classes=list(record.detections or {}))
+    except Exception as e:
+        logger.error(f"Annotated render failed for {record.id}: {e}")
+        content = None
+    if content is None:
+        return record.vehicle_image
+
+    record.annotated_image.save(f'{record.id}.jpg', ContentFile(content), save=False)
+    record.save(update_fields=['annotated_image'])
+    return record.annotated_image
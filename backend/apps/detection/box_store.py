@@ -0,0 +1,126 @@
+"""
+Compact Detection Box Storage
+Per-box YOLO output kept on VehicleComplianceRecord, so compliance can be
+re-evaluated later from the database instead of re-running the model.
+
+box_data layout (little-endian, 12 bytes per box):
+    class    uint16   index into the record's box_classes list
+    conf     float16
+    xyxy     4 x float16, normalized to image width/height (0..1)
+
+float16 resolves ~0.0005 near 1.0 - about half a pixel on a 1000 px photo.
+"""
+import numpy as np
+
+BOX_DTYPE = np.dtype([
+    ('cls', '<u2'),
+    ('conf', '<f2'),
+    ('xyxy', '<f2', (4,)),
+])
+
+
+class BoxSet:
+    """Boxes of one image: structured array + the class names it indexes."""
+
+    def __init__(self, array=None, classes=None):
+        self.array = array if array is not None else np.zeros(0, dtype=BOX_DTYPE)
+        self.classes = list(classes or [])
+
+    def __len__(self):
+        return len(self.array)
+
+    @classmethod
+    def from_results(cls, results):
+        """Ultralytics Results list -> BoxSet (uses the normalized xyxyn tensors)."""
+        cls_ids, confs, xyxyn, names = [], [], [], {}
+        for r in results or []:
+            if r.boxes is None or len(r.boxes) == 0:
+                continue
+            names = r.names
+            cls_ids.append(r.boxes.cls.cpu().numpy().astype(np.int64))
+            confs.append(r.boxes.conf.cpu().numpy())
+            xyxyn.append(r.boxes.xyxyn.cpu().numpy())
+        if not cls_ids:
+            return cls()
+
+        cls_ids = np.concatenate(cls_ids)
+        # Model class ids -> compact per-record vocabulary
+        used = np.unique(cls_ids)
+        array = np.empty(len(cls_ids), dtype=BOX_DTYPE)
+        array['cls'] = np.searchsorted(used, cls_ids)
+        array['conf'] = np.concatenate(confs)
+        array['xyxy'] = np.clip(np.concatenate(xyxyn), 0, 1)
+        return cls(array, [names[int(i)] for i in used])
+
+    @classmethod
+    def from_dicts(cls, boxes, image_size=None):
+        """
+        [{'class', 'confidence', 'bbox'}] -> BoxSet.
+
+        Args:
+            image_size: (width, height) when bbox is in pixels; omit if already normalized
+        """
+        classes = sorted({box['class'] for box in boxes})
+        index = {name: i for i, name in enumerate(classes)}
+        array = np.empty(len(boxes), dtype=BOX_DTYPE)
+        for i, box in enumerate(boxes):
+            array[i] = (index[box['class']], box['confidence'], box['bbox'][:4])
+        if image_size and len(array):
+            w, h = image_size
+            array['xyxy'] = np.clip(array['xyxy'].astype(np.float32) / [w, h, w, h], 0, 1)
+        return cls(array, classes)
+
+    @classmethod
+    def from_bytes(cls, data, classes):
+        if not data:
+            return cls()
+        return cls(np.frombuffer(bytes(data), dtype=BOX_DTYPE), classes)
+
+    @classmethod
+    def from_record(cls, record):
+        """BoxSet stored on a VehicleComplianceRecord."""
+        return cls.from_bytes(record.box_data, record.box_classes)
+
+    def to_bytes(self):
+        return self.array.tobytes()
+
+    def _mask(self, min_confidence=0.0, classes=None):
+        mask = self.array['conf'] >= min_confidence
+        if classes is not None:
+            wanted = {c.lower().strip() for c in classes}
+            keep = np.array([name.lower().strip() in wanted for name in self.classes] or [False])
+            mask &= keep[self.array['cls']]
+        return mask
+
+    def counts(self, min_confidence=0.0, classes=None):
+        """
+        {class_name: count} - the same shape VehicleComplianceRecord.detections holds.
+
+        Args:
+            min_confidence: Ignore boxes below this confidence
+            classes: Optional class names to count (case-insensitive)
+        """
+        if not len(self.array):
+            return {}
+        ids = self.array['cls'][self._mask(min_confidence, classes)]
+        totals = np.bincount(ids, minlength=len(self.classes))
+        return {self.classes[i]: int(n) for i, n in enumerate(totals) if n}
+
+    def to_dicts(self, image_size=None, classes=None):
+        """
+        [{'class', 'confidence', 'bbox'}], bbox normalized or in pixels if image_size=(w, h).
+        """
+        rows = self.array[self._mask(classes=classes)] if len(self.array) else self.array
+        xyxy = rows['xyxy'].astype(np.float32)
+        if image_size:
+            w, h = image_size
+            xyxy = xyxy * [w, h, w, h]
+        digits = 1 if image_size else 4
+        return [
+            {
+                'class': self.classes[int(c)],
+                'confidence': round(float(conf), 3),
+                'bbox': [round(float(v), digits) for v in box],
+            }
+            for c, conf, box in zip(rows['cls'], rows['conf'], xyxy)
+        ]
@@ -0,0 +1,252 @@
+"""
+Bulk Compliance Re-evaluation
+Re-runs an org's active YOLO model over stored vehicle images after a
+requirement change or a new model upload, and rewrites
+VehicleComplianceRecord.detections / compliance_details in bulk.
+
+- Records are streamed from the database (iterator), images decoded one at
+  a time and shrunk to MAX_DECODE_SIDE before batching -> memory is bounded
+  by batch_size small frames, not by the number of records
+- YOLO runs batch_size images per forward pass (YoloDetectionService.detect_batch)
+- Writes are bulk_update()s per batch; Trip compliance flags follow
+- A batch whose inference fails is counted (failed / failed_batches) and
+  left unchanged; the job carries on with the next batch (the model is
+  reloaded first, so a broken exported runtime falls back to the .pt)
+- Stored boxes are rewritten too and stale annotated renders dropped
+
+reevaluate_from_stored_boxes() covers pure requirement/rule changes: it only
+re-scores the packed boxes already on each record (no inference).
+"""
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 8
+MAX_DECODE_SIDE = 1280  # Well above YOLO's 640 input, far below 12 MP phone photos
+
+
+def load_image(path, max_side=MAX_DECODE_SIDE):
+    """Decode an image and downscale it so the full-size buffer is freed right away."""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _iter_batches(records, batch_size):
+    """Group streamed records with a decodable image into (records, images) batches."""
+    batch_records, batch_images = [], []
+    for record in records:
+        try:
+            img = load_image(record.vehicle_image.path)
+        except Exception:
+            img = None
+        if img is None:
+            continue
+        batch_records.append(record)
+        batch_images.append(img)
+        if len(batch_records) == batch_size:
+            yield batch_records, batch_images
+            batch_records, batch_images = [], []
+    if batch_records:
+        yield batch_records, batch_images
+
+
+def _filter_records(org, since, until):
+    from core.models import VehicleComplianceRecord
+
+    records = VehicleComplianceRecord.objects.filter(organization=org)
+    if since:
+        records = records.filter(timestamp__gte=since)
+    if until:
+        records = records.filter(timestamp__lte=until)
+    return records
+
+
+def _apply_result(record, detections, compliance, stats):
+    """Set the new result on a record and tally pass/fail flips."""
+    if compliance['passed'] != record.compliance_passed:
+        stats['changed'] += 1
+        stats['now_passing' if compliance['passed'] else 'now_failing'] += 1
+    record.detections = detections
+    record.compliance_passed = compliance['passed']
+    record.compliance_details = compliance
+
+
+def reevaluate_vehicle_compliance(org, since=None, until=None, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    Re-run detection + compliance for an org's vehicle records.
+
+    Args:
+        org: Organization
+        since / until: Optional datetime bounds on record timestamp
+        batch_size: Images per YOLO forward pass (and per bulk write)
+        dry_run: Compute and report changes without writing
+
+    Returns:
+        {'success', 'processed', 'skipped', 'failed', 'failed_batches', 'changed', 'now_passing', 'now_failing', ...}
+    """
+    from core.models import CustomYoloModel, VehicleComplianceRecord, Trip
+    from .yolo_service import get_yolo_service, YOLO_AVAILABLE
+    from .detection_profile import get_detection_profile
+    from .compliance_rules import check_full_compliance
+    from .box_store import BoxSet
+
+    yolo_model = CustomYoloModel.objects.filter(organization=org, is_active=True).first()
+    if not yolo_model:
+        return {'success': False, 'error': 'No YOLO model configured'}
+    if not YOLO_AVAILABLE:
+        return {'success': False, 'error': 'YOLO not available'}
+
+    service = get_yolo_service()
+    model_id = str(yolo_model.id)
+    if not service.load_custom_model(yolo_model):
+        return {'success': False, 'error': 'YOLO model could not be loaded'}
+
+    profile = get_detection_profile(yolo_model)
+
+    records = _filter_records(org, since, until).exclude(vehicle_image='')
+    total = records.count()
+    records = records.only('id', 'vehicle_image', 'annotated_image', 'compliance_passed').order_by('timestamp')
+
+    stats = {'processed': 0, 'failed': 0, 'failed_batches': 0, 'changed': 0, 'now_passing': 0, 'now_failing': 0}
+    errors = []
+    logger.info(f"🔁 Re-evaluating {total} vehicle records for {org.org_code} (batch {batch_size})")
+
+    for batch_records, batch_images in _iter_batches(records.iterator(chunk_size=batch_size * 4), batch_size):
+        # All classes, like the live check: the stored boxes must cover future rule changes
+        try:
+            if not service.load_custom_model(yolo_model):
+                raise RuntimeError('YOLO model could not be loaded')
+            results = list(service.detect_batch(batch_images, model_id, batch_size=batch_size))
+            if len(results) != len(batch_records):
+                raise RuntimeError(f'{len(results)} results for {len(batch_records)} images')
+        except Exception as e:
+            logger.error(f"❌ Re-evaluation batch failed for {org.org_code}: {e}")
+            stats['failed'] += len(batch_records)
+            stats['failed_batches'] += 1
+            if len(errors) < 5:
+                errors.append(str(e))
+            continue
+
+        updated = []
+        for record, img, boxes in zip(batch_records, batch_images, results):
+            h, w = img.shape[:2]
+            box_set = BoxSet.from_dicts(boxes, image_size=(w, h))
+            detections = box_set.counts(classes=profile.counted_lower)
+            _apply_result(record, detections, check_full_compliance(box_set, profile=profile), stats)
+
+            record.yolo_model = yolo_model
+            record.box_data = box_set.to_bytes()
+            record.box_classes = box_set.classes
+            if record.annotated_image and not dry_run:
+                record.annotated_image.delete(save=False)  # Re-rendered from the new boxes on demand
+            updated.append(record)
+        stats['processed'] += len(updated)
+
+        if updated and not dry_run:
+            # bulk_update skips the per-record pre_save image-cleanup query
+            VehicleComplianceRecord.objects.bulk_update(
+                updated, [
+                    'yolo_model', 'detections', 'compliance_passed', 'compliance_details',
+                    'box_data', 'box_classes', 'annotated_image',
+                ]
+            )
+            _sync_trip_flags(Trip, updated)
+
+    stats['skipped'] = total - stats['processed'] - stats['failed']
+    logger.info(f"✅ Re-evaluation done for {org.org_code}: {stats}")
+    result = {'success': True, 'total': total, 'model_id': model_id, 'dry_run': dry_run, **stats}
+    if errors:
+        result['errors'] = errors
+    return result
+
+
+def reevaluate_from_stored_boxes(org, since=None, until=None, dry_run=False, chunk_size=500):
+    """
+    Re-apply the active model's current rules to the boxes stored on each
+    record - no images, no inference. Each chunk is scored in one vectorized
+    pass (CompiledRules.evaluate_many), fast enough to run inline.
+    Records stored by another model (or before boxes were kept) are skipped.
+
+    Returns:
+        Same shape as reevaluate_vehicle_compliance()
+    """
+    from core.models import CustomYoloModel, VehicleComplianceRecord, Trip
+    from .detection_profile import get_detection_profile
+    from .box_store import BoxSet
+
+    yolo_model = CustomYoloModel.objects.filter(organization=org, is_active=True).first()
+    if not yolo_model:
+        return {'success': False, 'error': 'No YOLO model configured'}
+    profile = get_detection_profile(yolo_model)
+
+    records = _filter_records(org, since, until)
+    total = records.count()
+    records = records.filter(yolo_model=yolo_model, box_data__isnull=False).only(
+        'id', 'box_data', 'box_classes', 'annotated_image', 'compliance_passed'
+    ).order_by('timestamp')
+
+    stats = {'processed': 0, 'failed': 0, 'failed_batches': 0, 'changed': 0, 'now_passing': 0, 'now_failing': 0}
+    errors = []
+
+    def flush(chunk):
+        if not chunk:
+            return
+        box_sets = [BoxSet.from_record(record) for record in chunk]
+        _, checks = profile.rules.evaluate_many(box_sets)
+        for record, box_set, check_row in zip(chunk, box_sets, checks):
+            detections = box_set.counts(classes=profile.counted_lower)
+            _apply_result(record, detections, profile.rules.result(check_row.tolist()), stats)
+            if record.annotated_image and not dry_run:
+                record.annotated_image.delete(save=False)  # Drawn classes follow the rules
+        stats['processed'] += len(chunk)
+        _write_stored_results(VehicleComplianceRecord, Trip, chunk, dry_run)
+
+    chunk = []
+    for record in records.iterator(chunk_size=chunk_size):
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+
+    stats['skipped'] = total - stats['processed']
+    logger.info(f"✅ Stored-box re-evaluation done for {org.org_code}: {stats}")
+    return {'success': True, 'total': total, 'model_id': str(yolo_model.id), 'dry_run': dry_run, **stats}
+
+
+def _write_stored_results(VehicleComplianceRecord, Trip, records, dry_run):
+    if not records or dry_run:
+        return
+    VehicleComplianceRecord.objects.bulk_update(
+        records, ['detections', 'compliance_passed', 'compliance_details', 'annotated_image']
+    )
+    _sync_trip_flags(Trip, records)
+
+
+def _sync_trip_flags(Trip, records):
+    """Keep Trip.checkin/checkout_compliance_passed in line with their vehicle records."""
+    from django.db.models import Q
+
+    passed = {r.id: r.compliance_passed for r in records}
+    trips = list(
+        Trip.objects.filter(
+            Q(checkin_vehicle_id__in=passed.keys()) | Q(checkout_vehicle_id__in=passed.keys())
+        ).only(
+            'id', 'checkin_vehicle', 'checkout_vehicle',
+            'checkin_compliance_passed', 'checkout_compliance_passed'
+        )
+    )
+    for trip in trips:
+        if trip.checkin_vehicle_id in passed:
+            trip.checkin_compliance_passed = passed[trip.checkin_vehicle_id]
+        if trip.checkout_vehicle_id in passed:
+            trip.checkout_compliance_passed = passed[trip.checkout_vehicle_id]
+    if trips:
+        Trip.objects.bulk_update(trips, ['checkin_compliance_passed', 'checkout_compliance_passed'])
@@ -1,26 +1,319 @@
 """
 Dynamic Compliance Rules Engine
-Checks if detected classes match what user marked as required in database.
+Checks detections against a model's compliance rules.
+
+Rules are declarative JSON, stored per CustomYoloModel (compliance_rules).
+Without stored rules they are derived from the classes the user marked as
+required in the database, plus the built-in OR groups:
+
+    {"all": [
+        {"class": "Helmet", "min_count": 1, "min_confidence": 0.6},
+        {"any": [{"class": "Number Plate"}, {"class": "Painted Number Plate"}], "label": "Number Plate"},
+        {"not": {"class": "Broken Light"}, "label": "No broken light"}
+    ]}
+
+- Leaf: {"class", "min_count" (default 1), "min_confidence" (default 0, stored boxes only)}
+- Groups: "all" / "any" (lists), "not" (one rule); optional "label" for results
+- Each child of the top-level "all" is one line in missing/detected
+
+compile_rules() turns a spec into CompiledRules once (cached on the
+DetectionProfile): class names are normalized at compile time, leaves become
+bits, and a record is checked with a couple of integer mask tests.
+evaluate_many() scores a whole list of records with numpy column operations.
 
 Special Rules:
 - Number Plate: Either "Number Plate" OR "Painted Number Plate" satisfies the requirement
+  (see OR_GROUPS)
 """
 import logging
+from functools import lru_cache
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 # Special OR groups - if ANY of these are detected, the requirement is satisfied
 NUMBER_PLATE_ALTERNATIVES = ['number plate', 'painted number plate']
 
+# Label shown in results -> lowercase alternatives
+OR_GROUPS = {
+    'Number Plate': NUMBER_PLATE_ALTERNATIVES,
+}
+
+GROUP_KEYS = ('all', 'any', 'not')
 
-def check_compliance_dynamic(detections: dict, required_classes: list) -> dict:
+
+def _norm(name):
+    return str(name).lower().strip()
+
+
+def default_rules(required_classes, or_groups=None):
+    """
+    Rule spec equivalent to "every required class, OR groups satisfied by any alternative".
+    """
+    if or_groups is None:
+        or_groups = OR_GROUPS
+    group_of = {alt: label for label, alts in or_groups.items() for alt in alts}
+
+    children, seen_groups = [], set()
+    for req_class in required_classes:
+        label = group_of.get(_norm(req_class))
+        if label is None:
+            children.append({'class': req_class})
+        elif label not in seen_groups:
+            seen_groups.add(label)
+            children.append({'any': [{'class': alt} for alt in or_groups[label]], 'label': label})
+    return {'all': children}
+
+
+class CompiledRules:
+    """
+    A compiled rule tree.
+
+    Leaves are (class, min_count, min_confidence) predicates numbered 0..n-1;
+    a record is reduced to an int with bit i set when leaf i holds, and the
+    tree is evaluated against that mask.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.leaves = []  # [(class_lower, min_count, min_confidence)]
+        self._leaf_index = {}
+        root = self._compile(spec)
+
+        # Top-level "all" children are reported individually
+        if root[0] == 'all':
+            self.checks = [(self._label(child), node) for child, node in zip(spec['all'], root[1])]
+        else:
+            self.checks = [(self._label(spec), root)]
+        self._check_fns = [self._bitmask_fn(node) for _, node in self.checks]
+
+        self.classes = frozenset(leaf[0] for leaf in self.leaves)
+        self.uses_confidence = any(leaf[2] > 0 for leaf in self.leaves)
+
+    # --- Compilation ---
+
+    def _compile(self, rule):
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule must be an object, got {rule!r}")
+        if 'class' in rule:
+            leaf = (
+                _norm(rule['class']),
+                int(rule.get('min_count', 1)),
+                float(rule.get('min_confidence', 0.0)),
+            )
+            if leaf[1] < 0 or not 0 <= leaf[2] <= 1:
+                raise ValueError(f"Invalid min_count/min_confidence in {rule!r}")
+            if leaf not in self._leaf_index:
+                self._leaf_index[leaf] = len(self.leaves)
+                self.leaves.append(leaf)
+            return ('leaf', self._leaf_index[leaf])
+
+        keys = [k for k in GROUP_KEYS if k in rule]
+        if len(keys) != 1:
+            raise ValueError(f"Rule needs exactly one of 'class', 'all', 'any', 'not': {rule!r}")
+        op = keys[0]
+        if op == 'not':
+            return ('not', self._compile(rule['not']))
+        if not isinstance(rule[op], list):
+            raise ValueError(f"'{op}' must be a list: {rule!r}")
+        return (op, [self._compile(child) for child in rule[op]])
+
+    def _label(self, rule):
+        if 'label' in rule:
+            return rule['label']
+        if 'class' in rule:
+            return rule['class']
+        if 'not' in rule:
+            return f"No {self._label(rule['not'])}"
+        op = rule['all'] if 'all' in rule else rule['any']
+        joiner = ' and ' if 'all' in rule else ' or '
+        return joiner.join(self._label(child) for child in op)
+
+    def _bitmask_fn(self, node):
+        """Node -> fn(mask) -> bool. Direct leaf children of a group collapse into one mask test."""
+        kind = node[0]
+        if kind == 'leaf':
+            bit = 1 << node[1]
+            return lambda mask: (mask & bit) != 0
+        if kind == 'not':
+            inner = self._bitmask_fn(node[1])
+            return lambda mask: not inner(mask)
+
+        leaf_bits = 0
+        others = []
+        for child in node[1]:
+            if child[0] == 'leaf':
+                leaf_bits |= 1 << child[1]
+            else:
+                others.append(self._bitmask_fn(child))
+        if kind == 'all':
+            return lambda mask: (mask & leaf_bits) == leaf_bits and all(fn(mask) for fn in others)
+        return lambda mask: (mask & leaf_bits) != 0 or any(fn(mask) for fn in others)
+
+    # --- Leaf evaluation ---
+
+    def leaf_mask(self, detections):
+        """
+        Bitmask of satisfied leaves for one record.
+
+        Args:
+            detections: {class_name: count} (confidence thresholds already applied
+                by the detector) or a stored BoxSet (thresholds applied here)
+        """
+        if hasattr(detections, 'array'):
+            return self._leaf_mask_boxes(detections)
+        counts = {_norm(k): v for k, v in detections.items()} if detections else {}
+        mask = 0
+        for i, (name, min_count, _) in enumerate(self.leaves):
+            if counts.get(name, 0) >= min_count:
+                mask |= 1 << i
+        return mask
+
+    def _leaf_mask_boxes(self, box_set):
+        array = box_set.array
+        local = {_norm(name): i for i, name in enumerate(box_set.classes)}
+        mask = 0
+        for i, (name, min_count, min_conf) in enumerate(self.leaves):
+            cls_id = local.get(name)
+            if cls_id is None:
+                hits = 0
+            else:
+                hits = np.count_nonzero((array['cls'] == cls_id) & (array['conf'] >= min_conf))
+            if hits >= min_count:
+                mask |= 1 << i
+        return mask
+
+    def leaf_matrix(self, records):
+        """
+        (N, leaves) bool matrix for many records at once (BoxSets or count dicts).
+        Box sets are concatenated and counted with one bincount per leaf.
+        """
+        n = len(records)
+        matrix = np.zeros((n, len(self.leaves)), dtype=bool)
+        class_slot = {name: i for i, name in enumerate(sorted(self.classes))}
+
+        is_boxes = np.zeros(n, dtype=bool)
+        # Seeded with empty arrays so concatenate works when every box set is empty
+        box_rows = [np.zeros(0, dtype=np.int64)]
+        box_cls = [np.zeros(0, dtype=np.int64)]
+        box_conf = [np.zeros(0, dtype=np.float32)]
+        for row, record in enumerate(records):
+            if hasattr(record, 'array'):
+                is_boxes[row] = True
+                if not len(record):
+                    continue
+                # Record vocabulary -> slot of that class in this rule set (-1: unused)
+                remap = np.array([class_slot.get(_norm(c), -1) for c in record.classes], dtype=np.int64)
+                box_rows.append(np.full(len(record), row, dtype=np.int64))
+                box_cls.append(remap[record.array['cls']])
+                box_conf.append(record.array['conf'].astype(np.float32))
+            else:
+                counts = {_norm(k): v for k, v in (record or {}).items()}
+                for j, (name, min_count, _) in enumerate(self.leaves):
+                    matrix[row, j] = counts.get(name, 0) >= min_count
+
+        if is_boxes.any():
+            rows = np.concatenate(box_rows)
+            cls = np.concatenate(box_cls)
+            conf = np.concatenate(box_conf)
+            for j, (name, min_count, min_conf) in enumerate(self.leaves):
+                hit = (cls == class_slot[name]) & (conf >= min_conf)
+                totals = np.bincount(rows[hit], minlength=n)
+                matrix[is_boxes, j] = totals[is_boxes] >= min_count
+        return matrix
+
+    def _node_np(self, node, matrix):
+        kind = node[0]
+        if kind == 'leaf':
+            return matrix[:, node[1]]
+        if kind == 'not':
+            return ~self._node_np(node[1], matrix)
+        parts = [self._node_np(child, matrix) for child in node[1]]
+        if not parts:
+            return np.full(len(matrix), kind == 'all')
+        stacked = np.stack(parts, axis=1)
+        return stacked.all(axis=1) if kind == 'all' else stacked.any(axis=1)
+
+    # --- Evaluation ---
+
+    def check_results(self, detections):
+        """[bool] per top-level check for one record."""
+        mask = self.leaf_mask(detections)
+        return [fn(mask) for fn in self._check_fns]
+
+    def evaluate(self, detections):
+        """Full compliance result dict for one record."""
+        return self.result(self.check_results(detections))
+
+    def evaluate_many(self, records):
+        """
+        Vectorized scoring for bulk re-evaluation / dashboards.
+
+        Returns:
+            (passed: (N,) bool array, checks: (N, len(self.checks)) bool array)
+        """
+        matrix = self.leaf_matrix(records)
+        if not self.checks:
+            return np.ones(len(records), dtype=bool), np.zeros((len(records), 0), dtype=bool)
+        checks = np.stack([self._node_np(node, matrix) for _, node in self.checks], axis=1)
+        return checks.all(axis=1), checks
+
+    def result(self, check_row):
+        """Per-check booleans -> the compliance dict stored in compliance_details."""
+        result = {
+            'passed': True,
+            'checks': {},
+            'summary': '',
+            'failed_reasons': []
+        }
+
+        if not self.checks:
+            result['summary'] = "✅ No requirements configured"
+            return result
+
+        detected = [label for (label, _), ok in zip(self.checks, check_row) if ok]
+        missing = [label for (label, _), ok in zip(self.checks, check_row) if not ok]
+
+        result['checks']['required'] = {
+            'passed': len(missing) == 0,
+            'missing': missing,
+            'detected': detected
+        }
+
+        if missing:
+            result['passed'] = False
+            result['failed_reasons'].append(f"Missing: {', '.join(missing)}")
+
+        # Generate Summary
+        if result['passed']:
+            result['summary'] = "✅ All compliance checks passed"
+        else:
+            result['summary'] = "❌ " + "; ".join(result['failed_reasons'])
+        return result
+
+
+def compile_rules(spec):
+    """Validate + compile a rule spec. Raises ValueError on a malformed spec."""
+    return CompiledRules(spec)
+
+
+@lru_cache(maxsize=256)
+def _compiled_default(required_classes: tuple, or_groups: tuple):
+    return compile_rules(default_rules(required_classes, {label: list(alts) for label, alts in or_groups}))
+
+
+def check_compliance_dynamic(detections, required_classes: list, or_groups: dict = None,
+                             min_confidence: float = 0.0) -> dict:
     """
     Check if all required classes are detected.
-    
+
     Args:
-        detections: dict of {class_name: count} from YOLO detection
+        detections: dict of {class_name: count} from YOLO detection, or a stored
+            BoxSet (apps/detection/box_store.py) - counted here, no inference
         required_classes: list of class names that must be detected
-    
+        or_groups: Optional {label: [alternatives]} (defaults to OR_GROUPS)
+        min_confidence: Ignore stored boxes below this confidence (BoxSet only)
+
     Returns:
         {
             'passed': bool,
@@ -28,99 +321,43 @@ def check_compliance_dynamic(detections: dict, required_classes: list) -> dict:
             'summary': str
         }
     """
-    result = {
-        'passed': True,
-        'checks': {},
-        'summary': '',
-        'failed_reasons': []
-    }
-    
-    if not required_classes:
-        result['summary'] = "✅ No requirements configured"
-        return result
-    
-    # Normalize detection keys to lowercase
-    detected_lower = {k.lower().strip(): v for k, v in detections.items()}
-    
-    missing = []
-    detected = []
-    
-    # Check if any number plate alternative is in required classes
-    number_plate_required = any(
-        rc.lower().strip() in NUMBER_PLATE_ALTERNATIVES 
-        for rc in required_classes
+    if or_groups is None:
+        or_groups = OR_GROUPS
+    if hasattr(detections, 'counts'):
+        detections = detections.counts(min_confidence)
+
+    rules = _compiled_default(
+        tuple(required_classes or ()),
+        tuple((label, tuple(alts)) for label, alts in or_groups.items())
     )
-    number_plate_found = False
-    
-    for req_class in required_classes:
-        req_lower = req_class.lower().strip()
-        
-        # Special handling for Number Plate alternatives
-        if req_lower in NUMBER_PLATE_ALTERNATIVES:
-            # Check if ANY number plate type was detected
-            if not number_plate_found:  # Only check once
-                for alt in NUMBER_PLATE_ALTERNATIVES:
-                    if detected_lower.get(alt):
-                        number_plate_found = True
-                        detected.append("Number Plate")
-                        break
-                if not number_plate_found:
-                    missing.append("Number Plate")
-            continue
-        
-        # Normal class check
-        if detected_lower.get(req_lower):
-            detected.append(req_class)
-        else:
-            missing.append(req_class)
-    
-    result['checks']['required'] = {
-        'passed': len(missing) == 0,
-        'missing': missing,
-        'detected': detected
-    }
-    
-    if missing:
-        result['passed'] = False
-        result['failed_reasons'].append(f"Missing: {', '.join(missing)}")
-    
-    # Generate Summary
-    if result['passed']:
-        result['summary'] = "✅ All compliance checks passed"
-    else:
-        result['summary'] = "❌ " + "; ".join(result['failed_reasons'])
-    
-    logger.info(f"Compliance check: {result['summary']}")
-    
+    result = rules.evaluate(detections)
+    logger.debug(f"Compliance check: {result['summary']}")
     return result
 
 
-def check_full_compliance(detections: dict, yolo_model=None) -> dict:
+def check_full_compliance(detections, yolo_model=None, profile=None) -> dict:
     """
-    Run compliance check using database requirements.
-    
+    Run compliance check using the model's compiled rules.
+
     Args:
-        detections: dict of {class_name: count} from YOLO detection
+        detections: dict of {class_name: count} from YOLO detection, or a stored BoxSet
+            (per-class min_confidence rules only apply to box sets)
         yolo_model: Optional CustomYoloModel instance to get requirements from
-    
+        profile: Optional DetectionProfile already fetched for yolo_model
+
     Returns compliance result dict
     """
-    from core.models import DetectionRequirement
-    
-    # Get required classes from database
-    required_classes = []
-    if yolo_model:
-        required_classes = list(
-            DetectionRequirement.objects.filter(
-                yolo_model=yolo_model,
-                is_required=True
-            ).values_list('class_name', flat=True)
-        )
-    
-    logger.info(f"Required classes from DB: {required_classes}")
-    logger.info(f"Detections: {detections}")
-    
-    return check_compliance_dynamic(detections, required_classes)
+    # Compiled rules come from the cached detection profile (no per-call query/compile)
+    if profile is None and yolo_model:
+        from .detection_profile import get_detection_profile
+        profile = get_detection_profile(yolo_model)
+
+    if profile is None:
+        return check_compliance_dynamic(detections, [])
+
+    result = profile.rules.evaluate(detections)
+    logger.debug(f"Compliance check ({profile.model_id}): {result['summary']}")
+    return result
 
 
 # Quick API function for views
@@ -0,0 +1,154 @@
+"""
+Detection Profiles
+Compiled view of a CustomYoloModel's requirements for the hot paths
+(preview, multi-login, trip vehicle checks):
+
+- required classes (original casing + lowercase set)
+- display names
+- OR-groups that apply to this model (e.g. Number Plate alternatives)
+- compiled compliance rules (stored rules, or derived from the required classes)
+- class-id filter, resolved once against the loaded model's names
+
+Keyed by (model id, requirements version). The version is the model's
+updated_at, bumped by invalidate_detection_profile() whenever requirements
+change, so other processes pick up the new profile on their next lookup.
+
+Lookup: in-process dict -> Django cache (Redis in production) -> database.
+"""
+import threading
+import logging
+from django.core.cache import cache
+from django.utils import timezone
+
+from .compliance_rules import OR_GROUPS, compile_rules, default_rules
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_TIMEOUT = 24 * 60 * 60  # Versioned keys, so a long TTL is safe
+
+
+class DetectionProfile:
+    """Requirements of one CustomYoloModel at one version."""
+
+    def __init__(self, model_id, version, classes, required, display_names, rules=None):
+        self.model_id = str(model_id)
+        self.version = version
+        self.classes = list(classes)
+        self.required = list(required)
+        self.required_lower = frozenset(c.lower().strip() for c in self.required)
+        self.display_names = dict(display_names)
+        # Only the OR-groups this model actually requires
+        self.or_groups = {
+            label: alts for label, alts in OR_GROUPS.items()
+            if self.required_lower.intersection(alts)
+        }
+        # Stored rule spec (None = derived from the required classes)
+        self.rules_spec = rules
+        self.rules = None
+        if rules:
+            try:
+                self.rules = compile_rules(rules)
+            except (ValueError, TypeError, KeyError) as e:
+                # Saved without validation (e.g. raw database edit): keep check-ins working
+                logger.error(f"❌ Invalid compliance rules for YOLO model {self.model_id}, using required classes: {e}")
+        if self.rules is None:
+            self.rules = compile_rules(default_rules(self.required, self.or_groups))
+        # Everything the rules look at - what detection keeps and counts
+        self.counted_lower = self.required_lower | self.rules.classes
+        self._class_ids = None
+
+    def is_required(self, class_name):
+        return class_name.lower().strip() in self.counted_lower
+
+    def required_class_ids(self, name_index):
+        """
+        Class ids of the classes the rules need, for a loaded model.
+
+        Args:
+            name_index: {lowercase class name: class id} of the loaded weights
+        """
+        if self._class_ids is None and name_index:
+            self._class_ids = sorted(
+                name_index[name] for name in self.counted_lower if name in name_index
+            )
+        return self._class_ids or []
+
+    def to_dict(self):
+        return {
+            'model_id': self.model_id,
+            'version': self.version,
+            'classes': self.classes,
+            'required': self.required,
+            'display_names': self.display_names,
+            'rules': self.rules_spec,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['model_id'], data['version'], data['classes'], data['required'], data['display_names'],
+            rules=data.get('rules')
+        )
+
+
+def _version(yolo_model):
+    return yolo_model.updated_at.isoformat() if yolo_model.updated_at else '0'
+
+
+def _cache_key(model_id, version):
+    return f"yolo_profile:{model_id}:{version}"
+
+
+def build_detection_profile(yolo_model):
+    """Compile the profile straight from the database (one query)."""
+    rows = list(yolo_model.requirements.values_list('class_name', 'display_name', 'is_required'))
+    return DetectionProfile(
+        model_id=yolo_model.id,
+        version=_version(yolo_model),
+        classes=yolo_model.classes or [],
+        required=[name for name, _, is_required in rows if is_required],
+        display_names={name: display or name for name, display, _ in rows},
+        rules=yolo_model.compliance_rules,
+    )
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_detection_profile(yolo_model):
+    """Cached DetectionProfile for the model's current requirements version."""
+    model_id = str(yolo_model.id)
+    version = _version(yolo_model)
+
+    profile = _profiles.get(model_id)
+    if profile is not None and profile.version == version:
+        return profile
+
+    key = _cache_key(model_id, version)
+    data = cache.get(key)
+    if data:
+        profile = DetectionProfile.from_dict(data)
+    else:
+        profile = build_detection_profile(yolo_model)
+        cache.set(key, profile.to_dict(), PROFILE_CACHE_TIMEOUT)
+        logger.info(f"🧩 Detection profile compiled: {model_id} ({len(profile.required)} required)")
+
+    with _profiles_lock:
+        _profiles[model_id] = profile
+    return profile
+
+
+def invalidate_detection_profile(yolo_model):
+    """
+    Call after changing a model's requirements or compliance rules.
+    Bumps the version (updated_at) so every process rebuilds its profile.
+    """
+    from core.models import CustomYoloModel
+
+    now = timezone.now()
+    CustomYoloModel.objects.filter(pk=yolo_model.pk).update(updated_at=now)
+    yolo_model.updated_at = now
+
+    with _profiles_lock:
+        _profiles.pop(str(yolo_model.pk), None)
@@ -0,0 +1,375 @@
+"""
+Inference Server Client
+Thin client for the local inference server (apps/detection/inference_server.py),
+which owns InsightFace, MiniFAS and YOLO for the whole box - API workers
+no longer load their own copies.
+
+Wire format (Unix socket, one persistent connection per thread):
+    4-byte big-endian length + JSON header, reply framed the same way.
+Frames never go through the socket: each thread owns a
+multiprocessing.shared_memory segment, writes the arrays into it and sends
+only {'shm', 'frames': [{'offset', 'shape', 'dtype'}]}. The server maps the
+segment and wraps the arrays in place (no copy).
+
+The proxies mimic the in-process objects, so callers don't change:
+- RemoteFaceAnalysis  ~ insightface FaceAnalysis (get / det_model / models['recognition'])
+- RemoteYoloService   ~ YoloDetectionService
+- RemoteSession       ~ onnxruntime.InferenceSession (MiniFAS, DeepPixBiS)
+get_insightface_app(), get_yolo_service() and the ONNX session loaders hand
+these out when INFERENCE_SERVER['ENABLED'] is set.
+"""
+import json
+import time
+import socket
+import struct
+import threading
+import logging
+from multiprocessing import shared_memory
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'INFERENCE_SERVER', {})
+ENABLED = _config.get('ENABLED', False)
+SOCKET_PATH = _config.get('SOCKET_PATH', '/run/inference/inference.sock')
+TIMEOUT = _config.get('TIMEOUT', 30)
+FALLBACK_LOCAL = _config.get('FALLBACK_LOCAL', True)
+RETRY_SECONDS = _config.get('RETRY_SECONDS', 10)
+
+_HEADER = struct.Struct('>I')
+_ALIGN = 64
+MIN_SEGMENT_BYTES = 8 * 1024 * 1024  # A 1920x1080 BGR frame is ~6 MB
+
+# Set by the server process itself so its own service lookups stay local
+IN_SERVER = False
+
+
+class InferenceServerError(Exception):
+    """The inference server could not be reached or the call failed there."""
+
+
+# --- Framing ---
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError('Inference socket closed')
+        received += n
+    return buf
+
+
+def recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+class FrameBuffer:
+    """Per-thread shared memory segment, grown (re-created) on demand."""
+
+    def __init__(self):
+        self.shm = None
+
+    def write(self, arrays):
+        """Copy arrays into the segment. Returns the header fields describing them."""
+        arrays = [np.ascontiguousarray(a) for a in arrays]
+        offsets, total = [], 0
+        for a in arrays:
+            offsets.append(total)
+            total += (a.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+
+        if self.shm is None or self.shm.size < total:
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(total, MIN_SEGMENT_BYTES))
+
+        frames = []
+        for a, offset in zip(arrays, offsets):
+            np.ndarray(a.shape, dtype=a.dtype, buffer=self.shm.buf, offset=offset)[...] = a
+            frames.append({'offset': offset, 'shape': list(a.shape), 'dtype': a.dtype.str})
+        return {'shm': self.shm.name, 'frames': frames}
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class InferenceClient:
+    """Calls into the inference server; thread-safe (state is per thread)."""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = FrameBuffer()
+        return buffer
+
+    def _drop_connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def call(self, op, frames=(), **args):
+        """
+        Run one operation on the server.
+
+        Args:
+            op: e.g. 'yolo.detect', 'faces.get'
+            frames: numpy arrays handed over through shared memory
+        """
+        message = {'op': op, 'args': args}
+        if frames:
+            message.update(self._buffer().write(frames))
+
+        # One retry on a fresh connection (server restarted since the last call)
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, message)
+                reply = recv_message(sock)
+                break
+            except (OSError, ConnectionError, ValueError) as e:
+                self._drop_connection()
+                if attempt:
+                    _mark_unavailable(e)
+                    raise InferenceServerError(f'Inference server unavailable: {e}') from e
+
+        if not reply.get('ok'):
+            raise InferenceServerError(reply.get('error', 'Inference failed'))
+        return reply.get('result')
+
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable_until = 0.0
+
+
+def _mark_unavailable(error):
+    """With FALLBACK_LOCAL, route calls in-process for a while after a connection failure."""
+    global _unavailable_until
+    if FALLBACK_LOCAL:
+        _unavailable_until = time.monotonic() + RETRY_SECONDS
+        logger.warning(f"⚠️ Inference server unreachable ({error}), running in-process for {RETRY_SECONDS}s")
+
+
+def get_inference_client():
+    """The shared client, or None when inference should run in this process."""
+    global _client
+    if not ENABLED or IN_SERVER:
+        return None
+    if FALLBACK_LOCAL and time.monotonic() < _unavailable_until:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InferenceClient()
+    return _client
+
+
+# --- InsightFace proxy ---
+
+def _face(**fields):
+    from insightface.app.common import Face
+
+    return Face(**{k: np.asarray(v, dtype=np.float32) if isinstance(v, list) else v for k, v in fields.items()})
+
+
+class _RemoteDetector:
+    def __init__(self, client):
+        self.client = client
+
+    def detect(self, img, input_size=None, max_num=0, metric='default'):
+        result = self.client.call(
+            'faces.detect', frames=[img], input_size=list(input_size) if input_size else None,
+            max_num=max_num, metric=metric
+        )
+        bboxes = np.asarray(result['bboxes'], dtype=np.float32).reshape(-1, 5)
+        kpss = np.asarray(result['kpss'], dtype=np.float32).reshape(-1, 5, 2) if result['kpss'] is not None else None
+        return bboxes, kpss
+
+
+class _RemoteRecognizer:
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, img, face):
+        result = self.client.call('faces.embed', frames=[img], kps=np.asarray(face.kps).tolist())
+        face.embedding = np.asarray(result['embedding'], dtype=np.float32)
+        return face.embedding
+
+
+class RemoteFaceAnalysis:
+    """The parts of insightface's FaceAnalysis that DeepFaceService uses."""
+
+    remote = True
+
+    def __init__(self, client):
+        self.client = client
+        self.det_model = _RemoteDetector(client)
+        self.models = {'recognition': _RemoteRecognizer(client)}
+
+    def get(self, img, max_num=0, profile=None):
+        result = self.client.call('faces.get', frames=[img], max_num=max_num, profile=profile)
+        return [_face(**face) for face in result['faces']]
+
+
+def remote_face_analysis():
+    client = get_inference_client()
+    return RemoteFaceAnalysis(client) if client else None
+
+
+# --- ONNX session proxy ---
+
+class RemoteSession:
+    """onnxruntime.InferenceSession.run() for a single-input model held by the server (ONNX_MODELS)."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def run(self, output_names, feeds):
+        (array,) = feeds.values()
+        result = self.client.call('onnx.run', frames=[array], model=self.name)
+        return [np.asarray(output, dtype=np.float32) for output in result['outputs']]
+
+
+def remote_onnx_session(name):
+    """(session, input name) like the in-process loaders, or (None, None)."""
+    client = get_inference_client()
+    if client is None:
+        return None, None
+    return RemoteSession(client, name), 'input'
+
+
+# --- YOLO proxy ---
+
+def _decode(image):
+    if isinstance(image, str):
+        import cv2
+        return cv2.imread(image)
+    return image
+
+
+class RemoteYoloService:
+    """
+    YoloDetectionService API over the inference server (models loaded there).
+    Box-level methods only: raw Ultralytics results (predict()) stay in the
+    server process, so there is no predict() here.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._name_index = {}
+        self._loaded_paths = {}
+
+    def load_custom_model(self, yolo_model) -> bool:
+        result = self.client.call('yolo.load', model_id=str(yolo_model.id))
+        if result['loaded']:
+            self._name_index[str(yolo_model.id)] = result['name_index']
+            self._loaded_paths[str(yolo_model.id)] = result.get('path')
+        return result['loaded']
+
+    def get_model_classes(self, model_path):
+        return self.client.call('yolo.classes', model_path=str(model_path))
+
+    def get_name_index(self, model_id):
+        return self._name_index.get(model_id, {})
+
+    def get_class_ids(self, model_id, class_names):
+        index = self.get_name_index(model_id)
+        return [index[c.lower()] for c in class_names if c.lower() in index]
+
+    def get_loaded_path(self, model_id):
+        """Runtime the server loaded, as of the last load_custom_model()."""
+        return self._loaded_paths.get(model_id)
+
+    def max_batch(self, model_id):
+        return None  # The server's detect_batch caps batches at its runtime's limit
+
+    def _detect(self, images, model_id, confidence_threshold, class_ids=None, imgsz=None):
+        frames = [_decode(image) for image in images]
+        if any(frame is None for frame in frames):
+            raise ValueError('Could not decode image')
+        return self.client.call(
+            'yolo.detect', frames=frames, model_id=model_id,
+            conf=confidence_threshold, class_ids=class_ids, imgsz=imgsz
+        )
+
+    def detect(self, image_path, model_id, confidence_threshold=0.5, allowed_classes=None, class_ids=None):
+        """Same {class: detected} shape as YoloDetectionService.detect."""
+        try:
+            if allowed_classes and class_ids is None:
+                class_ids = self.get_class_ids(model_id, allowed_classes)
+            (boxes,) = self._detect([image_path], model_id, confidence_threshold, class_ids)
+        except Exception as e:
+            logger.error(f"Detection failed: {e}")
+            return {}
+        names = allowed_classes or list(self.get_name_index(model_id))
+        detections = {cls: False for cls in names}
+        for box in boxes:
+            detections[box['class']] = True
+        return detections
+
+    def detect_with_details(self, image_path, model_id, confidence_threshold=0.5, allowed_classes=None, class_ids=None):
+        try:
+            if allowed_classes and class_ids is None:
+                class_ids = self.get_class_ids(model_id, allowed_classes)
+            (boxes,) = self._detect([image_path], model_id, confidence_threshold, class_ids)
+            return boxes
+        except Exception as e:
+            logger.error(f"Detection failed: {e}")
+            return []
+
+    def detect_batch(self, images, model_id, batch_size=8, confidence_threshold=0.25, class_ids=None, imgsz=None):
+        from itertools import islice
+
+        iterator = iter(images)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            yield from self._detect(batch, model_id, confidence_threshold, class_ids, imgsz)
+
+    def unload_model(self, model_id):
+        self._name_index.pop(model_id, None)
+        self._loaded_paths.pop(model_id, None)
+
+
+_remote_yolo = None
+
+
+def remote_yolo_service():
+    global _remote_yolo
+    client = get_inference_client()
+    if client is None:
+        return None
+    if _remote_yolo is None:
+        _remote_yolo = RemoteYoloService(client)
+    return _remote_yolo
@@ -0,0 +1,206 @@
+"""
+Inference Scheduler
+Admission control so kiosk previews never delay real logins.
+
+- Check-ins (driver/vehicle/multi-login) are never queued: they register
+  themselves and run immediately.
+- Previews run only when no check-in is in flight, with at most
+  PREVIEW_SLOTS previews at once.
+- Per kiosk only the newest preview may wait (bounded queue of 1): a newer
+  frame supersedes the waiting one, which returns "busy".
+- A preview that can't start early enough to finish within its deadline is
+  rejected up front with a cheap "busy" response instead of piling up.
+
+Check-ins in other processes (the other gunicorn workers, the uvicorn
+preview server) are seen through SharedCheckins: a Redis sorted set of
+in-flight check-in tokens, scored by expiry so a crashed worker's entries
+lapse after CHECKIN_TTL_SECONDS. A preview that gets its slot while any
+process has a check-in in flight returns "busy". Without REDIS_URL only
+check-ins of the same process count.
+
+Needs a threaded worker (gunicorn --worker-class gthread) so a check-in can
+be served while previews are waiting in the same process.
+"""
+import time
+import uuid
+import threading
+import functools
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'INFERENCE_SCHEDULER', {})
+PREVIEW_SLOTS = _config.get('PREVIEW_SLOTS', 1)
+PREVIEW_DEADLINE = _config.get('PREVIEW_DEADLINE_MS', 800) / 1000.0
+MAX_WAITING_PREVIEWS = _config.get('MAX_WAITING_PREVIEWS', 8)
+REDIS_URL = _config.get('REDIS_URL', '')
+CHECKINS_KEY = 'inference:checkins'
+CHECKIN_TTL_SECONDS = _config.get('CHECKIN_TTL_SECONDS', 90)  # Longer than any check-in request
+INITIAL_PREVIEW_ESTIMATE = 0.3  # Seconds, until we've measured real previews
+EWMA_ALPHA = 0.2
+
+
+class SchedulerBusy(Exception):
+    """Preview rejected - caller should answer with a cheap 'busy' response."""
+
+
+class SharedCheckins:
+    """Check-ins in flight in any process. Redis errors never fail a check-in (previews just stop yielding)."""
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.2)
+
+    def begin(self):
+        token = uuid.uuid4().hex
+        try:
+            self._redis.zadd(CHECKINS_KEY, {token: time.time() + CHECKIN_TTL_SECONDS})
+        except Exception as e:
+            logger.warning(f"⚠️ Check-in not shared with other processes: {e}")
+        return token
+
+    def end(self, token):
+        try:
+            self._redis.zrem(CHECKINS_KEY, token)
+        except Exception as e:
+            logger.warning(f"⚠️ Shared check-in not cleared (expires on its own): {e}")
+
+    def active(self):
+        try:
+            pipe = self._redis.pipeline()
+            pipe.zremrangebyscore(CHECKINS_KEY, '-inf', time.time())
+            pipe.zcard(CHECKINS_KEY)
+            return pipe.execute()[1] > 0
+        except Exception as e:
+            logger.warning(f"⚠️ Shared check-ins unavailable: {e}")
+            return False
+
+
+class InferenceScheduler:
+
+    def __init__(self, preview_slots=PREVIEW_SLOTS, max_waiting=MAX_WAITING_PREVIEWS, shared=None):
+        self.preview_slots = preview_slots
+        self.max_waiting = max_waiting
+        self.shared = shared
+        self._cond = threading.Condition()
+        self._active_checkins = 0
+        self._running_previews = 0
+        self._waiting = {}  # kiosk key -> ticket of the newest waiting preview
+        self._preview_estimate = INITIAL_PREVIEW_ESTIMATE
+
+    # ---- Check-ins ----
+
+    def begin_checkin(self):
+        """Returns a token for end_checkin()."""
+        with self._cond:
+            self._active_checkins += 1
+        return self.shared.begin() if self.shared is not None else None
+
+    def end_checkin(self, token=None):
+        if self.shared is not None and token is not None:
+            self.shared.end(token)
+        with self._cond:
+            self._active_checkins -= 1
+            self._cond.notify_all()
+
+    # ---- Previews ----
+
+    def _estimated_wait(self, key):
+        """Rough queueing delay for a new preview (caller holds the lock)."""
+        # A waiting frame from the same kiosk is replaced, not queued ahead
+        ahead = len(self._waiting) - (key in self._waiting) + self._running_previews
+        return ahead * self._preview_estimate / max(self.preview_slots, 1)
+
+    def _acquire_preview(self, key, deadline):
+        expires = time.monotonic() + deadline
+        with self._cond:
+            if self._active_checkins:
+                raise SchedulerBusy('check-in in progress')
+            if key not in self._waiting and len(self._waiting) >= self.max_waiting:
+                raise SchedulerBusy('preview queue full')
+            if self._estimated_wait(key) + self._preview_estimate > deadline:
+                raise SchedulerBusy('deadline cannot be met')
+
+            ticket = object()
+            self._waiting[key] = ticket  # Supersedes an older frame from this kiosk
+            self._cond.notify_all()
+
+            try:
+                while True:
+                    if self._waiting.get(key) is not ticket:
+                        raise SchedulerBusy('superseded by a newer frame')
+                    if not self._active_checkins and self._running_previews < self.preview_slots:
+                        break
+                    remaining = expires - time.monotonic() - self._preview_estimate
+                    if remaining <= 0:
+                        raise SchedulerBusy('deadline cannot be met')
+                    self._cond.wait(remaining)
+            except SchedulerBusy:
+                if self._waiting.get(key) is ticket:
+                    del self._waiting[key]
+                raise
+
+            del self._waiting[key]
+            self._running_previews += 1
+
+    def _release_preview(self, elapsed=None):
+        with self._cond:
+            self._running_previews -= 1
+            if elapsed is not None:
+                self._preview_estimate += EWMA_ALPHA * (elapsed - self._preview_estimate)
+            self._cond.notify_all()
+
+    def run_preview(self, key, fn, *args, deadline=PREVIEW_DEADLINE, **kwargs):
+        """
+        Run a preview inference if it can start in time.
+
+        Raises:
+            SchedulerBusy: check-in in flight, superseded, or deadline missed
+        """
+        self._acquire_preview(key, deadline)
+        if self.shared is not None and self.shared.active():
+            self._release_preview()
+            raise SchedulerBusy('check-in in progress')
+        start = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release_preview(time.monotonic() - start)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active_checkins': self._active_checkins,
+                'running_previews': self._running_previews,
+                'waiting_previews': len(self._waiting),
+                'preview_estimate_ms': round(self._preview_estimate * 1000, 1),
+                'shared_checkins': self.shared is not None,
+            }
+
+
+# Singleton instance
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_inference_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler(shared=SharedCheckins(REDIS_URL) if REDIS_URL else None)
+    return _scheduler
+
+
+def checkin_priority(view_method):
+    """Mark a view method as a real check-in: previews yield while it runs."""
+    @functools.wraps(view_method)
+    def wrapper(*args, **kwargs):
+        scheduler = get_inference_scheduler()
+        token = scheduler.begin_checkin()
+        try:
+            return view_method(*args, **kwargs)
+        finally:
+            scheduler.end_checkin(token)
+    return wrapper
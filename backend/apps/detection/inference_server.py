@@ -0,0 +1,307 @@
+"""
+Local Inference Server
+One process owns the CPU models (InsightFace, MiniFAS, DeepPixBiS, YOLO) for every API
+worker on the box; workers talk to it through apps/detection/inference_client.py.
+
+- Unix socket, one thread per client connection (each API thread keeps one)
+- Frames are read straight out of the client's shared memory segment
+- YOLO requests from all workers are micro-batched: the batcher waits up to
+  BATCH_WINDOW_MS for more frames of the same model/settings and runs them
+  in one forward pass
+- Face / MiniFAS calls run directly on the connection thread (ONNX Runtime
+  sessions are thread-safe)
+
+Run (see attendance_system/inference_server.py):
+    python -m attendance_system.inference_server
+"""
+import os
+import time
+import queue
+import threading
+import socketserver
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import inference_client
+from .inference_client import send_message, recv_message, SOCKET_PATH
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'INFERENCE_SERVER', {})
+BATCH_WINDOW_MS = _config.get('BATCH_WINDOW_MS', 5)
+MAX_BATCH = _config.get('MAX_BATCH', 8)
+MAX_ATTACHED_SEGMENTS = 256
+
+
+def _antispoof_session():
+    from ml.anti_spoof import get_antispoof_session
+    return get_antispoof_session()
+
+
+def _deep_pix_bis_session():
+    from ml.deep_pix_bis_onnx import get_deep_pix_bis_onnx_service
+    return get_deep_pix_bis_onnx_service().get_session()
+
+
+# Single-input ONNX models served through 'onnx.run': name -> (session, input name) loader
+ONNX_MODELS = {
+    'antispoof': _antispoof_session,
+    'deeppixbis': _deep_pix_bis_session,
+}
+
+
+class SegmentCache:
+    """Attached client segments by name (clients reuse theirs across calls)."""
+
+    def __init__(self, limit=MAX_ATTACHED_SEGMENTS):
+        self.limit = limit
+        self._segments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            shm = self._segments.get(name)
+            if shm is not None:
+                self._segments.move_to_end(name)
+                return shm
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                # The client created (and will unlink) it - keep our tracker from unlinking it too
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+            self._segments[name] = shm
+            while len(self._segments) > self.limit:
+                _, old = self._segments.popitem(last=False)
+                try:
+                    old.close()
+                except BufferError:
+                    pass  # Still referenced by an in-flight array; GC closes it
+            return shm
+
+    def frames(self, message):
+        """Zero-copy arrays for the frames described in a request."""
+        if not message.get('frames'):
+            return []
+        shm = self.get(message['shm'])
+        return [
+            np.ndarray(tuple(f['shape']), dtype=np.dtype(f['dtype']), buffer=shm.buf, offset=f['offset'])
+            for f in message['frames']
+        ]
+
+
+class YoloBatcher:
+    """Collects YOLO frames from all connections and runs them in shared batches."""
+
+    def __init__(self, service, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.service = service
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='yolo-batcher', daemon=True).start()
+
+    def submit(self, frames, model_id, conf, class_ids=None, imgsz=None):
+        """Returns one box list per frame (blocks until the batch ran)."""
+        key = (model_id, tuple(class_ids) if class_ids else None, imgsz)
+        futures = []
+        for frame in frames:
+            future = Future()
+            self._queue.put((key, frame, conf, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job[0], []).append(job)
+            for (model_id, class_ids, imgsz), group in groups.items():
+                self._run_group(model_id, class_ids, imgsz, group)
+
+    def _run_group(self, model_id, class_ids, imgsz, group):
+        try:
+            # Lowest requested threshold for the pass, each caller's own applied after
+            min_conf = min(job[2] for job in group)
+            results = list(self.service.detect_batch(
+                [job[1] for job in group], model_id, batch_size=len(group),
+                confidence_threshold=min_conf, class_ids=list(class_ids) if class_ids else None, imgsz=imgsz
+            ))
+            if len(results) != len(group):
+                raise RuntimeError(f'YOLO model {model_id} not loaded')
+            for (_, _, conf, future), boxes in zip(group, results):
+                future.set_result([b for b in boxes if b['confidence'] >= conf])
+        except Exception as e:
+            for job in group:
+                if not job[3].done():
+                    job[3].set_exception(e)
+
+
+class InferenceBackend:
+    """The operations the server exposes, backed by the in-process services."""
+
+    def __init__(self):
+        from .yolo_service import get_yolo_service
+        from apps.faces.deepface_service import get_insightface_app
+        from apps.faces.embedding_versions import serving_pack
+        from services.embedding_events import on_change, ensure_listening
+
+        self.face_pack = serving_pack()
+        self.face_app = get_insightface_app(self.face_pack)
+        self.yolo = get_yolo_service()
+        self.batcher = YoloBatcher(self.yolo)
+        self.segments = SegmentCache()
+        # Face model version switches (apps/faces/embedding_versions.py) arrive as org-wide events
+        on_change(self._on_engine_changed)
+        ensure_listening()
+
+    def _on_engine_changed(self, org_code, model_type):
+        if org_code is not None:
+            return
+        from apps.faces.deepface_service import get_insightface_app
+        from apps.faces.embedding_versions import serving_pack
+
+        close_old_connections()
+        pack = serving_pack()
+        if pack != self.face_pack:
+            # Load before swapping: requests keep using the old pack meanwhile
+            self.face_app = get_insightface_app(pack)
+            self.face_pack = pack
+            logger.info(f"🔀 Inference server switched face model pack to {pack}")
+
+    def handle(self, message):
+        op = message.get('op')
+        handler = getattr(self, 'op_' + op.replace('.', '_'), None) if op else None
+        if handler is None:
+            raise ValueError(f'Unknown operation: {op}')
+        return handler(self.segments.frames(message), **message.get('args', {}))
+
+    def op_ping(self, frames):
+        return {'pid': os.getpid()}
+
+    # --- Faces ---
+
+    def op_faces_get(self, frames, max_num=0, profile=None):
+        from apps.faces.detection_profiles import get_faces
+
+        faces = get_faces(self.face_app, frames[0], profile, max_num)
+        return {'faces': [
+            {
+                'bbox': face.bbox.tolist(),
+                'kps': face.kps.tolist() if face.kps is not None else None,
+                'det_score': float(face.det_score),
+                'embedding': face.embedding.tolist() if face.embedding is not None else None,
+            }
+            for face in faces
+        ]}
+
+    def op_faces_detect(self, frames, input_size=None, max_num=0, metric='default'):
+        if input_size:
+            from apps.faces.detection_profiles import detect_at
+            bboxes, kpss = detect_at(self.face_app, frames[0], input_size[0], max_num)
+        else:
+            bboxes, kpss = self.face_app.det_model.detect(frames[0], max_num=max_num, metric=metric)
+        return {'bboxes': bboxes.tolist(), 'kpss': kpss.tolist() if kpss is not None else None}
+
+    def op_faces_embed(self, frames, kps):
+        from insightface.app.common import Face
+
+        face = Face(kps=np.asarray(kps, dtype=np.float32))
+        self.face_app.models['recognition'].get(frames[0], face)
+        return {'embedding': face.embedding.tolist()}
+
+    # --- ONNX models ---
+
+    def op_onnx_run(self, frames, model):
+        loader = ONNX_MODELS.get(model)
+        if loader is None:
+            raise ValueError(f'Unknown ONNX model: {model}')
+
+        session, input_name = loader()
+        if session is None:
+            raise RuntimeError(f'{model} model not available')
+        outputs = session.run(None, {input_name: frames[0]})
+        return {'outputs': [np.asarray(o).tolist() for o in outputs]}
+
+    # --- YOLO ---
+
+    def op_yolo_load(self, frames, model_id):
+        from core.models import CustomYoloModel
+
+        close_old_connections()
+        yolo_model = CustomYoloModel.objects.filter(pk=model_id).first()
+        loaded = bool(yolo_model) and self.yolo.load_custom_model(yolo_model)
+        return {
+            'loaded': loaded,
+            'name_index': self.yolo.get_name_index(model_id) if loaded else {},
+            'path': self.yolo.get_loaded_path(model_id) if loaded else None,
+        }
+
+    def op_yolo_classes(self, frames, model_path):
+        if not os.path.realpath(model_path).startswith(os.path.realpath(settings.MEDIA_ROOT)):
+            raise ValueError('Model path outside MEDIA_ROOT')
+        return self.yolo.get_model_classes(model_path)
+
+    def op_yolo_detect(self, frames, model_id, conf=0.25, class_ids=None, imgsz=None):
+        return self.batcher.submit(frames, model_id, conf, class_ids, imgsz)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        backend = self.server.backend
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return  # Client went away
+            try:
+                reply = {'ok': True, 'result': backend.handle(message)}
+            except Exception as e:
+                logger.error(f"Inference op {message.get('op')} failed: {e}")
+                reply = {'ok': False, 'error': str(e)}
+            try:
+                send_message(self.request, reply)
+            except OSError:
+                return
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, backend):
+        self.backend = backend
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+
+def serve(socket_path=SOCKET_PATH):
+    """Load the models once and serve until interrupted."""
+    inference_client.IN_SERVER = True  # Service lookups in this process must stay local
+
+    backend = InferenceBackend()
+    server = InferenceServer(socket_path, backend)
+    logger.info(f"🚀 Inference server listening on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
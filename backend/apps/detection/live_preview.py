@@ -0,0 +1,164 @@
+"""
+Kiosk Live Preview Pipeline
+Shared by the HTTP preview endpoint (LivePreviewView) and the kiosk
+WebSocket app (attendance_system/preview_asgi.py).
+
+One frame in -> face identities (tracked per kiosk) + YOLO boxes out.
+"""
+import time
+import logging
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity needed to label a face (distance <= 0.5, DeepFaceService.THRESHOLD)
+MIN_SIMILARITY = 0.5
+
+
+def decode_frame(data: bytes):
+    """JPEG/PNG bytes -> BGR image (None if the bytes are not an image)."""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def kiosk_key(kiosk_id, real_ip=None, remote_addr=None):
+    """
+    Tracking session key for a preview client. Kiosks send kiosk_id; without
+    it, the address nginx passes as X-Real-IP (REMOTE_ADDR behind the proxy is
+    nginx itself, which would put every kiosk in one session).
+    """
+    if kiosk_id:
+        return kiosk_id
+    address = real_ip or remote_addr or 'unknown'
+    logger.debug(f"Preview without kiosk_id, keyed by address {address}")
+    return address
+
+
+def recognize_faces(org_code, img, kiosk_id):
+    """
+    Detect faces and identify them through the kiosk's tracking session.
+    Embedding + vector search only run for new tracks / stale identities.
+
+    Returns:
+        List of {'name', 'confidence', 'box', 'track_id'} for known faces
+    """
+    from apps.faces.deepface_service import get_deepface_service
+    from services.vector_db import vector_db
+    from .preview_session import get_preview_session
+
+    face_service = get_deepface_service()
+    faces = face_service.detect_faces(img)
+
+    session = get_preview_session(org_code, kiosk_id)
+    now = time.monotonic()
+    face_results = []
+
+    with session.lock:
+        tracks = session.update([face.bbox for face in faces], now)
+
+        # Re-embed only new tracks / stale identities
+        pending = [(face, track) for face, track in zip(faces, tracks) if track.needs_identity(now)]
+        embedded = []
+        for face, track in pending:
+            embedding = face_service.embed_face(img, face)
+            if embedding:
+                embedded.append((track, embedding))
+            else:
+                track.set_identity(None, None, 0.0, now)
+
+        # Every face of the frame in one query: heavy first, light for the misses
+        for model_type in ('heavy', 'light'):
+            if not embedded:
+                break
+            matches = vector_db.find_best_matches(
+                org_code, model_type, [embedding for _, embedding in embedded], min_confidence=MIN_SIMILARITY
+            )
+            unmatched = []
+            for (track, embedding), match in zip(embedded, matches):
+                if match:
+                    employee_id, conf, name = match
+                    track.set_identity(employee_id, name, conf, now)
+                else:
+                    unmatched.append((track, embedding))
+            embedded = unmatched
+
+        for track, _ in embedded:
+            track.set_identity(None, None, 0.0, now)
+
+        for track in tracks:
+            if track.name:
+                x1, y1, x2, y2 = track.bbox
+                area = {'x': int(x1), 'y': int(y1), 'w': int(x2 - x1), 'h': int(y2 - y1)}
+                face_results.append({
+                    'name': track.name,
+                    'confidence': track.confidence,
+                    'box': area,
+                    'track_id': track.track_id
+                })
+
+    return face_results
+
+
+def detect_compliance_boxes(org, img):
+    """Run the org's active YOLO model on the frame, flagging required classes."""
+    from core.models import CustomYoloModel
+    from .yolo_service import get_yolo_service, YOLO_AVAILABLE
+    from .detection_profile import get_detection_profile
+
+    active_yolo = CustomYoloModel.objects.filter(
+        organization=org,
+        is_active=True
+    ).first()
+    if not active_yolo or not YOLO_AVAILABLE:
+        return []
+
+    service = get_yolo_service()
+    model_id = str(active_yolo.id)
+    service.load_custom_model(active_yolo)
+
+    # Ultralytics accepts decoded BGR arrays directly
+    detections = service.detect_with_details(img, model_id)
+
+    # Required classes from the cached profile (no per-frame query)
+    profile = get_detection_profile(active_yolo)
+
+    # Add compliance info to each box
+    for d in detections:
+        d['is_required'] = profile.is_required(d['class'])
+
+    return detections
+
+
+def run_live_preview(org, img, kiosk_id):
+    """
+    Full preview for one decoded frame.
+
+    Returns:
+        {'boxes': [...], 'detected_name': str|None, 'face_results': [...]}
+    """
+    face_results = []
+    boxes = []
+
+    if img is not None:
+        try:
+            face_results = recognize_faces(org.org_code, img, kiosk_id)
+        except Exception as e:
+            logger.error(f"Preview Face System Error: {e}")
+
+        try:
+            boxes = detect_compliance_boxes(org, img)
+        except Exception as e:
+            logger.error(f"Preview YOLO Error: {e}")
+
+    return {
+        'boxes': boxes,
+        'detected_name': face_results[0]['name'] if face_results else None,
+        'face_results': face_results
+    }
+
+
+def preview_frame(org, data: bytes, kiosk_id):
+    """Decode + preview raw image bytes (WebSocket frames)."""
+    return run_live_preview(org, decode_frame(data), kiosk_id)
@@ -0,0 +1,153 @@
+"""
+Kiosk Live Preview Tracking Sessions
+Keeps per-kiosk face tracks between preview polls so we only re-embed
+faces that are new or whose identity has gone stale.
+
+Flow per frame:
+1. Detect faces (detection only, no recognition)
+2. Match detections to existing tracks by IoU
+3. Embed + vector search ONLY for new tracks / stale identities
+4. Known tracks reuse their cached identity for IDENTITY_TTL seconds
+
+Sessions live in-process (one store per gunicorn worker). A poll that lands
+on another worker just starts a fresh session there - correctness is the same,
+only the cache hit rate drops.
+"""
+import time
+import threading
+import itertools
+import logging
+from services.embedding_events import on_change
+
+logger = logging.getLogger(__name__)
+
+IOU_MATCH_THRESHOLD = 0.3  # Min IoU to treat a detection as the same face
+IDENTITY_TTL = 3.0         # Seconds a known identity is trusted before re-checking
+UNKNOWN_RETRY = 1.0        # Seconds between re-embedding attempts for unknown faces
+TRACK_TTL = 2.5            # Drop tracks not seen for this long
+SESSION_TTL = 120.0        # Evict kiosk sessions idle for this long
+
+
+def bbox_iou(a, b):
+    """IoU of two (x1, y1, x2, y2) boxes."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    if inter <= 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / (area_a + area_b - inter + 1e-9)
+
+
+class FaceTrack:
+    """One face followed across preview frames."""
+
+    def __init__(self, track_id, bbox, now):
+        self.track_id = track_id
+        self.bbox = [float(v) for v in bbox[:4]]
+        self.last_seen = now
+        self.name = None
+        self.employee_id = None
+        self.confidence = 0.0
+        self.identified_at = None
+
+    def needs_identity(self, now):
+        """True if this track must be (re-)embedded on this frame."""
+        if self.identified_at is None:
+            return True
+        ttl = IDENTITY_TTL if self.name else UNKNOWN_RETRY
+        return now - self.identified_at >= ttl
+
+    def set_identity(self, employee_id, name, confidence, now):
+        self.employee_id = employee_id
+        self.name = name
+        self.confidence = confidence
+        self.identified_at = now
+
+
+class PreviewSession:
+    """Tracks for a single kiosk. Callers must hold `lock` while updating."""
+
+    def __init__(self, key):
+        self.key = key
+        self.tracks = []
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def update(self, bboxes, now=None):
+        """
+        Assign detections to tracks (greedy, highest IoU first).
+
+        Returns:
+            List of FaceTrack, one per bbox, in the same order as `bboxes`.
+        """
+        now = now if now is not None else time.monotonic()
+        self.last_used = now
+
+        # Forget tracks that left the frame
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= TRACK_TTL]
+
+        pairs = []
+        for di, bbox in enumerate(bboxes):
+            for ti, track in enumerate(self.tracks):
+                score = bbox_iou(bbox, track.bbox)
+                if score >= IOU_MATCH_THRESHOLD:
+                    pairs.append((score, di, ti))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(bboxes)
+        used_tracks = set()
+        for _, di, ti in pairs:
+            if assigned[di] is not None or ti in used_tracks:
+                continue
+            assigned[di] = self.tracks[ti]
+            used_tracks.add(ti)
+
+        for di, bbox in enumerate(bboxes):
+            track = assigned[di]
+            if track is None:
+                track = FaceTrack(next(self._ids), bbox, now)
+                self.tracks.append(track)
+                assigned[di] = track
+            else:
+                track.bbox = [float(v) for v in bbox[:4]]
+            track.last_seen = now
+
+        return assigned
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_preview_session(org_code, kiosk_id):
+    """Get (or create) the tracking session for a kiosk."""
+    key = (org_code, kiosk_id or 'default')
+    now = time.monotonic()
+    with _sessions_lock:
+        # Evict idle kiosks
+        for stale_key in [k for k, s in _sessions.items() if now - s.last_used > SESSION_TTL]:
+            del _sessions[stale_key]
+
+        session = _sessions.get(key)
+        if session is None:
+            session = PreviewSession(key)
+            _sessions[key] = session
+            logger.info(f"🎥 New preview session: {org_code}/{kiosk_id}")
+        session.last_used = now
+        return session
+
+
+def expire_identities(org_code=None, model_type=None):
+    """Make every track of an org (all orgs if None) re-identify on its next frame - after retraining."""
+    with _sessions_lock:
+        sessions = [s for key, s in _sessions.items() if org_code is None or key[0] == org_code]
+    for session in sessions:
+        with session.lock:
+            for track in session.tracks:
+                track.identified_at = None
+
+
+on_change(expire_identities)
@@ -0,0 +1,245 @@
+"""
+Tiled / ROI YOLO Inference
+For high-resolution vehicle photos (12 MP phone shots), where small required
+objects (number plates, hooters) vanish when the whole frame is shrunk to
+the model's 640 input.
+
+1. Coarse pass: decode at a reduced size (JPEG DCT scaling, the full 12 MP
+   buffer is never built) and run the model on the whole frame.
+2. Refine - only when the coarse result fails the model's rules: the classes
+   the rules use are re-run at higher resolution, on 640 crops around
+   weak/small coarse candidates ('roi'), or on a fixed overlapping grid when
+   there are no candidates ('tiles' always uses the grid).
+3. Merge coarse + crop boxes with class-wise NMS.
+
+Crops go through detect_batch, which caps the batch at what the loaded
+runtime accepts. If the refine pass still fails, the coarse boxes are kept
+(stats['refine_error']) - a failed closer look is not "nothing detected".
+
+Crops keep the model's native input size (imgsz stays 640, which exported
+ONNX/OpenVINO runtimes require), so CPU cost grows with the number of crops -
+bounded by MAX_CROPS / MAX_TILES - rather than with a bigger global imgsz.
+"""
+import math
+import logging
+import numpy as np
+import cv2
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'YOLO_TILING', {})
+TILING_ENABLED = _config.get('ENABLED', False)
+TILING_MODE = _config.get('MODE', 'roi')  # 'roi' or 'tiles'
+COARSE_SIDE = _config.get('COARSE_SIDE', 1280)
+FINE_SIDE = _config.get('FINE_SIDE', 2560)
+CROP_SIZE = _config.get('CROP_SIZE', 640)  # Fine-image pixels per ROI crop
+TILE_OVERLAP = _config.get('TILE_OVERLAP', 0.2)
+MAX_CROPS = _config.get('MAX_CROPS', 6)
+MAX_TILES = _config.get('MAX_TILES', 6)
+CANDIDATE_CONF = _config.get('CANDIDATE_CONF', 0.05)
+SMALL_BOX_AREA = _config.get('SMALL_BOX_AREA', 0.01)  # Fraction of the frame
+NMS_IOU = _config.get('NMS_IOU', 0.5)
+IMGSZ = 640
+CONFIDENCE = 0.25
+
+# IMREAD_REDUCED_* decode JPEGs at 1/2, 1/4, 1/8 scale directly
+_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def image_size(path):
+    """(width, height) from the file header only."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size
+
+
+def decode_reduced(path, max_side, size=None):
+    """
+    Decode with the largest JPEG reduction that still leaves >= max_side
+    pixels, then resize down to max_side.
+    """
+    try:
+        w, h = size or image_size(path)
+    except Exception:
+        w = h = 0
+
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in _REDUCED_FLAGS:
+        if max(w, h) / factor >= max_side:
+            flag = reduced_flag
+            break
+
+    img = cv2.imread(path, flag)
+    if img is None:
+        return None
+    ih, iw = img.shape[:2]
+    scale = max_side / max(ih, iw)
+    if scale < 1:
+        img = cv2.resize(img, (int(iw * scale), int(ih * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def tile_windows(width, height, tile, overlap=TILE_OVERLAP, max_tiles=MAX_TILES):
+    """Overlapping grid [(x1, y1, x2, y2)] covering the image; tiles grow until the grid fits max_tiles."""
+    while True:
+        step = max(int(tile * (1 - overlap)), 1)
+        nx = max(math.ceil((width - tile) / step) + 1, 1)
+        ny = max(math.ceil((height - tile) / step) + 1, 1)
+        if nx * ny <= max_tiles:
+            break
+        tile = int(tile * 1.25)
+
+    windows = []
+    for iy in range(ny):
+        for ix in range(nx):
+            x1 = min(ix * step, max(width - tile, 0))
+            y1 = min(iy * step, max(height - tile, 0))
+            windows.append((x1, y1, min(x1 + tile, width), min(y1 + tile, height)))
+    return windows
+
+
+def roi_windows(candidates, width, height, crop=CROP_SIZE, max_crops=MAX_CROPS):
+    """
+    Square crops centred on candidate boxes (normalized xyxy), strongest first;
+    candidates already inside a chosen crop don't get their own.
+    """
+    windows = []
+    for box in sorted(candidates, key=lambda b: -b['confidence']):
+        x1, y1, x2, y2 = box['bbox']
+        cx, cy = (x1 + x2) / 2 * width, (y1 + y2) / 2 * height
+        if any(wx1 <= cx < wx2 and wy1 <= cy < wy2 for wx1, wy1, wx2, wy2 in windows):
+            continue
+        side = max(crop, (x2 - x1) * width * 2, (y2 - y1) * height * 2)
+        side = min(side, width, height)
+        wx1 = int(min(max(cx - side / 2, 0), width - side))
+        wy1 = int(min(max(cy - side / 2, 0), height - side))
+        windows.append((wx1, wy1, int(wx1 + side), int(wy1 + side)))
+        if len(windows) == max_crops:
+            break
+    return windows
+
+
+def nms(boxes, iou=NMS_IOU):
+    """Class-wise non-maximum suppression over [{'class', 'confidence', 'bbox' (normalized)}]."""
+    kept = []
+    by_class = {}
+    for box in boxes:
+        by_class.setdefault(box['class'], []).append(box)
+
+    for class_boxes in by_class.values():
+        class_boxes.sort(key=lambda b: -b['confidence'])
+        xyxy = np.array([b['bbox'] for b in class_boxes], dtype=np.float32)
+        areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+        suppressed = np.zeros(len(class_boxes), dtype=bool)
+        for i in range(len(class_boxes)):
+            if suppressed[i]:
+                continue
+            kept.append(class_boxes[i])
+            ix1 = np.maximum(xyxy[i, 0], xyxy[i + 1:, 0])
+            iy1 = np.maximum(xyxy[i, 1], xyxy[i + 1:, 1])
+            ix2 = np.minimum(xyxy[i, 2], xyxy[i + 1:, 2])
+            iy2 = np.minimum(xyxy[i, 3], xyxy[i + 1:, 3])
+            inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+            overlap = inter / np.maximum(areas[i] + areas[i + 1:] - inter, 1e-9)
+            suppressed[i + 1:] |= overlap > iou
+    return kept
+
+
+def _crop_boxes(crop_detections, window, width, height, edge=2):
+    """
+    Crop-pixel boxes -> normalized full-image boxes.
+    Boxes cut by an inner crop edge are dropped (a neighbouring crop or the
+    coarse pass sees the whole object).
+    """
+    wx1, wy1, wx2, wy2 = window
+    boxes = []
+    for d in crop_detections:
+        x1, y1, x2, y2 = d['bbox']
+        cut = (
+            (x1 <= edge and wx1 > 0) or (y1 <= edge and wy1 > 0)
+            or (x2 >= wx2 - wx1 - edge and wx2 < width) or (y2 >= wy2 - wy1 - edge and wy2 < height)
+        )
+        if cut:
+            continue
+        boxes.append({
+            'class': d['class'],
+            'confidence': d['confidence'],
+            'bbox': [(x1 + wx1) / width, (y1 + wy1) / height, (x2 + wx1) / width, (y2 + wy1) / height],
+        })
+    return boxes
+
+
+def detect_tiled(service, model_id, image_path, profile, mode=TILING_MODE):
+    """
+    Coarse pass, then high-resolution refinement of the classes the rules use
+    when the coarse result does not already pass them.
+
+    Args:
+        service: YoloDetectionService with model_id loaded
+        profile: DetectionProfile of the model (compiled rules + class ids)
+        mode: 'roi' (crops around candidates, tiles if there are none) or 'tiles'
+
+    Returns:
+        (BoxSet, stats dict)
+    """
+    from .box_store import BoxSet
+
+    try:
+        size = image_size(image_path)
+    except Exception:
+        size = None
+    coarse = decode_reduced(image_path, COARSE_SIDE, size)
+    if coarse is None:
+        return BoxSet(), {'mode': mode, 'crops': 0, 'error': 'unreadable image'}
+    ch, cw = coarse.shape[:2]
+
+    coarse_boxes = next(service.detect_batch([coarse], model_id, confidence_threshold=CANDIDATE_CONF), [])
+    for box in coarse_boxes:
+        x1, y1, x2, y2 = box['bbox']
+        box['bbox'] = [x1 / cw, y1 / ch, x2 / cw, y2 / ch]
+    merged = [b for b in coarse_boxes if b['confidence'] >= CONFIDENCE]
+    stats = {'mode': mode, 'crops': 0, 'coarse_size': [cw, ch]}
+
+    rules = profile.rules
+    class_ids = profile.required_class_ids(service.get_name_index(model_id))
+    if not class_ids or rules.evaluate(BoxSet.from_dicts(merged))['passed']:
+        return BoxSet.from_dicts(merged), stats  # Nothing a closer look could change
+
+    # Weak or small coarse hits of the classes the rules use
+    candidates = [
+        b for b in coarse_boxes
+        if b['class'].lower().strip() in profile.counted_lower and (
+            b['confidence'] < CONFIDENCE
+            or (b['bbox'][2] - b['bbox'][0]) * (b['bbox'][3] - b['bbox'][1]) < SMALL_BOX_AREA
+        )
+    ]
+
+    fine = decode_reduced(image_path, FINE_SIDE, size)
+    if fine is None:
+        return BoxSet.from_dicts(merged), stats
+    fh, fw = fine.shape[:2]
+    if mode == 'roi' and candidates:
+        windows = roi_windows(candidates, fw, fh)
+    else:
+        windows = tile_windows(fw, fh, max(CROP_SIZE, int(max(fw, fh) / 3)))
+
+    crops = (fine[y1:y2, x1:x2] for x1, y1, x2, y2 in windows)
+    try:
+        results = list(service.detect_batch(crops, model_id, batch_size=len(windows), class_ids=class_ids, imgsz=IMGSZ))
+    except Exception as e:
+        logger.error(f"Tiled YOLO refine failed, keeping the coarse result: {e}")
+        stats['refine_error'] = str(e)
+        return BoxSet.from_dicts(merged), stats
+    for window, crop_detections in zip(windows, results):
+        merged.extend(_crop_boxes(crop_detections, window, fw, fh))
+
+    boxes = nms(merged)
+    logger.debug(f"Tiled YOLO ({mode}): {len(windows)} crops, {len(coarse_boxes)} coarse -> {len(boxes)} boxes")
+    stats.update(crops=len(windows), fine_size=[fw, fh])
+    return BoxSet.from_dicts(boxes), stats
@@ -10,12 +10,14 @@ urlpatterns = [
     path('yolo-models/', views.YoloModelListView.as_view(), name='yolo-list'),
     path('yolo-models/<uuid:model_id>/requirements/', views.YoloRequirementsUpdateView.as_view(), name='yolo-requirements'),
     path('yolo-models/<uuid:model_id>/add-class/', views.YoloAddClassView.as_view(), name='yolo-add-class'),
+    path('yolo-models/<uuid:model_id>/export/', views.YoloModelExportView.as_view(), name='yolo-export'),
     
     # Multi-Login with Detection
     path('multi-login/', views.MultiLoginWithDetectionView.as_view(), name='multi-login'),
     
     # Compliance Logs
     path('logs/', views.ComplianceLogsView.as_view(), name='compliance-logs'),
+    path('compliance/reevaluate/', views.ComplianceReevaluateView.as_view(), name='compliance-reevaluate'),
     
     # Live Preview
     path('preview/', views.LivePreviewView.as_view(), name='live-preview'),
@@ -2,6 +2,7 @@
 API Views for YOLO Model Management and Detection
 """
 import os
+import logging
 import tempfile
 from django.conf import settings
 from rest_framework.views import APIView
@@ -15,6 +16,10 @@ from core.models import (
     CustomYoloModel, DetectionRequirement, LoginDetectionResult
 )
 from .yolo_service import get_yolo_service, YOLO_AVAILABLE
+from .inference_scheduler import get_inference_scheduler, checkin_priority, SchedulerBusy
+from .detection_profile import invalidate_detection_profile
+
+logger = logging.getLogger(__name__)
 
 
 class YoloModelUploadView(APIView):
@@ -72,15 +77,57 @@ class YoloModelUploadView(APIView):
                     is_required=False
                 )
         
+        # Background ONNX/OpenVINO export + validation (inference uses .pt until ready)
+        export_queued = queue_yolo_export(yolo_model)
+        
         return Response({
             'success': True,
             'model_id': str(yolo_model.id),
             'name': yolo_model.name,
             'classes': yolo_model.classes,
+            'export_queued': export_queued,
             'message': f'Model uploaded with {len(yolo_model.classes)} detectable classes'
         })
 
 
+def queue_yolo_export(yolo_model, formats=None):
+    """Queue the export job; the .pt keeps serving if the broker is unavailable."""
+    from apps.ml_models.tasks import export_yolo_model
+    try:
+        export_yolo_model.delay(str(yolo_model.id), formats)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not queue YOLO export for {yolo_model.id}: {e}")
+        return False
+
+
+class YoloModelExportView(APIView):
+    """
+    (Re-)run the optimized runtime export for a YOLO model, e.g. once the
+    org has images to validate against.
+    POST /api/v1/detection/yolo-models/{model_id}/export/
+    Body (optional): {"formats": ["onnx", "openvino"]}
+    """
+    permission_classes = [AllowAny]  # Should be admin-only in production
+    
+    def post(self, request, model_id):
+        try:
+            yolo_model = CustomYoloModel.objects.get(id=model_id)
+        except CustomYoloModel.DoesNotExist:
+            return Response({'error': 'Model not found'}, status=404)
+        
+        formats = request.data.get('formats') or None
+        if not queue_yolo_export(yolo_model, formats):
+            return Response({'error': 'Could not queue export job'}, status=503)
+        
+        CustomYoloModel.objects.filter(pk=yolo_model.pk).update(export_status='pending')
+        return Response({
+            'success': True,
+            'model_id': str(yolo_model.id),
+            'message': 'Export queued'
+        })
+
+
 class YoloModelListView(APIView):
     """
     List all YOLO models (temporarily without org filter for debugging)
@@ -109,6 +156,9 @@ class YoloModelListView(APIView):
                     }
                     for r in requirements
                 ],
+                'export_status': m.export_status,
+                'compliance_rules': m.compliance_rules,
+                'export_formats': list((m.export_artifacts or {}).keys()),
                 'created_at': m.created_at.isoformat()
             })
         
@@ -120,7 +170,8 @@ class YoloModelListView(APIView):
 
 class YoloRequirementsUpdateView(APIView):
     """
-    Update which classes are required for a YOLO model
+    Update which classes are required for a YOLO model, and optionally its
+    declarative compliance rules ("rules": spec, or null to go back to the required classes)
     PUT /api/v1/detection/yolo-models/{model_id}/requirements/
     """
     permission_classes = [AllowAny]
@@ -134,6 +185,17 @@ class YoloRequirementsUpdateView(APIView):
         except CustomYoloModel.DoesNotExist:
             return Response({'error': 'Model not found'}, status=404)
         
+        if 'rules' in request.data:
+            rules = request.data.get('rules') or None
+            if rules is not None:
+                from .compliance_rules import compile_rules
+                try:
+                    compile_rules(rules)
+                except (ValueError, TypeError, KeyError) as e:
+                    return Response({'error': f'Invalid rules: {e}'}, status=400)
+            CustomYoloModel.objects.filter(pk=yolo_model.pk).update(compliance_rules=rules)
+            yolo_model.compliance_rules = rules
+        
         updated = 0
         for req in requirements:
             class_name = req.get('class_name')
@@ -145,6 +207,9 @@ class YoloRequirementsUpdateView(APIView):
             ).update(is_required=is_required)
             updated += 1
         
+        # Bulk update skips signals - bump the profile version explicitly
+        invalidate_detection_profile(yolo_model)
+        
         return Response({
             'success': True,
             'updated': updated,
@@ -192,6 +257,7 @@ class YoloAddClassView(APIView):
             if display_name:
                 req.display_name = display_name
             req.save()
+        # (post_save on DetectionRequirement bumps the detection profile version)
         
         return Response({
             'success': True,
@@ -202,6 +268,59 @@ class YoloAddClassView(APIView):
         })
 
 
+class ComplianceReevaluateView(APIView):
+    """
+    Re-run the active YOLO model + current requirements over stored vehicle
+    images (background job), e.g. after changing requirements or uploading a model.
+    With "source": "boxes" only the stored boxes are re-checked against the
+    current requirements - no inference, runs inline and returns the result.
+    POST /api/v1/detection/compliance/reevaluate/
+    Body: {"org_code": "ACME", "since": "2026-01-01T00:00:00", "until": ..., "dry_run": false,
+           "source": "images" | "boxes"}
+    """
+    permission_classes = [AllowAny]  # Should be admin-only in production
+    
+    def post(self, request):
+        from apps.ml_models.tasks import reevaluate_vehicle_compliance
+        
+        org_code = request.data.get('org_code', '').upper().strip()
+        try:
+            org = Organization.objects.get(org_code=org_code, is_active=True)
+        except Organization.DoesNotExist:
+            return Response({'error': 'Organization not found'}, status=404)
+        
+        if request.data.get('source') == 'boxes':
+            from django.utils.dateparse import parse_datetime
+            from .compliance_reevaluation import reevaluate_from_stored_boxes
+            
+            since, until = request.data.get('since'), request.data.get('until')
+            result = reevaluate_from_stored_boxes(
+                org,
+                since=parse_datetime(since) if since else None,
+                until=parse_datetime(until) if until else None,
+                dry_run=bool(request.data.get('dry_run', False)),
+            )
+            return Response(result, status=200 if result['success'] else 400)
+        
+        try:
+            task = reevaluate_vehicle_compliance.delay(
+                str(org.id),
+                since=request.data.get('since'),
+                until=request.data.get('until'),
+                batch_size=int(request.data.get('batch_size', 8)),
+                dry_run=bool(request.data.get('dry_run', False)),
+            )
+        except Exception as e:
+            logger.warning(f"Could not queue compliance re-evaluation for {org_code}: {e}")
+            return Response({'error': 'Could not queue re-evaluation job'}, status=503)
+        
+        return Response({
+            'success': True,
+            'task_id': task.id,
+            'message': 'Re-evaluation queued'
+        })
+
+
 class MultiLoginWithDetectionView(APIView):
     """
     Multi-face login with optional YOLO detection
@@ -213,6 +332,7 @@ class MultiLoginWithDetectionView(APIView):
     permission_classes = [AllowAny]
     authentication_classes = [] # Disable CSRF for public kiosk
     
+    @checkin_priority
     def post(self, request):
         from django.core.files import File
         from django.conf import settings
@@ -255,35 +375,21 @@ class MultiLoginWithDetectionView(APIView):
             
             query_embedding = np.array(query_embedding)
             
-            # 2. Find matching employee (1:N search)
-            employees = SaaSEmployee.objects.filter(
-                organization=org, 
-                face_enrolled=True, 
-                status='active'
-            )
-            
+            # 2. Find matching employee (1:N search: prototype shortlist + k-NN re-rank)
+            from apps.faces.identification import identify
+            match = identify(org_code, query_embedding, threshold=0.4)
             best_match = None
-            best_distance = float('inf')
+            if match:
+                best_match = SaaSEmployee.objects.filter(pk=match['employee_pk'], status='active').first()
             
-            for emp in employees:
-                for stored in (emp.face_embeddings or []):
-                    stored = np.array(stored)
-                    # Cosine similarity
-                    distance = 1 - np.dot(query_embedding, stored) / (
-                        np.linalg.norm(query_embedding) * np.linalg.norm(stored) + 1e-10
-                    )
-                    if distance < best_distance:
-                        best_distance = distance
-                        best_match = emp
-            
-            if best_match is None or best_distance > 0.4:
+            if best_match is None:
                 return Response({
                     'success': False,
                     'message': 'Face not recognized',
-                    'distance': round(best_distance, 3) if best_distance != float('inf') else None
+                    'distance': None
                 }, status=400)
             
-            face_confidence = 1 - best_distance
+            face_confidence = match['confidence']
             
             # 3. YOLO DETECTION (if model is configured)
             detections = {}
@@ -303,7 +409,7 @@ class MultiLoginWithDetectionView(APIView):
                 
                 # Load model if not already loaded
                 model_id = str(active_yolo.id)
-                service.load_model(active_yolo.model_file.path, model_id)
+                service.load_custom_model(active_yolo)
                 
                 # Run detection
                 detections = service.detect(temp_path, model_id)
@@ -493,13 +599,15 @@ class LivePreviewView(APIView):
     Lightweight preview endpoint. 
     Runs ONLY YOLO detection to give frontend visual feedback.
     POST /api/v1/detection/preview/
+    
+    Kiosks that can hold a WebSocket use /ws/preview/ instead
+    (attendance_system/preview_asgi.py) - same pipeline, no per-frame HTTP cost.
     """
     permission_classes = [AllowAny]
     authentication_classes = [] # Disable CSRF for public kiosk
     
     def post(self, request):
-        from .yolo_service import get_yolo_service, YOLO_AVAILABLE
-        import tempfile
+        from .live_preview import decode_frame, run_live_preview, kiosk_key
         
         org_code = request.data.get('org_code', '').upper().strip()
         image_file = request.FILES.get('image')
@@ -510,101 +618,24 @@ class LivePreviewView(APIView):
         try:
             org = Organization.objects.get(org_code=org_code, is_active=True)
             
-            # --- 1. FACE RECOGNITION (Multi-Face Server-Side) ---
-            face_results_list = []
-            detected_name = None
-            yolo_temp_path = None
+            # Decode in memory - no temp file round trip
+            img = decode_frame(image_file.read())
+            forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')[0].strip()
+            kiosk_id = kiosk_key(
+                request.data.get('kiosk_id'),
+                request.META.get('HTTP_X_REAL_IP') or forwarded,
+                request.META.get('REMOTE_ADDR'),
+            )
             
+            # Yields to check-ins; stale / late frames get a cheap busy reply
             try:
-                from apps.faces.deepface_service import get_deepface_service
-                from services.vector_db import vector_db
-                face_service = get_deepface_service()
-
-                if 'image' in request.FILES:
-                    # Save main image to temp path
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as f:
-                        for chunk in request.FILES['image'].chunks():
-                            f.write(chunk)
-                        yolo_temp_path = f.name
-                    
-                    # Get ALL faces from the full image
-                    # This uses DeepFace to detect faces in the uncropped image
-                    results = face_service.get_all_embeddings(yolo_temp_path)
-                    
-                    for res in results:
-                         embedding = res.get('embedding')
-                         area = res.get('facial_area')
-                         
-                         name = None
-                         conf = 0.0
-                         
-                         if embedding:
-                             # Match heavy
-                             match = vector_db.find_best_match(org_code, 'heavy', embedding, min_confidence=0.01)
-                             if match:
-                                 _, conf, name = match
-                             else:
-                                 # Match light
-                                 match = vector_db.find_best_match(org_code, 'light', embedding, min_confidence=0.01)
-                                 if match:
-                                     _, conf, name = match
-                         
-                         if name:
-                             face_results_list.append({
-                                 'name': name,
-                                 'confidence': conf,
-                                 'box': area
-                             })
-                             print(f"Match: {name} at {area}")
-
-                    if face_results_list:
-                         detected_name = face_results_list[0]['name']
-
-            except Exception as e:
-                print(f"Preview Face System Error: {e}")
-            
-            # --- 2. YOLO DETECTION ---
-            # Helper to get active model
-            active_yolo = CustomYoloModel.objects.filter(
-                organization=org, 
-                is_active=True
-            ).first()
+                result = get_inference_scheduler().run_preview(
+                    f"{org_code}:{kiosk_id}", run_live_preview, org, img, kiosk_id
+                )
+            except SchedulerBusy as e:
+                return Response({'busy': True, 'reason': str(e), 'boxes': [], 'detected_name': None})
             
-            boxes = []
-            if active_yolo and YOLO_AVAILABLE:
-                try:
-                    service = get_yolo_service()
-                    model_id = str(active_yolo.id)
-                    service.load_model(active_yolo.model_file.path, model_id)
-                    
-                    # Get detailed detections with boxes
-                    if yolo_temp_path and os.path.exists(yolo_temp_path):
-                        detections = service.detect_with_details(yolo_temp_path, model_id)
-                    else:
-                        detections = []
-                    
-                    # Check which classes are required
-                    required_classes = set(
-                        active_yolo.requirements.filter(is_required=True).values_list('class_name', flat=True)
-                    )
-                    
-                    # Add compliance info to each box
-                    for d in detections:
-                        d['is_required'] = d['class'] in required_classes
-                    
-                    boxes = detections
-                except Exception as e:
-                    print(f"Preview YOLO Error: {e}")
-
-            # Cleanup
-            if yolo_temp_path and os.path.exists(yolo_temp_path):
-                os.unlink(yolo_temp_path)
-                
-            return Response({
-                'boxes': boxes,
-                'detected_name': detected_name,
-                'face_results': face_results_list
-            })
+            return Response(result)
                     
         except Exception as e:
             return Response({'boxes': [], 'detected_name': None})
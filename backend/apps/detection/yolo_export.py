@@ -0,0 +1,304 @@
+"""
+YOLO Runtime Export
+Post-processing for uploaded CustomYoloModels (runs as a background job):
+
+1. Export the .pt to ONNX (optionally OpenVINO IR / OpenVINO INT8), with a
+   dynamic batch axis - detect_batch and tiled inference run several images
+   per call
+2. Validate every artifact against the .pt on sample images from the org
+   (same boxes: class match + IoU, confidence delta) and time both; a
+   batched predict must agree too (max_batch in the report)
+3. Store artifacts beside the original .pt and record the report
+
+At inference time resolve_runtime_path() picks the fastest validated artifact
+whose runtime is installed, and falls back to the .pt otherwise.
+"""
+import os
+import time
+import importlib.util
+import logging
+from django.conf import settings
+from django.utils import timezone
+
+from .preview_session import bbox_iou
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'YOLO_EXPORT', {})
+EXPORT_FORMATS = _config.get('FORMATS', ['onnx'])
+INT8_DATA = _config.get('INT8_DATA', '')  # Dataset yaml for OpenVINO INT8 calibration
+EXPORT_IMGSZ = _config.get('IMGSZ', 640)
+EXPORT_DYNAMIC = _config.get('DYNAMIC', True)  # Dynamic batch (and image size) axes
+VALIDATION_BATCH = _config.get('VALIDATION_BATCH', 8)
+VALIDATION_SAMPLES = _config.get('VALIDATION_SAMPLES', 8)
+MIN_MATCH_RATE = _config.get('MIN_MATCH_RATE', 0.95)
+MAX_CONF_DELTA = _config.get('MAX_CONF_DELTA', 0.05)
+ALLOW_UNVALIDATED = _config.get('ALLOW_UNVALIDATED', False)
+
+# Tie-break when latencies are equal/unknown: fastest runtime first
+RUNTIME_PREFERENCE = ['openvino_int8', 'openvino', 'onnx']
+RUNTIME_MODULES = {
+    'onnx': 'onnxruntime',
+    'openvino': 'openvino',
+    'openvino_int8': 'openvino',
+}
+VALIDATION_CONF = 0.25
+VALIDATION_IOU = 0.5
+
+
+def runtime_available(fmt):
+    module = RUNTIME_MODULES.get(fmt)
+    return bool(module) and importlib.util.find_spec(module) is not None
+
+
+def _media_relative(path):
+    return os.path.relpath(str(path), settings.MEDIA_ROOT)
+
+
+def _media_absolute(rel_path):
+    return os.path.join(settings.MEDIA_ROOT, rel_path)
+
+
+def resolve_runtime_path(yolo_model):
+    """
+    Fastest validated artifact for this model, or the original .pt.
+    Only artifacts that beat the measured .pt latency are used.
+    """
+    artifacts = yolo_model.export_artifacts or {}
+    report = yolo_model.export_report or {}
+    results = report.get('formats', {})
+
+    candidates = []
+    for fmt, rel_path in artifacts.items():
+        info = results.get(fmt, {})
+        if not info.get('valid') and not ALLOW_UNVALIDATED:
+            continue
+        if fmt not in RUNTIME_PREFERENCE or not runtime_available(fmt):
+            continue
+        path = _media_absolute(rel_path)
+        if not os.path.exists(path):
+            continue
+        latency = info.get('latency_ms', float('inf'))
+        candidates.append((latency, RUNTIME_PREFERENCE.index(fmt), path))
+
+    if candidates:
+        latency, _, path = min(candidates)
+        pt_latency = report.get('pt_latency_ms')
+        if pt_latency is None or latency < pt_latency:
+            return path
+    return yolo_model.model_file.path
+
+
+def runtime_max_batch(yolo_model, path):
+    """
+    Largest batch the runtime at path accepts: None (no limit) for the .pt,
+    the validated max_batch for an artifact - 1 for artifacts exported
+    before batched validation (static batch 1).
+    """
+    if path == yolo_model.model_file.path:
+        return None
+    results = (yolo_model.export_report or {}).get('formats', {})
+    for fmt, rel_path in (yolo_model.export_artifacts or {}).items():
+        if _media_absolute(rel_path) == path:
+            return results.get(fmt, {}).get('max_batch', 1)
+    return 1
+
+
+def export_artifacts(pt_path, formats):
+    """
+    Export the .pt into each format (written beside the .pt by ultralytics).
+
+    Returns:
+        (artifacts, errors): {fmt: media-relative path}, {fmt: error message}
+    """
+    from ultralytics import YOLO
+
+    artifacts, errors = {}, {}
+    for fmt in formats:
+        try:
+            kwargs = {'imgsz': EXPORT_IMGSZ, 'dynamic': EXPORT_DYNAMIC}
+            if fmt == 'onnx':
+                kwargs['format'] = 'onnx'
+            elif fmt == 'openvino':
+                kwargs['format'] = 'openvino'
+            elif fmt == 'openvino_int8':
+                if not INT8_DATA:
+                    errors[fmt] = 'YOLO_EXPORT INT8_DATA (calibration dataset yaml) not configured'
+                    continue
+                kwargs.update(format='openvino', int8=True, data=INT8_DATA)
+            else:
+                errors[fmt] = f'Unsupported export format: {fmt}'
+                continue
+
+            # Fresh instance per export - export() mutates the wrapped model
+            exported = YOLO(pt_path).export(**kwargs)
+            artifacts[fmt] = _media_relative(exported)
+            logger.info(f"📦 Exported {os.path.basename(pt_path)} -> {fmt}: {exported}")
+        except Exception as e:
+            logger.error(f"❌ YOLO export to {fmt} failed: {e}")
+            errors[fmt] = str(e)
+    return artifacts, errors
+
+
+def sample_images(yolo_model, limit=VALIDATION_SAMPLES):
+    """Recent org images (vehicle checks first, then login frames) for validation."""
+    from core.models import VehicleComplianceRecord, LoginDetectionResult
+
+    paths = []
+    vehicle_records = VehicleComplianceRecord.objects.filter(
+        organization=yolo_model.organization
+    ).exclude(vehicle_image='').order_by('-timestamp')[:limit]
+    for record in vehicle_records:
+        if os.path.exists(record.vehicle_image.path):
+            paths.append(record.vehicle_image.path)
+
+    if len(paths) < limit:
+        login_frames = LoginDetectionResult.objects.filter(
+            organization=yolo_model.organization
+        ).exclude(frame_image='').order_by('-timestamp')[:limit - len(paths)]
+        for record in login_frames:
+            if record.frame_image and os.path.exists(record.frame_image.path):
+                paths.append(record.frame_image.path)
+    return paths
+
+
+def _result_boxes(result):
+    if result.boxes is None:
+        return []
+    return [
+        (int(cls_id), float(conf), xyxy)
+        for cls_id, conf, xyxy in zip(result.boxes.cls.tolist(), result.boxes.conf.tolist(), result.boxes.xyxy.tolist())
+    ]
+
+
+def _predict_boxes(model, images):
+    """Run a model over images. Returns (per-image boxes, mean latency ms)."""
+    model.predict(images[0], imgsz=EXPORT_IMGSZ, conf=VALIDATION_CONF, verbose=False)  # Warm-up
+
+    per_image, latencies = [], []
+    for path in images:
+        start = time.perf_counter()
+        results = model.predict(path, imgsz=EXPORT_IMGSZ, conf=VALIDATION_CONF, verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        per_image.append([box for r in results for box in _result_boxes(r)])
+    return per_image, sum(latencies) / len(latencies)
+
+
+def _predict_batch(model, images):
+    """Run a model over images in one batched call. Returns per-image boxes."""
+    results = model.predict(list(images), imgsz=EXPORT_IMGSZ, conf=VALIDATION_CONF, verbose=False, batch=len(images))
+    return [_result_boxes(r) for r in results]
+
+
+def compare_boxes(reference, candidate):
+    """
+    Greedy one-to-one matching (same class, IoU >= VALIDATION_IOU).
+
+    Returns:
+        (matched, confidence deltas of matched pairs)
+    """
+    used = set()
+    deltas = []
+    for cls_id, conf, box in sorted(reference, key=lambda b: -b[1]):
+        best, best_iou = None, VALIDATION_IOU
+        for j, (other_cls, _, other_box) in enumerate(candidate):
+            if j in used or other_cls != cls_id:
+                continue
+            iou = bbox_iou(box, other_box)
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            used.add(best)
+            deltas.append(abs(conf - candidate[best][1]))
+    return len(deltas), deltas
+
+
+def validate_artifact(reference, candidate):
+    """Agreement metrics of an exported runtime vs the .pt over all samples."""
+    ref_total = sum(len(b) for b in reference)
+    cand_total = sum(len(b) for b in candidate)
+    matched, deltas = 0, []
+    for ref_boxes, cand_boxes in zip(reference, candidate):
+        m, d = compare_boxes(ref_boxes, cand_boxes)
+        matched += m
+        deltas.extend(d)
+
+    recall = matched / ref_total if ref_total else 1.0
+    precision = matched / cand_total if cand_total else 1.0
+    mean_delta = sum(deltas) / len(deltas) if deltas else 0.0
+    return {
+        'reference_boxes': ref_total,
+        'candidate_boxes': cand_total,
+        'matched': matched,
+        'recall': round(recall, 4),
+        'precision': round(precision, 4),
+        'mean_conf_delta': round(mean_delta, 4),
+        'valid': recall >= MIN_MATCH_RATE and precision >= MIN_MATCH_RATE and mean_delta <= MAX_CONF_DELTA,
+    }
+
+
+def export_and_validate(yolo_model, formats=None):
+    """
+    Full post-processing for one CustomYoloModel.
+    Status/artifacts/report are written with .update() so the detection
+    profile version (updated_at) is not bumped.
+    """
+    from ultralytics import YOLO
+    from core.models import CustomYoloModel
+
+    formats = formats or EXPORT_FORMATS
+    pt_path = yolo_model.model_file.path
+    CustomYoloModel.objects.filter(pk=yolo_model.pk).update(export_status='running')
+
+    artifacts, errors = export_artifacts(pt_path, formats)
+    report = {
+        'exported_at': timezone.now().isoformat(),
+        'imgsz': EXPORT_IMGSZ,
+        'dynamic': EXPORT_DYNAMIC,
+        'errors': errors,
+        'formats': {},
+    }
+
+    samples = sample_images(yolo_model)
+    report['samples'] = len(samples)
+
+    if artifacts and samples:
+        reference, pt_latency = _predict_boxes(YOLO(pt_path), samples)
+        report['pt_latency_ms'] = round(pt_latency, 1)
+
+        for fmt, rel_path in artifacts.items():
+            try:
+                candidate_model = YOLO(_media_absolute(rel_path), task='detect')
+                candidate, latency = _predict_boxes(candidate_model, samples)
+                metrics = validate_artifact(reference, candidate)
+                metrics['latency_ms'] = round(latency, 1)
+                metrics['max_batch'] = 1
+                if EXPORT_DYNAMIC and len(samples) > 1:
+                    # Callers batch (detect_batch, tiled crops): the batched graph has to agree as well
+                    batch_samples = samples[:VALIDATION_BATCH]
+                    try:
+                        batch = validate_artifact(reference[:len(batch_samples)], _predict_batch(candidate_model, batch_samples))
+                    except Exception as e:
+                        batch = {'valid': False, 'error': str(e)}
+                    metrics['batch'] = batch
+                    metrics['valid'] = metrics['valid'] and batch['valid']
+                    metrics['max_batch'] = len(batch_samples) if batch['valid'] else 1
+            except Exception as e:
+                metrics = {'valid': False, 'error': str(e)}
+            report['formats'][fmt] = metrics
+            logger.info(f"🔍 {fmt} vs .pt: {metrics}")
+
+    if any(m.get('valid') for m in report['formats'].values()):
+        status = 'ready'
+    elif artifacts and not samples:
+        status = 'unvalidated'  # No org images yet - re-run the export later
+    else:
+        status = 'failed'
+
+    CustomYoloModel.objects.filter(pk=yolo_model.pk).update(
+        export_status=status,
+        export_artifacts=artifacts,
+        export_report=report,
+    )
+    logger.info(f"✅ YOLO export finished for {yolo_model.name}: {status}")
+    return {'success': status != 'failed', 'status': status, 'artifacts': artifacts, 'report': report}
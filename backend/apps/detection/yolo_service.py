@@ -3,8 +3,10 @@ YOLO Detection Service
 Handles loading and running custom YOLO models uploaded by admins.
 """
 import os
+import threading
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,6 +27,16 @@ class YoloDetectionService:
     
     def __init__(self):
         self._loaded_models: Dict[str, YOLO] = {}
+        # Ultralytics predictors are not thread-safe (gthread workers share this service)
+        self._model_locks: Dict[str, threading.Lock] = {}
+        self._load_lock = threading.Lock()
+        # model_id -> {lowercase class name: class id}, built once at load
+        self._name_index: Dict[str, Dict[str, int]] = {}
+        # model_id -> file actually loaded (.pt or exported runtime)
+        self._loaded_paths: Dict[str, str] = {}
+        self._failed_paths = set()
+        # model_id -> largest batch the loaded runtime accepts (None = any)
+        self._max_batch: Dict[str, Optional[int]] = {}
     
     def load_model(self, model_path: str, model_id: str) -> bool:
         """
@@ -42,14 +54,57 @@ class YoloDetectionService:
             return False
             
         try:
-            if model_id not in self._loaded_models:
-                self._loaded_models[model_id] = YOLO(model_path)
-                logger.info(f"Loaded YOLO model: {model_id}")
+            with self._load_lock:
+                if model_id not in self._loaded_models:
+                    # Exported artifacts (.onnx / OpenVINO dir) need the task spelled out
+                    task = None if str(model_path).endswith('.pt') else 'detect'
+                    model = YOLO(model_path, task=task)
+                    self._loaded_models[model_id] = model
+                    self._loaded_paths[model_id] = str(model_path)
+                    # Exported graphs may be static batch 1 unless load_custom_model knows better
+                    self._max_batch[model_id] = None if task is None else 1
+                    self._model_locks[model_id] = threading.Lock()
+                    self._name_index[model_id] = {
+                        name.lower(): idx for idx, name in model.names.items()
+                    }
+                    logger.info(f"Loaded YOLO model: {model_id}")
             return True
         except Exception as e:
             logger.error(f"Failed to load YOLO model: {e}")
             return False
     
+    def load_custom_model(self, yolo_model) -> bool:
+        """
+        Load a CustomYoloModel with its fastest validated runtime
+        (ONNX / OpenVINO export), falling back to the original .pt.
+        
+        Returns:
+            True if loaded successfully (model id = str(yolo_model.id))
+        """
+        from .yolo_export import resolve_runtime_path, runtime_max_batch
+        
+        model_id = str(yolo_model.id)
+        pt_path = yolo_model.model_file.path
+        model_path = resolve_runtime_path(yolo_model)
+        if model_path in self._failed_paths:
+            model_path = pt_path
+        
+        # A faster artifact became ready (or was withdrawn) since we loaded
+        loaded_path = self._loaded_paths.get(model_id)
+        if loaded_path and loaded_path != model_path:
+            self.unload_model(model_id)
+        
+        if model_path != pt_path:
+            newly_loaded = model_id not in self._loaded_models
+            if self.load_model(model_path, model_id):
+                if newly_loaded:
+                    self._max_batch[model_id] = runtime_max_batch(yolo_model, model_path)
+                return True
+            logger.warning(f"Exported runtime failed for {model_id}, falling back to .pt")
+            self._failed_paths.add(model_path)
+        
+        return self.load_model(pt_path, model_id)
+    
     def get_model_classes(self, model_path: str) -> List[str]:
         """
         Extract the class names from a YOLO model.
@@ -73,21 +128,97 @@ class YoloDetectionService:
             logger.error(f"Failed to get model classes: {e}")
             return []
     
+    def get_name_index(self, model_id: str) -> Dict[str, int]:
+        """{lowercase class name: class id} for a loaded model."""
+        return self._name_index.get(model_id, {})
+    
+    def get_class_ids(self, model_id: str, class_names: List[str]) -> List[int]:
+        """Class ids for the given names (unknown names are skipped)."""
+        index = self.get_name_index(model_id)
+        return [index[c.lower()] for c in class_names if c.lower() in index]
+    
+    def get_loaded_path(self, model_id: str) -> Optional[str]:
+        """File actually loaded for a model (.pt or exported runtime)."""
+        return self._loaded_paths.get(model_id)
+    
+    def max_batch(self, model_id: str) -> Optional[int]:
+        """Largest batch the loaded runtime accepts (None = any)."""
+        return self._max_batch.get(model_id)
+    
+    @staticmethod
+    def _read_image(image):
+        """Decode a path up front, so a missing or unreadable file is not blamed on the runtime."""
+        if isinstance(image, (str, Path)):
+            import cv2
+            decoded = cv2.imread(str(image))
+            if decoded is None:
+                raise ValueError(f"Unreadable image: {image}")
+            return decoded
+        return image
+    
+    def _loaded(self, model_id: str):
+        """(model, lock, path) of a loaded model; callers keep them, so unload_model can't pull them mid-run."""
+        with self._load_lock:
+            model = self._loaded_models.get(model_id)
+            if model is None:
+                return None
+            return model, self._model_locks[model_id], self._loaded_paths.get(model_id)
+    
+    def _run(self, image, model_id: str, class_ids: List[int] = None, drop_failed: bool = True, **kwargs):
+        """
+        Run the loaded model on decoded images. Only errors raised by the
+        model call itself count against an exported runtime (drop_failed).
+        """
+        if isinstance(image, (list, tuple)):
+            image = [self._read_image(i) for i in image]
+        else:
+            image = self._read_image(image)
+        loaded = self._loaded(model_id) if YOLO_AVAILABLE else None
+        if loaded is None:
+            raise RuntimeError(f"YOLO model {model_id} not loaded")
+        model, lock, path = loaded
+        try:
+            with lock:
+                return model(image, verbose=False, classes=class_ids or None, **kwargs)
+        except Exception:
+            if drop_failed:
+                self._drop_failed_runtime(model_id, path)
+            raise
+    
+    def predict(self, image, model_id: str, class_ids: List[int] = None, **kwargs):
+        """
+        Run the loaded model and return the raw Ultralytics results
+        (for callers that need plot() etc.).
+        """
+        if not YOLO_AVAILABLE or model_id not in self._loaded_models:
+            return []
+        return self._run(image, model_id, class_ids=class_ids, **kwargs)
+    
+    def _drop_failed_runtime(self, model_id: str, path: Optional[str]) -> None:
+        """An exported runtime failed at inference: unload it so the next load uses the .pt."""
+        if path and not path.endswith('.pt'):
+            logger.warning(f"Exported runtime {path} failed, falling back to .pt")
+            self._failed_paths.add(path)
+            if self._loaded_paths.get(model_id) == path:  # Not already replaced by another request
+                self.unload_model(model_id)
+    
     def detect(
         self, 
         image_path: str, 
         model_id: str, 
         confidence_threshold: float = 0.5,
-        allowed_classes: List[str] = None
+        allowed_classes: List[str] = None,
+        class_ids: List[int] = None
     ) -> Dict[str, bool]:
         """
         Run detection on an image.
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file (or a decoded BGR array)
             model_id: ID of the loaded model to use
             confidence_threshold: Minimum confidence for detection
             allowed_classes: Optional list of class names to detect. If None, detects all.
+            class_ids: Optional precomputed ids for allowed_classes (DetectionProfile)
             
         Returns:
             Dict mapping class names to whether they were detected
@@ -101,25 +232,21 @@ class YoloDetectionService:
             return {}
             
         try:
-            model = self._loaded_models[model_id]
-            
             # Get class IDs to filter if allowed_classes is provided
-            class_ids = None
-            if allowed_classes:
-                class_ids = []
-                for idx, name in model.names.items():
-                    if name.lower() in [c.lower() for c in allowed_classes]:
-                        class_ids.append(idx)
+            if allowed_classes and class_ids is None:
+                class_ids = self.get_class_ids(model_id, allowed_classes)
                 logger.info(f"Filtering to classes: {allowed_classes} -> IDs: {class_ids}")
+            if allowed_classes and not class_ids:
+                return {cls: False for cls in allowed_classes}  # None of them is a class of this model
             
             # Run detection with optional class filtering
-            results = model(image_path, verbose=False, classes=class_ids)
+            results = self._run(image_path, model_id, class_ids=class_ids)
             
             # Get detected classes from results
             if allowed_classes:
                 detections = {cls: False for cls in allowed_classes}
             else:
-                all_classes = list(model.names.values()) if hasattr(model, 'names') else []
+                all_classes = list(results[0].names.values()) if results else []
                 detections = {cls: False for cls in all_classes}
             
             # Mark detected classes as True
@@ -129,7 +256,7 @@ class YoloDetectionService:
                         conf = float(box.conf[0])
                         if conf >= confidence_threshold:
                             cls_id = int(box.cls[0])
-                            cls_name = model.names[cls_id]
+                            cls_name = result.names[cls_id]
                             detections[cls_name] = True
             
             return detections
@@ -143,13 +270,16 @@ class YoloDetectionService:
         image_path: str, 
         model_id: str, 
         confidence_threshold: float = 0.5,
-        allowed_classes: List[str] = None
+        allowed_classes: List[str] = None,
+        class_ids: List[int] = None
     ) -> List[Dict]:
         """
         Run detection and return detailed results with bounding boxes.
         
         Args:
+            image_path: Path to the image file (or a decoded BGR array)
             allowed_classes: Optional list of class names to detect. If None, detects all.
+            class_ids: Optional precomputed ids for allowed_classes (DetectionProfile)
         
         Returns:
             List of detections with class, confidence, and bounding box
@@ -158,18 +288,14 @@ class YoloDetectionService:
             return []
             
         try:
-            model = self._loaded_models[model_id]
-            
             # Get class IDs to filter if allowed_classes is provided
-            class_ids = None
-            if allowed_classes:
-                class_ids = []
-                for idx, name in model.names.items():
-                    if name.lower() in [c.lower() for c in allowed_classes]:
-                        class_ids.append(idx)
+            if allowed_classes and class_ids is None:
+                class_ids = self.get_class_ids(model_id, allowed_classes)
+            if allowed_classes and not class_ids:
+                return []
             
             # Run detection with optional class filtering
-            results = model(image_path, verbose=False, classes=class_ids)
+            results = self._run(image_path, model_id, class_ids=class_ids)
             
             detections = []
             for result in results:
@@ -178,7 +304,7 @@ class YoloDetectionService:
                         conf = float(box.conf[0])
                         if conf >= confidence_threshold:
                             cls_id = int(box.cls[0])
-                            cls_name = model.names[cls_id]
+                            cls_name = result.names[cls_id]
                             bbox = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
                             detections.append({
                                 'class': cls_name,
@@ -192,11 +318,74 @@ class YoloDetectionService:
             logger.error(f"Detection failed: {e}")
             return []
     
+    def detect_batch(
+        self,
+        images: Iterable,
+        model_id: str,
+        batch_size: int = 8,
+        confidence_threshold: float = 0.25,
+        class_ids: List[int] = None,
+        imgsz: int = None
+    ) -> Iterator[List[Dict]]:
+        """
+        Run detection over many images, batch_size at a time.
+        
+        Images (paths or decoded BGR arrays) are consumed lazily, so at most
+        one batch is decoded in memory at once - pass a generator to stream.
+        
+        batch_size is capped at what the loaded runtime accepts (max_batch).
+        When a batched call fails anyway, the batch is re-run one image at a
+        time and the runtime is limited to batch 1; a single-image failure
+        drops an exported runtime (next load uses the .pt) and raises.
+        
+        Yields:
+            One list of {'class', 'confidence', 'bbox'} per input image, in order
+        """
+        if not YOLO_AVAILABLE or model_id not in self._loaded_models:
+            return
+        
+        kwargs = {'conf': confidence_threshold}
+        if imgsz:
+            kwargs['imgsz'] = imgsz
+        
+        iterator = iter(images)
+        while True:
+            batch = list(islice(iterator, min(batch_size, self.max_batch(model_id) or batch_size)))
+            if not batch:
+                return
+            if len(batch) == 1:
+                results = self.predict(batch, model_id, class_ids=class_ids, **kwargs)
+            else:
+                try:
+                    results = self._run(batch, model_id, class_ids=class_ids, drop_failed=False, batch=len(batch), **kwargs)
+                except Exception as e:
+                    logger.warning(f"Batched YOLO inference failed for {model_id} ({e}), running one image at a time")
+                    self._max_batch[model_id] = 1
+                    results = [r for image in batch for r in self.predict([image], model_id, class_ids=class_ids, **kwargs)]
+            for result in results:
+                detections = []
+                if result.boxes is not None:
+                    names = result.names
+                    for cls_id, conf, bbox in zip(
+                        result.boxes.cls.tolist(), result.boxes.conf.tolist(), result.boxes.xyxy.tolist()
+                    ):
+                        detections.append({
+                            'class': names[int(cls_id)],
+                            'confidence': round(float(conf), 3),
+                            'bbox': bbox
+                        })
+                yield detections
+    
     def unload_model(self, model_id: str) -> None:
-        """Remove a model from cache."""
-        if model_id in self._loaded_models:
-            del self._loaded_models[model_id]
-            logger.info(f"Unloaded YOLO model: {model_id}")
+        """Remove a model from cache (requests already running keep their reference)."""
+        with self._load_lock:
+            if model_id in self._loaded_models:
+                del self._loaded_models[model_id]
+                self._model_locks.pop(model_id, None)
+                self._name_index.pop(model_id, None)
+                self._loaded_paths.pop(model_id, None)
+                self._max_batch.pop(model_id, None)
+                logger.info(f"Unloaded YOLO model: {model_id}")
 
 
 # Singleton instance
@@ -204,8 +393,16 @@ _yolo_service: Optional[YoloDetectionService] = None
 
 
 def get_yolo_service() -> YoloDetectionService:
-    """Get the singleton YOLO service instance."""
+    """
+    Get the singleton YOLO service instance
+    (a RemoteYoloService proxy when the inference server is enabled).
+    """
     global _yolo_service
+    from .inference_client import remote_yolo_service
+    remote = remote_yolo_service()
+    if remote is not None:
+        return remote
+    
     if _yolo_service is None:
         _yolo_service = YoloDetectionService()
     return _yolo_service
@@ -9,33 +9,62 @@ from pathlib import Path
 from django.conf import settings
 import numpy as np
 import cv2
+from .detection_profiles import det_size, detect_faces as detect_profiled, get_faces
+from .embedding_versions import serving_pack, serving_tag
+from services.embedding_events import GLOBAL, on_change, publish_change, ensure_listening
 
 logger = logging.getLogger(__name__)
 
-# Lazy import InsightFace
-_insightface_app = None
+# Lazy import InsightFace - one FaceAnalysis per model pack
+_insightface_apps = {}
 
-def get_insightface_app():
-    global _insightface_app
-    if _insightface_app is None:
+def get_insightface_app(pack=None):
+    """
+    Prepared FaceAnalysis for a model pack (default: the serving embedding
+    version, see apps/faces/embedding_versions.py).
+    """
+    serving = serving_pack()
+    pack = pack or serving
+    if pack == serving:
+        # Models live in the inference server when it is enabled (thin API workers)
+        from apps.detection.inference_client import remote_face_analysis
+        remote = remote_face_analysis()
+        if remote is not None:
+            return remote
+    
+    if pack not in _insightface_apps:
         try:
             import insightface
             from insightface.app import FaceAnalysis
             
-            # Use 'buffalo_l' model (best accuracy)
             # OPTIMIZED: Only load detection & recognition (Skip gender/age/landmark_2d_106)
             app = FaceAnalysis(
-                name='buffalo_l', 
+                name=pack, 
                 allowed_modules=['detection', 'recognition'],
                 providers=['CPUExecutionProvider']
             )
-            app.prepare(ctx_id=0, det_size=(640, 640))
-            _insightface_app = app
-            logger.info("✅ InsightFace (buffalo_l) loaded successfully!")
+            app.prepare(ctx_id=0, det_size=(det_size(), det_size()))
+            app.pack = pack  # Per-size detectors (detection_profiles.SEPARATE_MODELS) load the same pack
+            # Concurrent requests share ArcFace runs (apps/faces/embedding_batcher.py)
+            from .embedding_batcher import enable_batching
+            _insightface_apps[pack] = enable_batching(app)
+            logger.info(f"✅ InsightFace ({pack}) loaded successfully!")
         except Exception as e:
             logger.error(f"❌ Failed to load InsightFace: {e}")
             raise e
-    return _insightface_app
+    return _insightface_apps[pack]
+
+
+def _on_engine_changed(org_code, model_type):
+    """After a version switch (or missed events) drop packs that are no longer served."""
+    if org_code is None and _insightface_apps:
+        serving = serving_pack()
+        for pack in list(_insightface_apps):
+            if pack != serving:
+                _insightface_apps.pop(pack, None)
+
+
+on_change(_on_engine_changed)
 
 
 class DeepFaceService:
@@ -62,6 +91,7 @@ class DeepFaceService:
         self.images_dir = self.embeddings_dir / 'images'
         self.images_dir.mkdir(exist_ok=True)
         self._embeddings_cache = None
+        on_change(self._on_embeddings_changed, local=False)
         
         # Pre-load model
         try:
@@ -71,6 +101,7 @@ class DeepFaceService:
             
     def _load_embeddings(self):
         """Load embeddings from JSON file."""
+        ensure_listening()
         if self._embeddings_cache is not None:
             return self._embeddings_cache
             
@@ -90,6 +121,12 @@ class DeepFaceService:
         self._embeddings_cache = embeddings
         with open(self.embeddings_file, 'w') as f:
             json.dump(embeddings, f, indent=2)
+        # Other workers re-read the file on next use
+        publish_change(GLOBAL, 'insightface')
+
+    def _on_embeddings_changed(self, org_code, model_type):
+        if org_code in (None, GLOBAL):
+            self._embeddings_cache = None
 
     def check_liveness(self, image_path):
         """
@@ -139,7 +176,7 @@ class DeepFaceService:
                 'reason': f'Liveness check failed: {str(e)}'
             }
 
-    def check_face_pose(self, image_path):
+    def check_face_pose(self, image_path, profile='checkin'):
         """
         Check if face is frontal using InsightFace landmarks.
         InsightFace is very robust, but we still want to avoid extreme profiles.
@@ -150,7 +187,7 @@ class DeepFaceService:
             if img is None:
                 return {'is_frontal': False, 'error': 'Could not load image'}
             
-            faces = app.get(img)
+            faces = get_faces(app, img, profile)
             
             if len(faces) == 0:
                 return {'is_frontal': False, 'error': 'No face detected'}
@@ -205,7 +242,7 @@ class DeepFaceService:
             logger.warning(f"Pose check warning: {e}")
             return {'is_frontal': True, 'yaw': 0, 'pitch': 0, 'error': None}
 
-    def process_face(self, image_path):
+    def process_face(self, image_path, profile='checkin'):
         """
         Optimized single-pass method to get both Pose and Embedding.
         Avoids redundant inference calls.
@@ -217,7 +254,7 @@ class DeepFaceService:
                 return {'success': False, 'error': 'Could not load image'}
             
             # Single Inference Call (Expensive)
-            faces = app.get(img)
+            faces = get_faces(app, img, profile)
             
             if not faces:
                 return {'success': False, 'error': 'No face detected'}
@@ -270,18 +307,24 @@ class DeepFaceService:
             logger.error(f"Process face error: {e}")
             return {'success': False, 'error': str(e)}
 
-    def get_embedding(self, image_path):
+    def get_embedding(self, image_path, profile='default', pack=None, raise_errors=False):
         """
         Generate embedding using InsightFace.
         Returns 512D normalized vector.
+
+        Args:
+            profile: Detection profile (apps/faces/detection_profiles.py), e.g. 'checkin'
+            pack: InsightFace model pack (default: serving version; re-embedding jobs pass the target)
+            raise_errors: Raise model errors instead of returning None, so callers
+                that cache results (embedding manifest) can tell them from "no face"
         """
         try:
-            app = get_insightface_app()
+            app = get_insightface_app(pack)
             img = cv2.imread(image_path)
             if img is None:
                 return None
                 
-            faces = app.get(img)
+            faces = get_faces(app, img, profile)
             if not faces:
                 return None
                 
@@ -297,10 +340,12 @@ class DeepFaceService:
             return embedding.tolist()
             
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error(f"InsightFace embedding error: {e}")
             return None
 
-    def get_all_embeddings(self, image_path):
+    def get_all_embeddings(self, image_path, profile='kiosk'):
         """Get embeddings for all faces."""
         try:
             app = get_insightface_app()
@@ -308,7 +353,7 @@ class DeepFaceService:
             if img is None:
                 return []
             
-            faces = app.get(img)
+            faces = get_faces(app, img, profile)
             results = []
             for face in faces:
                 # Normalize
@@ -332,6 +377,28 @@ class DeepFaceService:
             logger.error(f"Get all embeddings error: {e}")
             return []
 
+    def detect_faces(self, img, profile='kiosk'):
+        """
+        Detection only (no recognition) on a decoded BGR image.
+        Returns InsightFace Face objects without embeddings; pass them to
+        embed_face() only for the faces that actually need identifying.
+        """
+        return detect_profiled(get_insightface_app(), img, profile)
+
+    def embed_face(self, img, face):
+        """Run ArcFace recognition for one face from detect_faces(). Returns normalized list."""
+        try:
+            app = get_insightface_app()
+            app.models['recognition'].get(img, face)
+            emb = face.embedding
+            n = np.linalg.norm(emb)
+            if n > 0:
+                emb = emb / n
+            return emb.tolist()
+        except Exception as e:
+            logger.error(f"Embed face error: {e}")
+            return None
+
     def _calculate_quality(self, image_path):
         """Use detection score as quality metric."""
         try:
@@ -339,7 +406,7 @@ class DeepFaceService:
             img = cv2.imread(image_path)
             if img is None: return 0
             
-            faces = app.get(img)
+            faces = get_faces(app, img, 'training')
             if faces:
                 return float(faces[0].det_score) # Conf score (0.0 - 1.0)
             return 0.0
@@ -375,7 +442,7 @@ class DeepFaceService:
                 img = cv2.imread(path_str)
                 if img is None: continue
                 
-                faces = app.get(img)
+                faces = get_faces(app, img, 'training')
                 if faces:
                     face = faces[0] # Largest
                     emb = face.embedding
@@ -406,10 +473,9 @@ class DeepFaceService:
         # Sort by quality
         embeddings_with_quality.sort(key=lambda x: x['quality_score'], reverse=True)
         
-        # Select best N (limit to 10 for InsightFace, it's very consistent)
-        best_count = min(10, len(embeddings_with_quality))
-        # TODO: Add diversity selection if needed, but quality is king here
-        selected = embeddings_with_quality[:best_count]
+        # Best quality first, minus near-duplicates, at most 10 spread over poses/lighting
+        # (InsightFace is very consistent)
+        selected, selection = self._select_diverse_embeddings(embeddings_with_quality, count=10)
         
         active_vectors = [e['vector'] for e in selected]
         all_vectors = [e['vector'] for e in embeddings_with_quality]
@@ -421,7 +487,7 @@ class DeepFaceService:
             'person_name': person_name,
             'embeddings': active_vectors,
             'count': len(active_vectors),
-            'model': self.MODEL_NAME,
+            'model': serving_tag(),
             'trained_at': str(np.datetime64('now'))
         }
         self._save_embeddings(all_embeddings)
@@ -432,13 +498,28 @@ class DeepFaceService:
             'person_name': person_name,
             'active_embeddings': active_vectors,
             'active_count': len(active_vectors),
+            'all_embeddings': all_vectors,
+            'all_count': len(all_vectors),
+            'selection': selection,
+            'model': serving_tag(),
             'success': True
         }
 
     # Helper for diversity
     def _select_diverse_embeddings(self, embeddings_with_quality, count=7):
-        # Placeholder compatibility
-        return embeddings_with_quality[:count]
+        """
+        Diverse subset of [{'vector', 'quality_score'}] (see apps/faces/embedding_selection.py).
+
+        Returns:
+            (selected entries, selection report)
+        """
+        from .embedding_selection import select_diverse_embeddings
+        kept, report = select_diverse_embeddings(
+            [e['vector'] for e in embeddings_with_quality],
+            quality=[e['quality_score'] for e in embeddings_with_quality],
+            max_count=count
+        )
+        return [embeddings_with_quality[i] for i in kept], report
     
     # Instance accessor
     def get_trained_persons(self):
@@ -99,6 +99,7 @@ class DeepFaceTrainView(APIView):
                 'archived_embeddings': result['all_count'],
                 'active_embeddings': result['active_count'],
                 'model': result['model'],
+                'selection': result['selection'],
                 'message': f'Enrolled with {result["active_count"]} active embeddings (from {result["all_count"]} total)'
             })
             
@@ -0,0 +1,102 @@
+"""
+Face Detection Profiles
+RetinaFace/SCRFD cost grows with the input area: 320x320 is ~4x cheaper than
+640x640. A driver check-in frame holds one large, close face, so it is
+detected at 320; the multi-face kiosk and enrollment keep 640.
+
+Two-stage: when the small pass finds nothing, the frame is detected again at
+FALLBACK_SIZE, so distant faces still get a chance.
+
+The InsightFace pack detectors (buffalo_l) have a dynamic input shape, so
+one prepared model serves every size (input_size is passed per call). SEPARATE_MODELS prepares
+a detection-only FaceAnalysis of the app's pack per size instead - for
+runtimes/exports with a fixed input shape.
+
+Profiles (FACE_DETECTION['PROFILES']):
+    checkin   single face expected (driver / employee check-in)
+    kiosk     several faces per frame (live preview)
+    training  enrollment images
+    default   everything else
+"""
+import threading
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FACE_DETECTION', {})
+PROFILES = _config.get('PROFILES', {'default': 640})
+FALLBACK_SIZE = _config.get('FALLBACK_SIZE', 640)
+SEPARATE_MODELS = _config.get('SEPARATE_MODELS', False)
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def det_size(profile=None):
+    """Square detection input side for a profile (unknown profiles use 'default')."""
+    return PROFILES.get(profile or 'default', PROFILES.get('default', 640))
+
+
+def _prepared_detector(pack, size):
+    """Detection-only model of a pack prepared at (size, size), one per pack and size."""
+    key = (pack, size)
+    detector = _detectors.get(key)
+    if detector is None:
+        with _detectors_lock:
+            detector = _detectors.get(key)
+            if detector is None:
+                from insightface.app import FaceAnalysis
+
+                app = FaceAnalysis(name=pack, allowed_modules=['detection'], providers=['CPUExecutionProvider'])
+                app.prepare(ctx_id=0, det_size=(size, size))
+                detector = _detectors[key] = app.det_model
+                logger.info(f"✅ Face detector ({pack}) prepared at {size}x{size}")
+    return detector
+
+
+def detect_at(app, img, size, max_num=0):
+    """(bboxes, kpss) at one input size."""
+    if SEPARATE_MODELS and not getattr(app, 'remote', False):
+        pack = getattr(app, 'pack', None)
+        if pack is None:
+            from .embedding_versions import serving_pack
+            pack = serving_pack()
+        return _prepared_detector(pack, size).detect(img, max_num=max_num, metric='default')
+    return app.det_model.detect(img, input_size=(size, size), max_num=max_num, metric='default')
+
+
+def detect(app, img, profile=None, max_num=0):
+    """
+    (bboxes, kpss) at the profile's size, re-run at FALLBACK_SIZE if nothing was found.
+    """
+    size = det_size(profile)
+    bboxes, kpss = detect_at(app, img, size, max_num)
+    if bboxes.shape[0] == 0 and size < FALLBACK_SIZE:
+        logger.debug(f"No face at {size}px ({profile}), retrying at {FALLBACK_SIZE}px")
+        bboxes, kpss = detect_at(app, img, FALLBACK_SIZE, max_num)
+    return bboxes, kpss
+
+
+def detect_faces(app, img, profile=None, max_num=0):
+    """Face objects (bbox, kps, det_score) without embeddings."""
+    from insightface.app.common import Face
+
+    bboxes, kpss = detect(app, img, profile, max_num)
+    return [
+        Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        for i in range(bboxes.shape[0])
+    ]
+
+
+def get_faces(app, img, profile=None, max_num=0):
+    """FaceAnalysis.get() with profile-sized detection: detected faces with embeddings."""
+    if getattr(app, 'remote', False):
+        # One round trip - the server runs this same function
+        return app.get(img, max_num=max_num, profile=profile)
+
+    faces = detect_faces(app, img, profile, max_num)
+    recognizer = app.models['recognition']
+    for face in faces:
+        recognizer.get(img, face)
+    return faces
@@ -0,0 +1,110 @@
+"""
+ArcFace Micro-Batching
+At shift start dozens of check-ins arrive at once, each running the
+recognition model on a single aligned 112x112 crop. BatchedRecognizer
+replaces app.models['recognition'] in the shared FaceAnalysis: callers align
+their face on their own thread, hand the crop to one batcher thread and wait
+on a Future; the batcher collects crops for up to WINDOW_MS (or MAX_BATCH)
+and runs them through the ONNX session in one call.
+
+Inside the inference server (apps/detection/inference_server.py) the same
+FaceAnalysis serves every API worker, so crops from all workers share batches.
+"""
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FACE_EMBEDDING_BATCH', {})
+ENABLED = _config.get('ENABLED', True)
+WINDOW_MS = _config.get('WINDOW_MS', 3)
+MAX_BATCH = _config.get('MAX_BATCH', 16)
+
+
+class EmbeddingBatcher:
+    """Runs aligned face crops submitted from any thread in shared batches."""
+
+    def __init__(self, recognizer, window_ms=WINDOW_MS, max_batch=MAX_BATCH):
+        self.recognizer = recognizer
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name='arcface-batcher', daemon=True).start()
+
+    def submit(self, aligned):
+        """Queue one aligned crop; the Future resolves to its raw (unnormalized) embedding."""
+        future = Future()
+        self._queue.put((aligned, future))
+        return future
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(jobs)
+
+    def _run_batch(self, jobs):
+        try:
+            features = self.recognizer.get_feat([aligned for aligned, _ in jobs])
+            for (_, future), feature in zip(jobs, features):
+                future.set_result(np.asarray(feature).flatten())
+        except Exception as e:
+            logger.error(f"ArcFace batch of {len(jobs)} failed: {e}")
+            for _, future in jobs:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class BatchedRecognizer:
+    """Drop-in for insightface's ArcFaceONNX whose get() goes through an EmbeddingBatcher."""
+
+    def __init__(self, recognizer, batcher=None):
+        self.recognizer = recognizer
+        self.batcher = batcher or EmbeddingBatcher(recognizer)
+
+    def __getattr__(self, name):
+        # taskname, input_size, session, get_feat, ... of the wrapped model
+        return getattr(self.recognizer, name)
+
+    def get(self, img, face):
+        from insightface.utils import face_align
+
+        aligned = face_align.norm_crop(img, landmark=face.kps, image_size=self.recognizer.input_size[0])
+        face.embedding = self.batcher.submit(aligned).result()
+        return face.embedding
+
+
+def supports_batching(recognizer):
+    """False for recognition models exported with a fixed batch size of 1."""
+    try:
+        batch_dim = recognizer.session.get_inputs()[0].shape[0]
+    except Exception:
+        return False
+    return not isinstance(batch_dim, int) or batch_dim > 1
+
+
+def enable_batching(app):
+    """Route the FaceAnalysis' recognition calls through a shared batcher (idempotent)."""
+    recognizer = app.models.get('recognition')
+    if not ENABLED or recognizer is None or isinstance(recognizer, BatchedRecognizer):
+        return app
+    if not supports_batching(recognizer):
+        logger.info("ℹ️ ArcFace model has a fixed batch size, micro-batching disabled")
+        return app
+
+    app.models['recognition'] = BatchedRecognizer(recognizer)
+    logger.info(f"✅ ArcFace micro-batching enabled (window {WINDOW_MS}ms, max {MAX_BATCH})")
+    return app
@@ -0,0 +1,176 @@
+"""
+Per-Image Embedding Manifest
+Retraining used to run InsightFace over every image in
+media/employee_faces/<org>/<employee>/, although most were embedded before -
+by CaptureImagesView when they were stored, or by the previous training.
+
+Each image directory has a manifest under FACE_EMBEDDING_MANIFEST['ROOT'],
+at the directory's path relative to MEDIA_ROOT + '.json' (kept out of the
+media root, which is served publicly):
+    {'images': {'0001.jpg': {'sha1': ..., 'model': ..., 'embedding': [...] or None}}}
+
+embed_images() reuses an entry when the file's content hash and the
+embedding model version both match, and only runs the model for new or
+changed images (embedding None records "no face", so those are not retried
+either). embed() raises on errors (model load, inference); those images are
+skipped for this run and not recorded, so the next training retries them.
+Entries of deleted images are pruned.
+"""
+import os
+import json
+import hashlib
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FACE_EMBEDDING_MANIFEST', {})
+MANIFEST_ROOT = _config.get('ROOT', os.path.join(settings.BASE_DIR, 'embedding_manifests'))
+LEGACY_MANIFEST_NAME = '.embeddings.json'  # Former location, inside the image directory
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def model_version():
+    """Id of the embeddings the training path produces: serving model version + training detection size."""
+    from .detection_profiles import det_size
+    from .embedding_versions import serving_tag
+    return f"{serving_tag()}@{det_size('training')}"
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def manifest_path(images_dir):
+    """Manifest file of an image directory (directories outside MEDIA_ROOT are keyed by a hash of their path)."""
+    images_dir = os.path.abspath(images_dir)
+    relative = os.path.relpath(images_dir, os.path.abspath(settings.MEDIA_ROOT))
+    if relative.startswith(os.pardir):
+        relative = os.path.join('external', hashlib.sha1(images_dir.encode()).hexdigest())
+    return os.path.join(MANIFEST_ROOT, f"{relative}.json")
+
+
+def load_manifest(images_dir):
+    path = manifest_path(images_dir)
+    legacy = os.path.join(images_dir, LEGACY_MANIFEST_NAME)
+    if not os.path.exists(path) and os.path.exists(legacy):
+        # Move a manifest written inside the (public) media directory
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(legacy, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not move embedding manifest {legacy}: {e}")
+            path = legacy
+    try:
+        with open(path) as f:
+            return json.load(f).get('images', {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(images_dir, entries):
+    """Atomic write (a crash leaves the previous manifest, never half of one)."""
+    path = manifest_path(images_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'images': entries}, f)
+    os.replace(tmp, path)
+    legacy = os.path.join(images_dir, LEGACY_MANIFEST_NAME)
+    if os.path.exists(legacy):
+        os.unlink(legacy)
+
+
+def delete_manifest(images_dir):
+    """Drop the manifest of an image directory that was removed."""
+    try:
+        os.unlink(manifest_path(images_dir))
+    except FileNotFoundError:
+        pass
+
+
+def record_embeddings(images_dir, embeddings):
+    """
+    Add freshly computed embeddings, e.g. of images just captured.
+
+    Args:
+        embeddings: {filename: embedding or None}
+    """
+    if not embeddings:
+        return
+    version = model_version()
+    entries = load_manifest(images_dir)
+    for filename, embedding in embeddings.items():
+        entries[filename] = {
+            'sha1': file_hash(os.path.join(images_dir, filename)),
+            'model': version,
+            'embedding': [float(x) for x in embedding] if embedding is not None else None,
+        }
+    save_manifest(images_dir, entries)
+
+
+def embed_images(images_dir, embed, filenames=None, version=None):
+    """
+    Embeddings of a directory's images, running embed(path) only where the manifest has no current entry.
+
+    Args:
+        images_dir: Employee image directory
+        embed: path -> embedding or None (no face); raises on errors
+        filenames: Subset of images to use (default: all, sorted)
+        version: Model version embed() produces (default: model_version())
+
+    Returns:
+        (embeddings of images with a face, in filename order,
+         report dict: images / embedded / reused / no_face / failed)
+    """
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    version = version or model_version()
+    entries = load_manifest(images_dir)
+    present = set(os.listdir(images_dir))
+
+    embeddings = []
+    report = {'images': len(filenames), 'embedded': 0, 'reused': 0, 'no_face': 0, 'failed': 0}
+    changed = False
+    for filename in filenames:
+        path = os.path.join(images_dir, filename)
+        sha1 = file_hash(path)
+        entry = entries.get(filename)
+        if entry and entry.get('sha1') == sha1 and entry.get('model') == version:
+            report['reused'] += 1
+        else:
+            try:
+                embedding = embed(path)
+            except Exception as e:
+                # Not recorded: a failure is not "no face", retry on the next training
+                logger.error(f"❌ Embedding {path} failed: {e}")
+                report['failed'] += 1
+                continue
+            entry = entries[filename] = {
+                'sha1': sha1,
+                'model': version,
+                'embedding': [float(x) for x in embedding] if embedding is not None else None,
+            }
+            report['embedded'] += 1
+            changed = True
+
+        if entry['embedding'] is None:
+            report['no_face'] += 1
+        else:
+            embeddings.append(entry['embedding'])
+
+    for filename in [f for f in entries if f not in present]:
+        del entries[filename]
+        changed = True
+    if changed:
+        save_manifest(images_dir, entries)
+
+    logger.info(
+        f"🗂️ {images_dir}: {report['embedded']} embedded, {report['reused']} reused, "
+        f"{report['no_face']} without face, {report['failed']} failed"
+    )
+    return embeddings, report
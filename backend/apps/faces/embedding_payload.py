@@ -0,0 +1,155 @@
+"""
+Compact Kiosk Embedding Payloads
+GetEmployeeEmbeddingsView sent every trained employee's embeddings as JSON
+float lists (~10 bytes per value), re-serialized on every kiosk startup.
+
+Payloads are versioned by the newest updated_at of the org's trained
+employees (microseconds since the epoch), so:
+- the ETag comes from one aggregate query (If-None-Match -> 304)
+- since_version returns only employees saved after that version, plus the
+  ids of all current employees so the kiosk can drop removed ones
+- encoded payloads are cached (Django cache) under versioned keys
+
+Encodings, per embedding row:
+    float32  JSON float lists (the original response)
+    float16  2 bytes per value
+    int8     1 byte per value: value = q * scale, scale = max |value| / 127
+             of the row (scales sent as float32, one per row)
+
+Binary layout (application/octet-stream, raw=1):
+    header    HEADER: magic, format version, encoding code, dimension,
+              rows, metadata length
+    metadata  UTF-8 JSON {version, mode, encoding, employees: [{employee_id,
+              name, count}], employee_ids (delta only)}
+    matrix    rows * dimension values, little-endian, employees in order
+    scales    rows float32 (int8 only)
+"""
+import json
+import base64
+import struct
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Max, Count
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = {'float16': 1, 'int8': 2}  # Binary encoding codes ('float32' is JSON only)
+HEADER = struct.Struct('<4sBBHII')
+MAGIC = b'FEMB'
+FORMAT_VERSION = 1
+PAYLOAD_CACHE_TIMEOUT = 24 * 60 * 60  # Versioned keys, so a long TTL is safe
+DELTA_OVERLAP_SECONDS = 60  # Re-send recent saves: a slow transaction may commit an older updated_at late
+
+
+def payload_version(employees):
+    """(version, employee count) of a queryset of trained employees, from one aggregate query."""
+    stats = employees.aggregate(latest=Max('updated_at'), count=Count('id'))
+    latest = stats['latest']
+    return (int(latest.timestamp() * 1_000_000) if latest else 0), stats['count']
+
+
+def changed_since(employees, since_version):
+    """Employees saved after since_version (with DELTA_OVERLAP_SECONDS of slack)."""
+    since = datetime.fromtimestamp(since_version / 1_000_000, tz=dt_timezone.utc)
+    return employees.filter(updated_at__gt=since - timedelta(seconds=DELTA_OVERLAP_SECONDS))
+
+
+def make_etag(*parts):
+    return '"' + hashlib.sha1(':'.join(str(p) for p in parts).encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match header check (weak comparison, lists and '*')."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in (t[2:] if t.startswith('W/') else t for t in tags)
+
+
+def encode_matrix(vectors, encoding):
+    """
+    Quantize an (n, dim) float matrix.
+
+    Returns:
+        (matrix bytes, scales bytes or b'')
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if encoding == 'float16':
+        return matrix.astype('<f2').tobytes(), b''
+    scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype('<f4')
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype('i1')
+    return quantized.tobytes(), scales.tobytes()
+
+
+def decode_matrix(data, scales, encoding, dim):
+    """Inverse of encode_matrix (for Python clients and checks)."""
+    if encoding == 'float16':
+        return np.frombuffer(data, dtype='<f2').reshape(-1, dim).astype(np.float32)
+    quantized = np.frombuffer(data, dtype='i1').reshape(-1, dim).astype(np.float32)
+    return quantized * np.frombuffer(scales, dtype='<f4')[:, None]
+
+
+def collect(employees, embeddings_field, dim, limit):
+    """
+    Employee list and embedding rows (first `limit` per employee, of dimension dim).
+
+    Returns:
+        ([{employee_id, name, count}], [embedding, ...] in the same order)
+    """
+    entries, rows = [], []
+    for emp in employees.only('id', 'employee_id', 'first_name', 'last_name', embeddings_field):
+        embeddings = [e for e in (getattr(emp, embeddings_field) or [])[:limit] if e and len(e) == dim]
+        if not embeddings:
+            continue
+        entries.append({'employee_id': emp.employee_id, 'name': emp.full_name, 'count': len(embeddings)})
+        rows.extend(embeddings)
+    return entries, rows
+
+
+def build_payload(employees, embeddings_field, dim, encoding, raw, meta, limit=5):
+    """
+    Encoded payload of employees' embeddings.
+
+    Args:
+        employees: Trained employees to include (already narrowed for delta)
+        embeddings_field: 'light_embeddings' or 'heavy_embeddings'
+        dim: Embedding dimension of the mode (other rows are skipped)
+        encoding: 'float16' or 'int8'
+        raw: True for the binary layout, False for JSON with base64 fields
+        meta: Extra metadata (version, mode, employee_ids for delta)
+        limit: Embeddings per employee
+
+    Returns:
+        bytes (raw) or dict
+    """
+    entries, rows = collect(employees, embeddings_field, dim, limit)
+    matrix, scales = encode_matrix(np.asarray(rows, dtype=np.float32).reshape(-1, dim), encoding)
+    meta = {**meta, 'encoding': encoding, 'embedding_dimension': dim, 'employees': entries}
+
+    if not raw:
+        return {
+            **meta,
+            'count': len(entries),
+            'embeddings': base64.b64encode(matrix).decode('ascii'),
+            'scales': base64.b64encode(scales).decode('ascii') if scales else None,
+        }
+
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, ENCODINGS[encoding], dim, len(rows), len(meta_bytes))
+    return header + meta_bytes + matrix + scales
+
+
+def cached_payload(key, build):
+    """build() result, cached under a versioned key."""
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        try:
+            cache.set(key, payload, PAYLOAD_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding payload not cached: {e}")
+    return payload
@@ -0,0 +1,94 @@
+"""
+Enrollment Embedding Selection
+Training embeds every captured image (hundreds per employee in heavy mode),
+and consecutive video frames are mostly the same face. Storing them all
+makes galleries, MySQL rows and search cost grow with no accuracy gain.
+
+select_diverse_embeddings():
+1. Walk the embeddings best quality first, dropping any that is a
+   near-duplicate (cosine similarity > DUPLICATE_SIMILARITY) of one kept.
+2. If more than max_count remain, cluster them (spherical k-means, see
+   identification.spherical_kmeans) into max_count groups - roughly poses /
+   lighting conditions - and keep one per group: the best quality member,
+   or the member closest to the group center when there are no quality scores.
+"""
+import logging
+import numpy as np
+from django.conf import settings
+
+from .identification import spherical_kmeans
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FACE_EMBEDDING_SELECTION', {})
+MAX_EMBEDDINGS = _config.get('MAX_EMBEDDINGS', 20)
+DUPLICATE_SIMILARITY = _config.get('DUPLICATE_SIMILARITY', 0.95)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def select_diverse_embeddings(embeddings, quality=None, max_count=None, duplicate_similarity=None):
+    """
+    Bounded, diverse subset of one person's embeddings.
+
+    Args:
+        embeddings: Embedding vectors (same dimension)
+        quality: Optional score per embedding (e.g. det_score), higher is better
+        max_count: Most embeddings to keep (default MAX_EMBEDDINGS)
+        duplicate_similarity: Near-duplicate cosine similarity (default DUPLICATE_SIMILARITY)
+
+    Returns:
+        (indices into embeddings to keep - best quality first, or input order
+        without quality - and a report dict with the input / retained /
+        dropped counts)
+    """
+    max_count = max_count or MAX_EMBEDDINGS
+    duplicate_similarity = duplicate_similarity or DUPLICATE_SIMILARITY
+    report = {'input': len(embeddings), 'retained': 0, 'dropped': 0, 'duplicates_dropped': 0, 'clustered_dropped': 0}
+    if not len(embeddings):
+        return [], report
+
+    vectors = _normalize(embeddings)
+    if quality is not None:
+        order = list(np.argsort(-np.asarray(quality, dtype=np.float32), kind='stable'))
+    else:
+        order = list(range(len(vectors)))
+
+    # 1. Near-duplicates
+    kept = []
+    for i in order:
+        if kept and float(np.max(vectors[kept] @ vectors[i])) > duplicate_similarity:
+            continue
+        kept.append(i)
+    report['duplicates_dropped'] = len(vectors) - len(kept)
+
+    # 2. One representative per cluster
+    if len(kept) > max_count:
+        candidates = vectors[kept]
+        centers, assignment = spherical_kmeans(candidates, max_count)
+        representatives = []
+        for c in range(max_count):
+            members = np.flatnonzero(assignment == c)
+            if not len(members):
+                continue
+            if quality is not None:
+                best = members[0]  # kept is in quality order
+            else:
+                best = members[np.argmax(candidates[members] @ centers[c])]
+            representatives.append(kept[best])
+        position = {i: p for p, i in enumerate(order)}
+        selected = sorted(representatives, key=position.get)
+        report['clustered_dropped'] = len(kept) - len(selected)
+        kept = selected
+
+    report['retained'] = len(kept)
+    report['dropped'] = len(vectors) - len(kept)
+    logger.info(
+        f"🧹 Embedding selection: kept {report['retained']}/{report['input']} "
+        f"({report['duplicates_dropped']} near-duplicates, {report['clustered_dropped']} merged by clustering)"
+    )
+    return [int(i) for i in kept], report
@@ -0,0 +1,404 @@
+"""
+Face Embedding Model Versions
+Embeddings of different face models (InsightFace packs) are not comparable,
+so every stored embedding is tagged with the ModelVersion
+(apps/ml_models) it was computed with: SaaSEmployee.embedding_model, the
+vector index metadata ('model_version') and the image manifest.
+
+The serving version is the active 'heavy' ModelVersion tagged
+"InsightFace:<pack>"; FACE_ENGINE['MODEL_PACK'] names the target. When they
+differ (engine switch), start_reembedding() queues one ReembeddingJob per
+organization. Each job:
+1. Re-embeds REEMBED_BATCH employees per Celery run with the target pack,
+   REEMBED_PAUSE_SECONDS apart (throttled, so check-ins keep their CPU)
+2. Stages the results - SaaSEmployee.staged_embeddings and a per-version
+   vector index ("heavy_<version>") - while search keeps using the serving
+   version's embeddings and index
+3. Records its cursor after every batch, so it resumes where it stopped
+   (check_embedding_versions re-queues jobs that went quiet)
+
+Training while a job is active discards the employee's staged embeddings
+(discard_staged(), from the SaaSEmployee signals), since they were computed
+from the old images.
+
+When every organization is staged, switch_version() re-stages employees
+saved since their job started (retrained after being staged, or enrolled
+after the cursor passed them), then swaps the embeddings of all employees in
+one transaction, activates the target, promotes the staged indexes and
+broadcasts the change so workers reload the engine.
+
+Search workers run a single engine, so the switch is global rather than per
+organization: until the last organization is staged nobody switches.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+
+from services.embedding_events import on_change
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FACE_ENGINE', {})
+MODEL_PACK = _config.get('MODEL_PACK', 'buffalo_l')
+REEMBED_BATCH = _config.get('REEMBED_BATCH', 10)  # Employees per job run
+REEMBED_PAUSE_SECONDS = _config.get('REEMBED_PAUSE_SECONDS', 5)
+STALE_JOB_MINUTES = _config.get('STALE_JOB_MINUTES', 30)
+
+TAG_PREFIX = 'InsightFace:'
+ENGINE_CHANGED = 'engine'  # model_type of the change event sent on a switch
+
+_serving = None  # Cached serving ModelVersion
+
+
+def version_tag(pack):
+    return f"{TAG_PREFIX}{pack}"
+
+
+def staging_model_type(version):
+    """Vector index model_type holding a version's staged embeddings."""
+    return f"heavy_{version.id.hex[:8]}"
+
+
+def _register(pack, active=False):
+    from django.utils import timezone
+    from apps.ml_models.models import ModelVersion
+
+    version, created = ModelVersion.objects.get_or_create(
+        version_tag=version_tag(pack),
+        defaults={
+            'model_type': 'heavy',
+            'file_path': pack,
+            'is_active': active,
+            'deployed_at': timezone.now() if active else None,
+        }
+    )
+    if created:
+        logger.info(f"📌 Registered face model version {version.version_tag}")
+    return version
+
+
+def serving_version():
+    """ModelVersion whose embeddings are searched (the configured pack is registered on first use)."""
+    global _serving
+    if _serving is None:
+        from apps.ml_models.models import ModelVersion
+
+        version = ModelVersion.objects.filter(
+            model_type='heavy', is_active=True, version_tag__startswith=TAG_PREFIX
+        ).first()
+        _serving = version or _register(MODEL_PACK, active=True)
+    return _serving
+
+
+def serving_pack():
+    """InsightFace pack queries are embedded with."""
+    try:
+        return serving_version().file_path
+    except Exception:
+        return MODEL_PACK  # Database not ready (startup, migrations)
+
+
+def serving_tag():
+    try:
+        return serving_version().version_tag
+    except Exception:
+        return version_tag(MODEL_PACK)
+
+
+def target_version():
+    """ModelVersion of the configured pack (FACE_ENGINE['MODEL_PACK'])."""
+    return _register(MODEL_PACK)
+
+
+def _on_change(org_code, model_type):
+    global _serving
+    if org_code is None:
+        _serving = None  # Re-read after a switch (or missed events)
+
+
+on_change(_on_change)
+
+
+def _enqueue(job, countdown=0):
+    from apps.ml_models.tasks import reembed_organization
+    reembed_organization.apply_async((str(job.id),), countdown=countdown)
+
+
+def start_reembedding(org=None):
+    """
+    Queue (or resume) re-embedding jobs towards the configured pack.
+
+    Args:
+        org: Organization, or None for every organization with enrolled faces
+
+    Returns:
+        List of ReembeddingJob (empty when already on the target version)
+    """
+    from core.models import Organization, SaaSEmployee
+    from apps.ml_models.models import ReembeddingJob
+
+    source, target = serving_version(), target_version()
+    if source.pk == target.pk:
+        return []
+
+    if org is not None:
+        orgs = [org]
+    else:
+        orgs = Organization.objects.filter(saas_employees__face_enrolled=True).distinct()
+
+    jobs = []
+    for organization in orgs:
+        job, created = ReembeddingJob.objects.get_or_create(
+            organization=organization,
+            target_model=target,
+            defaults={
+                'source_model': source,
+                'total': SaaSEmployee.objects.filter(organization=organization, face_enrolled=True).count(),
+            }
+        )
+        if created or job.status == 'failed':
+            job.status = 'queued'
+            job.error = ''
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            _enqueue(job)
+            logger.info(f"🔁 Re-embedding {organization.org_code}: {source.version_tag} -> {target.version_tag}")
+        jobs.append(job)
+    return jobs
+
+
+def resume_stale_jobs():
+    """Re-queue jobs whose worker died (no progress for STALE_JOB_MINUTES). Returns the count."""
+    from django.utils import timezone
+    from apps.ml_models.models import ReembeddingJob
+
+    cutoff = timezone.now() - timedelta(minutes=STALE_JOB_MINUTES)
+    stale = ReembeddingJob.objects.filter(status__in=['queued', 'running'], updated_at__lt=cutoff)
+    count = 0
+    for job in stale:
+        job.save(update_fields=['updated_at'])
+        _enqueue(job)
+        count += 1
+    return count
+
+
+def _stage_employee(emp, org_code, target, service):
+    """
+    Re-embed one employee's images with the target pack (the image manifest
+    keeps unchanged images from being run again).
+
+    Returns:
+        Selected embeddings, or None with fewer than 3 usable images
+    """
+    import os
+    from .detection_profiles import det_size
+    from .embedding_manifest import embed_images
+    from .embedding_selection import select_diverse_embeddings
+
+    images_dir = os.path.join(settings.MEDIA_ROOT, 'employee_faces', org_code, emp.employee_id)
+    embeddings = []
+    if os.path.isdir(images_dir):
+        embeddings, _ = embed_images(
+            images_dir,
+            lambda path: service.get_embedding(path, profile='training', pack=target.file_path, raise_errors=True),
+            version=f"{target.version_tag}@{det_size('training')}"
+        )
+    if len(embeddings) < 3:
+        return None
+    kept, _ = select_diverse_embeddings(embeddings)
+    return [embeddings[i] for i in kept]
+
+
+def discard_staged(employee):
+    """
+    Drop an employee's staged embeddings after retraining (or a reset) during
+    an active job; switch_version() re-stages the employee from the new images.
+    """
+    from core.models import SaaSEmployee
+    from apps.ml_models.models import ReembeddingJob
+    from services.vector_db import vector_db
+
+    jobs = list(ReembeddingJob.objects.filter(
+        organization_id=employee.organization_id, status__in=['queued', 'running', 'staged']
+    ).select_related('organization', 'target_model'))
+    if not jobs:
+        return
+    SaaSEmployee.objects.filter(pk=employee.pk).update(staged_embeddings=[])
+    for job in jobs:
+        vector_db.delete_embeddings(job.organization.org_code, staging_model_type(job.target_model), employee.employee_id)
+
+
+def _restage_changed(job, service):
+    """Re-stage the job's employees saved after it started. Returns the count."""
+    from core.models import SaaSEmployee
+    from services.vector_db import vector_db
+
+    org_code = job.organization.org_code
+    target = job.target_model
+    changed = SaaSEmployee.objects.filter(
+        organization=job.organization, face_enrolled=True, updated_at__gt=job.started_at
+    ).only('id', 'employee_id', 'first_name', 'last_name')
+    count = 0
+    for emp in changed.iterator(chunk_size=100):
+        staged = _stage_employee(emp, org_code, target, service)
+        SaaSEmployee.objects.filter(pk=emp.pk).update(staged_embeddings=staged or [])
+        if staged:
+            vector_db.bulk_upsert_embeddings(
+                org_code, staging_model_type(target),
+                [{'employee_id': emp.employee_id, 'employee_name': emp.full_name, 'embeddings': staged}],
+                model_version=target.version_tag
+            )
+        else:
+            vector_db.delete_embeddings(org_code, staging_model_type(target), emp.employee_id)
+        count += 1
+    return count
+
+
+def run_reembedding_step(job_id):
+    """
+    One throttled batch of a job: re-embed the next REEMBED_BATCH employees
+    after the cursor, stage them, then re-queue itself or finish.
+    """
+    from django.utils import timezone
+    from core.models import SaaSEmployee
+    from apps.ml_models.models import ReembeddingJob
+    from services.vector_db import vector_db
+    from .deepface_service import get_deepface_service
+
+    try:
+        job = ReembeddingJob.objects.select_related('organization', 'target_model').get(id=job_id)
+    except ReembeddingJob.DoesNotExist:
+        return {'success': False, 'error': 'Job not found'}
+    if job.status not in ('queued', 'running'):
+        return {'success': True, 'status': job.status}
+
+    if job.status == 'queued':
+        job.status = 'running'
+        job.started_at = job.started_at or timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+
+    org_code = job.organization.org_code
+    target = job.target_model
+    service = get_deepface_service()
+
+    employees = SaaSEmployee.objects.filter(organization=job.organization, face_enrolled=True).order_by('pk')
+    if job.cursor:
+        employees = employees.filter(pk__gt=job.cursor)
+    batch = list(employees.only('id', 'employee_id', 'first_name', 'last_name')[:REEMBED_BATCH])
+
+    try:
+        rows, skipped = [], 0
+        for emp in batch:
+            staged = _stage_employee(emp, org_code, target, service)
+            if staged is None:
+                skipped += 1
+                continue
+            SaaSEmployee.objects.filter(pk=emp.pk).update(staged_embeddings=staged)
+            rows.append({'employee_id': emp.employee_id, 'employee_name': emp.full_name, 'embeddings': staged})
+
+        if rows:
+            vector_db.bulk_upsert_embeddings(org_code, staging_model_type(target), rows, model_version=target.version_tag)
+    except Exception as e:
+        logger.error(f"❌ Re-embedding {org_code} failed: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        return {'success': False, 'error': str(e)}
+
+    if batch:
+        job.cursor = str(batch[-1].pk)
+        job.processed += len(batch)
+        job.skipped += skipped
+    if len(batch) == REEMBED_BATCH:
+        job.save(update_fields=['cursor', 'processed', 'skipped', 'updated_at'])
+        _enqueue(job, countdown=REEMBED_PAUSE_SECONDS)
+        return {'success': True, 'status': 'running', 'processed': job.processed, 'total': job.total}
+
+    job.status = 'staged'
+    job.save(update_fields=['cursor', 'processed', 'skipped', 'status', 'updated_at'])
+    logger.info(f"✅ Re-embedding staged for {org_code}: {job.processed - job.skipped}/{job.total} employees")
+    switch_version(target)
+    return {'success': True, 'status': 'staged', 'processed': job.processed, 'total': job.total}
+
+
+def switch_version(target):
+    """
+    Make target the serving version once every organization's job is staged.
+    Employees saved since their job started are re-staged first, so retrained
+    and newly enrolled employees switch with their current images. Employee
+    embeddings switch in one transaction; employees the job could not
+    re-embed keep their old-version embeddings (tagged, so they are left out of
+    search) until they are retrained.
+
+    Returns:
+        True if switched
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from core.models import SaaSEmployee
+    from apps.ml_models.models import ModelVersion, ReembeddingJob
+    from services.embedding_events import publish_change
+    from services.vector_db import vector_db
+    from .deepface_service import get_deepface_service
+    from .identification import compute_prototypes
+
+    jobs = ReembeddingJob.objects.filter(target_model=target).exclude(status='cancelled')
+    if jobs.exclude(status__in=['staged', 'completed']).exists():
+        return False
+
+    service = get_deepface_service()
+    for job in jobs.filter(status='staged').select_related('organization', 'target_model'):
+        try:
+            restaged = _restage_changed(job, service)
+        except Exception as e:
+            logger.error(f"❌ Re-staging {job.organization.org_code} failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            return False
+        if restaged:
+            logger.info(f"🔁 Re-staged {restaged} employees of {job.organization.org_code} saved during the job")
+
+    with transaction.atomic():
+        target = ModelVersion.objects.select_for_update().get(pk=target.pk)
+        if target.is_active:
+            return False
+        staged_jobs = list(jobs.filter(status='staged').select_related('organization', 'source_model'))
+
+        switched_at = timezone.now()  # bulk_update skips auto_now; kiosk payload versions read updated_at
+        for job in staged_jobs:
+            employees = SaaSEmployee.objects.filter(organization=job.organization)
+            employees.filter(embedding_model__isnull=True).update(embedding_model=job.source_model)
+            switched = []
+            for emp in employees.only('id', 'staged_embeddings').iterator(chunk_size=100):
+                if not emp.staged_embeddings:
+                    continue
+                emp.face_embeddings = emp.heavy_embeddings = emp.staged_embeddings
+                emp.face_prototypes = compute_prototypes(emp.staged_embeddings)
+                emp.embedding_model = target
+                emp.training_mode = 'heavy'
+                emp.staged_embeddings = []
+                emp.updated_at = switched_at
+                switched.append(emp)
+            SaaSEmployee.objects.bulk_update(
+                switched,
+                ['face_embeddings', 'heavy_embeddings', 'face_prototypes', 'embedding_model', 'training_mode',
+                 'staged_embeddings', 'updated_at'],
+                batch_size=100
+            )
+            job.status = 'completed'
+            job.completed_at = timezone.now()
+            job.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+        ModelVersion.objects.filter(
+            model_type='heavy', is_active=True, version_tag__startswith=TAG_PREFIX
+        ).update(is_active=False, is_deprecated=True)
+        target.is_active = True
+        target.deployed_at = timezone.now()
+        target.save(update_fields=['is_active', 'deployed_at', 'updated_at'])
+
+    for job in staged_jobs:
+        vector_db.promote_index(job.organization.org_code, staging_model_type(target), 'heavy')
+
+    publish_change(None, ENGINE_CHANGED)
+    logger.info(f"🔀 Face model switched to {target.version_tag} ({len(staged_jobs)} organizations)")
+    return True
@@ -0,0 +1,288 @@
+"""
+Two-Stage Face Identification (1:N)
+Scanning every stored embedding costs O(total embeddings): up to 50 per
+employee from TrainSingleEmployeeView, hundreds in heavy mode.
+
+Stage 1 ranks employees by their prototypes - a few unit vectors per
+employee (k-means centers, or just the centroid for small sets) computed when
+face_embeddings is saved (core.signals) and held per org in one small matrix.
+Stage 2 re-ranks the TOP_K candidates against their full embedding sets with
+the k-NN vote used by 1:1 verification (knn_vote).
+
+Cost is O(employees * PROTOTYPES + TOP_K * embeddings per employee).
+
+Galleries are cached per process and dropped on embedding change events
+(services/embedding_events.py), or after GALLERY_TTL_SECONDS.
+"""
+import time
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+from django.conf import settings
+
+from services.embedding_events import on_change, ensure_listening
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FACE_IDENTIFICATION', {})
+MAX_PROTOTYPES = _config.get('PROTOTYPES', 3)
+MIN_CLUSTER_SIZE = _config.get('MIN_CLUSTER_SIZE', 5)  # Embeddings per k-means cluster, at least
+KMEANS_ITERATIONS = _config.get('KMEANS_ITERATIONS', 10)
+TOP_K = _config.get('TOP_K', 5)
+GALLERY_TTL_SECONDS = _config.get('GALLERY_TTL_SECONDS', 300)
+CANDIDATE_CACHE_SIZE = _config.get('CANDIDATE_CACHE_SIZE', 256)  # Employees whose full sets stay loaded
+
+# k-NN voting (same rules as TripViewSet._verify_face)
+KNN_MIN_SAMPLES = 5
+KNN_K = 3
+STRICT_THRESHOLD = 0.15
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def knn_vote(distances, threshold):
+    """
+    Match decision from cosine distances to one person's embeddings.
+
+    With KNN_MIN_SAMPLES+ embeddings the average of the best KNN_K must be
+    under threshold, or at least 2 of them under STRICT_THRESHOLD (saves a
+    case where one match is bad but two are excellent). With fewer, the
+    single best distance decides.
+
+    Returns:
+        Dict with is_match, distance (unrounded), confidence, method
+    """
+    distances = sorted(distances)
+    if not distances:
+        return {'is_match': False, 'distance': float('inf'), 'confidence': 0.0, 'method': 'No embeddings'}
+
+    if len(distances) >= KNN_MIN_SAMPLES:
+        top_k = distances[:KNN_K]
+        distance = sum(top_k) / len(top_k)
+        is_match = distance < threshold
+        if len([d for d in top_k if d < STRICT_THRESHOLD]) >= 2:
+            is_match = True
+        method = f"k-NN (avg top {KNN_K})"
+    else:
+        distance = distances[0]
+        is_match = distance < threshold
+        method = "Single Best (Low Data)"
+
+    return {'is_match': is_match, 'distance': distance, 'confidence': 1 - distance, 'method': method}
+
+
+def spherical_kmeans(vectors, k):
+    """
+    k-means on unit vectors by cosine similarity. Seeded with the medoid (the
+    vector closest to the centroid) and then farthest points, so outlying
+    poses or lighting get a cluster of their own. Deterministic.
+
+    Returns:
+        (centers (k, dim) unit vectors, cluster index per vector)
+    """
+    centroid = _normalize(vectors.mean(axis=0))[0]
+    centers = [vectors[np.argmax(vectors @ centroid)]]
+    closest = vectors @ centers[0]
+    for _ in range(k - 1):
+        farthest = int(np.argmin(closest))
+        centers.append(vectors[farthest])
+        closest = np.maximum(closest, vectors @ vectors[farthest])
+    centers = np.stack(centers)
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centers.T, axis=1)
+        updated = centers.copy()
+        for c in range(k):
+            members = vectors[assignment == c]
+            if len(members):
+                updated[c] = _normalize(members.mean(axis=0))[0]
+        if np.allclose(updated, centers, atol=1e-5):
+            break
+        centers = updated
+
+    return centers, np.argmax(vectors @ centers.T, axis=1)
+
+
+def compute_prototypes(embeddings, max_prototypes=None):
+    """
+    Prototype vectors for one employee's embeddings: the normalized centroid
+    for small sets (< 2 * MIN_CLUSTER_SIZE), spherical k-means centers for
+    larger ones.
+
+    Returns:
+        List of unit vectors (lists of floats); empty for no embeddings
+    """
+    max_prototypes = max_prototypes or MAX_PROTOTYPES
+    vectors = [e for e in (embeddings or []) if e is not None and len(e)]
+    if not vectors:
+        return []
+    dims = {len(v) for v in vectors}
+    if len(dims) > 1:
+        # Mixed light/heavy leftovers - keep the majority dimension
+        dim = max(dims, key=lambda d: sum(1 for v in vectors if len(v) == d))
+        vectors = [v for v in vectors if len(v) == dim]
+    vectors = _normalize(vectors)
+
+    k = min(max_prototypes, len(vectors) // MIN_CLUSTER_SIZE)
+    if k <= 1:
+        return [_normalize(vectors.mean(axis=0))[0].tolist()]
+    centers, _ = spherical_kmeans(vectors, k)
+    return centers.tolist()
+
+
+class Gallery:
+    """Prototype matrices of one org's enrolled, active employees (one per embedding dimension)."""
+
+    def __init__(self, org_code):
+        from django.db.models import Q
+        from core.models import SaaSEmployee
+        from .embedding_versions import serving_version
+
+        self.org_code = org_code
+        self.created_at = time.monotonic()
+        self._candidates = OrderedDict()  # (employee pk, dim) -> normalized full embedding set
+        self._lock = threading.Lock()
+
+        employees = SaaSEmployee.objects.filter(
+            organization__org_code=org_code, face_enrolled=True, status='active'
+        ).filter(
+            # Embeddings of another model version are not comparable (see embedding_versions)
+            Q(embedding_model__isnull=True) | Q(embedding_model=serving_version())
+        )
+        rows = list(employees.values_list('id', 'face_prototypes'))
+
+        missing = [pk for pk, prototypes in rows if not prototypes]
+        if missing:
+            # Migration 0026 and the save signal store prototypes; computed in memory only
+            # for rows written around them (read path - no writes here)
+            backfilled = {}
+            for pk, embeddings in SaaSEmployee.objects.filter(id__in=missing).values_list('id', 'face_embeddings'):
+                backfilled[pk] = compute_prototypes(embeddings)
+            rows = [(pk, prototypes or backfilled.get(pk)) for pk, prototypes in rows]
+            unstored = sum(1 for prototypes in backfilled.values() if prototypes)
+            if unstored:
+                logger.warning(f"⚠️ {unstored} employees of {org_code} have no stored face prototypes")
+
+        by_dim = {}
+        for pk, prototypes in rows:
+            for dim in {len(p) for p in prototypes or []}:
+                vectors, pks, starts = by_dim.setdefault(dim, ([], [], []))
+                starts.append(len(vectors))
+                pks.append(pk)
+                vectors.extend(p for p in prototypes if len(p) == dim)
+        # dim -> (prototype matrix, employee pks, first matrix row of each employee)
+        self.matrices = {
+            dim: (_normalize(vectors), pks, np.array(starts))
+            for dim, (vectors, pks, starts) in by_dim.items()
+        }
+        self.employee_count = len(rows)
+
+    @property
+    def expired(self):
+        return time.monotonic() - self.created_at > GALLERY_TTL_SECONDS
+
+    def shortlist(self, query, top_k):
+        """Stage 1: up to top_k employee pks, best prototype similarity first."""
+        matrix, pks, starts = self.matrices.get(len(query), (None, None, None))
+        if matrix is None:
+            return []
+        # Best prototype per employee (rows are grouped by employee)
+        similarities = np.maximum.reduceat(matrix @ query, starts)
+        if top_k < len(pks):
+            top = np.argpartition(-similarities, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(pks))
+        top = top[np.argsort(-similarities[top])]
+        return [pks[i] for i in top]
+
+    def _embeddings(self, pks, dim):
+        """Full normalized embedding sets (of one dimension) for candidates, LRU cached."""
+        from core.models import SaaSEmployee
+
+        with self._lock:
+            found = {pk: self._candidates[pk, dim] for pk in pks if (pk, dim) in self._candidates}
+            for pk in found:
+                self._candidates.move_to_end((pk, dim))
+
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            for pk, embeddings in SaaSEmployee.objects.filter(id__in=missing).values_list('id', 'face_embeddings'):
+                vectors = [e for e in embeddings or [] if e is not None and len(e) == dim]
+                found[pk] = _normalize(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+            with self._lock:
+                for pk in missing:
+                    if pk in found:
+                        self._candidates[pk, dim] = found[pk]
+                while len(self._candidates) > CANDIDATE_CACHE_SIZE:
+                    self._candidates.popitem(last=False)
+        return found
+
+    def identify(self, query_embedding, threshold, top_k=None):
+        """
+        Best matching employee for a query embedding.
+
+        Returns:
+            knn_vote() dict plus employee_pk, or None when nobody matches
+        """
+        query = _normalize(query_embedding)[0]
+        candidates = self.shortlist(query, top_k or TOP_K)
+        if not candidates:
+            return None
+
+        best = None
+        for pk, embeddings in self._embeddings(candidates, len(query)).items():
+            vote = knn_vote((1 - embeddings @ query).tolist(), threshold)
+            if vote['is_match'] and (best is None or vote['distance'] < best['distance']):
+                best = {**vote, 'employee_pk': pk}
+        return best
+
+
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+
+def get_gallery(org_code):
+    """Cached Gallery for an org (rebuilt after embedding changes or GALLERY_TTL_SECONDS)."""
+    ensure_listening()
+    gallery = _galleries.get(org_code)
+    if gallery is None or gallery.expired:
+        gallery = Gallery(org_code)
+        with _galleries_lock:
+            _galleries[org_code] = gallery
+        logger.debug(f"Face gallery for {org_code}: {gallery.employee_count} employees")
+    return gallery
+
+
+def invalidate_gallery(org_code=None, model_type=None):
+    """Drop cached galleries (org_code None: all). Registered with on_change."""
+    with _galleries_lock:
+        if org_code is None:
+            _galleries.clear()
+        else:
+            _galleries.pop(org_code, None)
+
+
+def identify(org_code, query_embedding, threshold, top_k=None):
+    """
+    Two-stage 1:N search of an org's enrolled employees.
+
+    Args:
+        org_code: Organization code
+        query_embedding: Face embedding (any norm)
+        threshold: Cosine distance limit for knn_vote
+        top_k: Stage 1 shortlist size (default TOP_K)
+
+    Returns:
+        Dict with employee_pk, distance, confidence, method; None if no match
+    """
+    return get_gallery(org_code).identify(query_embedding, threshold, top_k)
+
+
+on_change(invalidate_gallery)
@@ -2,7 +2,7 @@
 Admin configuration for ML Models app.
 """
 from django.contrib import admin
-from .models import ModelVersion, TrainingJob, TrainingLog
+from .models import ModelVersion, TrainingJob, TrainingLog, ReembeddingJob
 
 
 @admin.register(ModelVersion)
@@ -29,3 +29,12 @@ class TrainingLogAdmin(admin.ModelAdmin):
     list_filter = ['training_job']
     ordering = ['-created_at']
     readonly_fields = ['created_at']
+
+
+@admin.register(ReembeddingJob)
+class ReembeddingJobAdmin(admin.ModelAdmin):
+    list_display = ['organization', 'source_model', 'target_model', 'status', 'processed', 'total', 'skipped', 'started_at', 'completed_at']
+    list_filter = ['status', 'target_model']
+    search_fields = ['organization__org_code']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'updated_at']
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-19 17:10
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_saasemployee_face_prototypes'),
+        ('ml_models', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReembeddingJob',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('staged', 'Staged (waiting for switch)'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0, help_text='Employees without usable images')),
+                ('cursor', models.CharField(blank=True, help_text='Last processed employee pk', max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reembedding_jobs', to='core.organization')),
+                ('source_model', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ml_models.modelversion')),
+                ('target_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reembedding_jobs', to='ml_models.modelversion')),
+            ],
+            options={
+                'db_table': 'reembedding_jobs',
+                'unique_together': {('organization', 'target_model')},
+            },
+        ),
+    ]
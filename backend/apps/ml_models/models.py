@@ -64,6 +64,40 @@ class TrainingJob(TimeStampedModel):
         db_table = 'training_jobs'
 
 
+class ReembeddingJob(TimeStampedModel):
+    """
+    Re-embedding of one organization's enrolled faces with a new face
+    embedding model (apps/faces/embedding_versions.py). Runs in throttled
+    batches and resumes after cursor; results stay staged until every
+    organization is done, then all switch together.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('staged', 'Staged (waiting for switch)'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey('core.Organization', on_delete=models.CASCADE, related_name='reembedding_jobs')
+    source_model = models.ForeignKey(ModelVersion, on_delete=models.SET_NULL, null=True, related_name='+')
+    target_model = models.ForeignKey(ModelVersion, on_delete=models.CASCADE, related_name='reembedding_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0, help_text="Employees without usable images")
+    cursor = models.CharField(max_length=64, blank=True, help_text="Last processed employee pk")
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'reembedding_jobs'
+        unique_together = ['organization', 'target_model']
+
+
 class TrainingLog(models.Model):
     """Logs training metrics per epoch."""
     id = models.BigAutoField(primary_key=True)
@@ -0,0 +1,79 @@
+"""
+Celery tasks for ML model post-processing.
+Routed to ml_queue (see attendance_system/celery.py).
+"""
+import logging
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=1, default_retry_delay=60)
+def export_yolo_model(self, model_id, formats=None):
+    """
+    Export an uploaded CustomYoloModel to ONNX/OpenVINO and validate it
+    against the .pt (see apps/detection/yolo_export.py).
+    """
+    from core.models import CustomYoloModel
+    from apps.detection.yolo_export import export_and_validate
+
+    try:
+        yolo_model = CustomYoloModel.objects.get(id=model_id)
+    except CustomYoloModel.DoesNotExist:
+        logger.warning(f"YOLO export skipped, model not found: {model_id}")
+        return {'success': False, 'error': 'Model not found'}
+
+    try:
+        return export_and_validate(yolo_model, formats)
+    except Exception as e:
+        logger.error(f"❌ YOLO export job failed for {model_id}: {e}")
+        CustomYoloModel.objects.filter(pk=model_id).update(export_status='failed')
+        raise self.retry(exc=e)
+
+
+@shared_task(bind=True)
+def reevaluate_vehicle_compliance(self, org_id, since=None, until=None, batch_size=8, dry_run=False):
+    """
+    Re-run YOLO + compliance over an org's stored vehicle images
+    (see apps/detection/compliance_reevaluation.py).
+    since/until are ISO datetimes.
+    """
+    from django.utils.dateparse import parse_datetime
+    from core.models import Organization
+    from apps.detection.compliance_reevaluation import reevaluate_vehicle_compliance as run
+
+    try:
+        org = Organization.objects.get(id=org_id)
+    except Organization.DoesNotExist:
+        return {'success': False, 'error': 'Organization not found'}
+
+    return run(
+        org,
+        since=parse_datetime(since) if since else None,
+        until=parse_datetime(until) if until else None,
+        batch_size=batch_size,
+        dry_run=dry_run,
+    )
+
+
+@shared_task(bind=True)
+def reembed_organization(self, job_id):
+    """
+    One throttled batch of a ReembeddingJob; re-queues itself until the org is
+    staged (see apps/faces/embedding_versions.py).
+    """
+    from apps.faces.embedding_versions import run_reembedding_step
+
+    return run_reembedding_step(job_id)
+
+
+@shared_task
+def check_embedding_versions():
+    """Queue re-embedding when FACE_ENGINE['MODEL_PACK'] changed, and resume jobs whose worker died."""
+    from apps.faces.embedding_versions import start_reembedding, resume_stale_jobs
+
+    jobs = start_reembedding()
+    resumed = resume_stale_jobs()
+    if resumed:
+        logger.info(f"🔁 Resumed {resumed} stalled re-embedding jobs")
+    return {'success': True, 'jobs': len(jobs), 'resumed': resumed}
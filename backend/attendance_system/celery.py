@@ -29,6 +29,11 @@ app.conf.beat_schedule = {
         'task': 'apps.ml_models.tasks.check_retraining_needed',
         'schedule': crontab(hour=3, minute=0, day_of_week=0),  # Sunday 3 AM
     },
+    # Start / resume face re-embedding after a model pack change
+    'check-embedding-versions': {
+        'task': 'apps.ml_models.tasks.check_embedding_versions',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
     # Generate daily attendance report
     'daily-attendance-report': {
         'task': 'apps.analytics.tasks.generate_daily_report',
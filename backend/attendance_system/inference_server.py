@@ -0,0 +1,31 @@
+"""
+Local Inference Server entry point
+Owns InsightFace / MiniFAS / YOLO for every API worker on the box
+(apps/detection/inference_server.py). API workers connect over a Unix socket
+when INFERENCE_SERVER_ENABLED is set.
+
+Run:
+    python -m attendance_system.inference_server [--socket /run/inference/inference.sock]
+"""
+import os
+import argparse
+import logging
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings.production')
+django.setup()
+
+from apps.detection.inference_server import serve, SOCKET_PATH  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local CPU inference server')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket path')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Kiosk Preview WebSocket (ASGI)
+Separate ASGI app next to the WSGI API so preview traffic stays out of the
+gunicorn workers. One persistent connection per kiosk:
+
+    ws://<host>/ws/preview/?org_code=ACME&kiosk_id=kiosk_abc
+
+- Client sends binary JPEG frames
+- Server keeps ONLY the latest unprocessed frame (latest-frame-wins);
+  frames that arrive while inference is running replace each other
+- Server pushes back the same JSON as POST /api/v1/detection/preview/
+  plus 'frame' (sequence number) and 'dropped' (stale frames skipped)
+- Inference goes through the inference scheduler like the HTTP preview, so
+  it yields to check-ins in any process ('busy' replies)
+
+Run:
+    uvicorn attendance_system.preview_asgi:application --host 0.0.0.0 --port 8002
+"""
+import os
+import json
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings.production')
+django.setup()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.db import close_old_connections  # noqa: E402
+
+from core.models import Organization  # noqa: E402
+from apps.detection.live_preview import preview_frame, kiosk_key  # noqa: E402
+from apps.detection.inference_scheduler import get_inference_scheduler, SchedulerBusy  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_PATH = '/ws/preview/'
+MAX_FRAME_BYTES = 2 * 1024 * 1024  # 640px JPEGs are ~50KB; anything bigger is not a preview frame
+
+
+@sync_to_async
+def _get_organization(org_code):
+    return Organization.objects.filter(org_code=org_code, is_active=True).first()
+
+
+def _run_preview(org, data, kiosk_id):
+    close_old_connections()
+    try:
+        return get_inference_scheduler().run_preview(
+            f"{org.org_code}:{kiosk_id}", preview_frame, org, data, kiosk_id
+        )
+    except SchedulerBusy as e:
+        return {'busy': True, 'reason': str(e), 'boxes': [], 'detected_name': None}
+    finally:
+        close_old_connections()
+
+
+# Inference runs in the default thread pool so kiosks don't serialize on one thread
+_run_preview_async = sync_to_async(_run_preview, thread_sensitive=False)
+
+
+class LatestFrame:
+    """Single-slot mailbox: a new frame replaces the one still waiting."""
+
+    def __init__(self):
+        self.seq = 0
+        self.dropped = 0
+        self._frame = None
+        self._ready = asyncio.Event()
+
+    def put(self, data):
+        if self._frame is not None:
+            self.dropped += 1
+        self.seq += 1
+        self._frame = (self.seq, data)
+        self._ready.set()
+
+    async def take(self):
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+async def _inference_loop(org, kiosk_id, slot, send):
+    """Process the newest frame, push the result, repeat."""
+    while True:
+        seq, data = await slot.take()
+        try:
+            result = await _run_preview_async(org, data, kiosk_id)
+        except Exception as e:
+            logger.error(f"❌ WS preview failed ({org.org_code}/{kiosk_id}): {e}")
+            result = {'boxes': [], 'detected_name': None, 'face_results': []}
+
+        result.update({'type': 'preview', 'frame': seq, 'dropped': slot.dropped})
+        await send({'type': 'websocket.send', 'text': json.dumps(result)})
+
+
+async def preview_socket(scope, receive, send):
+    params = parse_qs(scope.get('query_string', b'').decode())
+    org_code = params.get('org_code', [''])[0].upper().strip()
+    client = scope.get('client') or (None, 0)
+    headers = dict(scope.get('headers') or [])
+    # nginx.conf sets X-Real-IP on /ws/ - the peer address is the proxy's
+    real_ip = headers.get(b'x-real-ip', b'').decode('latin-1').strip()
+    kiosk_id = kiosk_key(params.get('kiosk_id', [''])[0], real_ip, client[0])
+
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    # Organization lookup once per connection instead of once per frame
+    org = await _get_organization(org_code) if org_code else None
+    if org is None:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    await send({'type': 'websocket.accept'})
+    logger.info(f"🔌 Preview socket open: {org_code}/{kiosk_id}")
+
+    slot = LatestFrame()
+    worker = asyncio.create_task(_inference_loop(org, kiosk_id, slot, send))
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            data = message.get('bytes')
+            if data and len(data) <= MAX_FRAME_BYTES:
+                slot.put(data)
+            if worker.done():
+                # Send failed (client gone) - stop reading
+                break
+    finally:
+        worker.cancel()
+        logger.info(f"🔌 Preview socket closed: {org_code}/{kiosk_id} ({slot.seq} frames, {slot.dropped} dropped)")
+
+
+async def _lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(scope, receive, send)
+    elif scope['type'] == 'websocket' and scope['path'].rstrip('/') == PREVIEW_PATH.rstrip('/'):
+        await preview_socket(scope, receive, send)
+    elif scope['type'] == 'websocket':
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
+    else:
+        await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
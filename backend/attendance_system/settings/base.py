@@ -221,6 +221,124 @@ ATTENDANCE_SETTINGS = {
     'ALLOW_MANUAL_OVERRIDE': True,
 }
 
+# Inference Scheduler (kiosk previews yield to real check-ins)
+INFERENCE_SCHEDULER = {
+    'PREVIEW_SLOTS': config('INFERENCE_PREVIEW_SLOTS', default=1, cast=int),
+    'PREVIEW_DEADLINE_MS': config('INFERENCE_PREVIEW_DEADLINE_MS', default=800, cast=int),
+    'MAX_WAITING_PREVIEWS': config('INFERENCE_MAX_WAITING_PREVIEWS', default=8, cast=int),
+    'REDIS_URL': config('REDIS_URL', default=''),  # Shares in-flight check-ins across workers; off without Redis
+    'CHECKIN_TTL_SECONDS': 90,  # A crashed worker's check-in stops blocking previews after this
+}
+
+# Optimized runtime export for uploaded YOLO models (apps/detection/yolo_export.py)
+YOLO_EXPORT = {
+    # Any of: onnx, openvino, openvino_int8 (INT8 needs a calibration dataset yaml)
+    'FORMATS': config('YOLO_EXPORT_FORMATS', default='onnx', cast=lambda v: [f.strip() for f in v.split(',') if f.strip()]),
+    'INT8_DATA': config('YOLO_EXPORT_INT8_DATA', default=''),
+    'IMGSZ': 640,
+    'DYNAMIC': True,  # Dynamic batch axis (detect_batch / tiled crops run several images per call)
+    'VALIDATION_SAMPLES': 8,
+    'VALIDATION_BATCH': 8,  # Images in the batched validation predict
+    'MIN_MATCH_RATE': 0.95,
+    'MAX_CONF_DELTA': 0.05,
+    'ALLOW_UNVALIDATED': config('YOLO_EXPORT_ALLOW_UNVALIDATED', default=False, cast=bool),
+}
+
+# Tiled / ROI inference for high-resolution vehicle photos (apps/detection/tiled_inference.py)
+YOLO_TILING = {
+    'ENABLED': config('YOLO_TILING_ENABLED', default=True, cast=bool),
+    'MODE': config('YOLO_TILING_MODE', default='roi'),  # 'roi' or 'tiles'
+    'COARSE_SIDE': 1280,
+    'FINE_SIDE': 2560,
+    'CROP_SIZE': 640,
+    'TILE_OVERLAP': 0.2,
+    'MAX_CROPS': 6,
+    'MAX_TILES': 6,
+    'CANDIDATE_CONF': 0.05,
+    'SMALL_BOX_AREA': 0.01,
+    'NMS_IOU': 0.5,
+}
+
+# Local inference server owning the CPU models (apps/detection/inference_server.py)
+INFERENCE_SERVER = {
+    'ENABLED': config('INFERENCE_SERVER_ENABLED', default=False, cast=bool),
+    'SOCKET_PATH': config('INFERENCE_SOCKET_PATH', default='/run/inference/inference.sock'),
+    'TIMEOUT': 30,
+    'BATCH_WINDOW_MS': 5,   # How long the YOLO batcher waits for frames from other workers
+    'MAX_BATCH': 8,
+    'FALLBACK_LOCAL': True,  # Run in-process while the server is unreachable
+    'RETRY_SECONDS': 10,
+}
+
+# Face detection input sizes per use (apps/faces/detection_profiles.py)
+FACE_DETECTION = {
+    'PROFILES': {
+        'default': 640,
+        'checkin': config('FACE_DET_SIZE_CHECKIN', default=320, cast=int),  # One large face expected
+        'kiosk': 640,     # Several faces in the live preview
+        'training': 640,
+    },
+    'FALLBACK_SIZE': 640,  # Second pass when the small pass finds no face
+    'SEPARATE_MODELS': config('FACE_DET_SEPARATE_MODELS', default=False, cast=bool),
+}
+
+# ArcFace micro-batching of concurrent recognition calls (apps/faces/embedding_batcher.py)
+FACE_EMBEDDING_BATCH = {
+    'ENABLED': config('FACE_EMBEDDING_BATCH_ENABLED', default=True, cast=bool),
+    'WINDOW_MS': 3,   # How long the first crop waits for others
+    'MAX_BATCH': 16,
+}
+
+# Face model version + background re-embedding on a switch (apps/faces/embedding_versions.py)
+FACE_ENGINE = {
+    'MODEL_PACK': config('FACE_MODEL_PACK', default='buffalo_l'),  # InsightFace pack; changing it re-embeds everyone
+    'REEMBED_BATCH': config('FACE_REEMBED_BATCH', default=10, cast=int),  # Employees per job run
+    'REEMBED_PAUSE_SECONDS': config('FACE_REEMBED_PAUSE_SECONDS', default=5, cast=int),  # Between runs
+    'STALE_JOB_MINUTES': 30,  # Jobs without progress this long are re-queued
+}
+
+# Per-image embedding cache for retraining (apps/faces/embedding_manifest.py); keep it outside MEDIA_ROOT
+FACE_EMBEDDING_MANIFEST = {
+    'ROOT': config('FACE_EMBEDDING_MANIFEST_ROOT', default=str(BASE_DIR / 'embedding_manifests')),
+}
+
+# Enrollment embedding selection (apps/faces/embedding_selection.py)
+FACE_EMBEDDING_SELECTION = {
+    'MAX_EMBEDDINGS': config('FACE_MAX_EMBEDDINGS', default=20, cast=int),  # Per employee
+    'DUPLICATE_SIMILARITY': 0.95,  # Cosine similarity above which two embeddings are the same shot
+}
+
+# Two-stage 1:N identification (apps/faces/identification.py)
+FACE_IDENTIFICATION = {
+    'PROTOTYPES': config('FACE_ID_PROTOTYPES', default=3, cast=int),  # k-means prototypes per employee
+    'MIN_CLUSTER_SIZE': 5,
+    'TOP_K': config('FACE_ID_TOP_K', default=5, cast=int),  # Candidates re-ranked on full embedding sets
+    'GALLERY_TTL_SECONDS': 300,
+    'CANDIDATE_CACHE_SIZE': 256,
+}
+
+# Face embedding index (services/vector_db.py, services/vector_backends)
+VECTOR_DB = {
+    # 'chroma', 'numpy' (exact, mmapped per-org files) or 'faiss' (HNSW over the same files)
+    'BACKEND': config('VECTOR_DB_BACKEND', default='chroma'),
+    # Shared by every process that searches or writes embeddings (api, preview, inference, worker)
+    'CHROMA_PATH': config('CHROMA_DB_PATH', default=str(BASE_DIR / 'chroma_db')),
+    'INDEX_PATH': config('VECTOR_INDEX_PATH', default=str(BASE_DIR / 'vector_index')),
+    'ANN_MIN_ROWS': 5000,  # faiss: smaller collections use exact search
+    'HNSW_M': config('VECTOR_DB_HNSW_M', default=32, cast=int),
+    'HNSW_CONSTRUCTION_EF': 200,
+    'HNSW_SEARCH_EF': config('VECTOR_DB_HNSW_SEARCH_EF', default=64, cast=int),
+    'DELTA_MAX_ROWS': 2000,  # numpy/faiss: rows appended since the last compaction before rebuilding the base
+    'TOMBSTONE_MAX_FRACTION': 0.2,  # numpy/faiss: compact once this share of rows is deleted
+}
+
+# Cross-worker embedding cache invalidation (services/embedding_events.py); off without Redis
+EMBEDDING_EVENTS = {
+    'REDIS_URL': config('REDIS_URL', default=''),
+    'CHANNEL': 'embeddings:changed',
+    'RECONNECT_SECONDS': 5,
+}
+
 # Storage Settings
 STORAGE_SETTINGS = {
     'IMAGE_STORAGE_PATH': config('IMAGE_STORAGE_PATH', default=str(BASE_DIR / 'media/faces')),
@@ -2,6 +2,7 @@
 Admin configuration for Core SaaS models.
 """
 from django.contrib import admin
+from django.utils.html import format_html
 from .models import (
     Organization, SaaSEmployee,
     CustomYoloModel, DetectionRequirement, LoginDetectionResult,
@@ -137,9 +138,18 @@ except Exception:
 class VehicleComplianceRecordAdmin(admin.ModelAdmin):
     list_display = ['id', 'organization', 'timestamp', 'compliance_passed']
     list_filter = ['organization', 'compliance_passed']
-    readonly_fields = ['timestamp']
+    readonly_fields = ['timestamp', 'annotated_preview']
     ordering = ['-timestamp']
     list_per_page = 25
+    
+    def annotated_preview(self, obj):
+        """Rendered (and cached) only when a record is opened."""
+        from apps.detection.annotation import get_annotated_image
+        image = get_annotated_image(obj) if obj.pk else None
+        if not image:
+            return '-'
+        return format_html('<img src="{}" style="max-width: 640px;" />', image.url)
+    annotated_preview.short_description = 'Annotated image'
 
 
 @admin.register(Trip)
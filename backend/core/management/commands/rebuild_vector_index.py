@@ -0,0 +1,24 @@
+"""
+Re-index embedding collections created with outdated index settings
+(ChromaDB collections from before the cosine switch use L2 space).
+
+Run after `migrate` on deploy:
+    python manage.py rebuild_vector_index
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Rebuild embedding collections not yet indexed in cosine space"
+
+    def handle(self, *args, **options):
+        from services.vector_db import vector_db
+
+        try:
+            rebuilt = vector_db.rebuild_legacy_collections()
+        except Exception as e:
+            raise CommandError(f"Vector index rebuild failed: {e}")
+
+        for name in rebuilt:
+            self.stdout.write(f"Rebuilt {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(rebuilt)} collections rebuilt"))
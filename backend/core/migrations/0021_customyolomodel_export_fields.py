@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_ward_number_to_charfield'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customyolomodel',
+            name='export_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('ready', 'Ready'), ('unvalidated', 'Exported, not validated'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='customyolomodel',
+            name='export_artifacts',
+            field=models.JSONField(blank=True, default=dict, help_text='{"onnx": "yolo_models/ACME/x.onnx"} relative to MEDIA_ROOT'),
+        ),
+        migrations.AddField(
+            model_name='customyolomodel',
+            name='export_report',
+            field=models.JSONField(blank=True, default=dict, help_text='Validation of each artifact against the .pt'),
+        ),
+    ]
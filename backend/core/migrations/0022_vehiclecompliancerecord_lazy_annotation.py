@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_customyolomodel_export_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehiclecompliancerecord',
+            name='annotated_image',
+            field=models.ImageField(blank=True, null=True, upload_to='vehicle_compliance/annotated/'),
+        ),
+        migrations.AddField(
+            model_name='vehiclecompliancerecord',
+            name='box_data',
+            field=models.BinaryField(blank=True, editable=False, help_text='Packed boxes: uint16 class, float16 conf, float16 normalized xyxy', null=True),
+        ),
+        migrations.AddField(
+            model_name='vehiclecompliancerecord',
+            name='box_classes',
+            field=models.JSONField(blank=True, default=list, help_text='Class names indexed by box_data'),
+        ),
+    ]
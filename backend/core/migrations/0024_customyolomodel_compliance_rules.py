@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_vehiclecompliancerecord_lazy_annotation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customyolomodel',
+            name='compliance_rules',
+            field=models.JSONField(blank=True, help_text='{"all": [{"class": "helmet", "min_confidence": 0.6}, {"any": [...]}, {"not": {...}}]}', null=True),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.9 on 2026-10-19 16:20
+
+import numpy as np
+from django.db import migrations, models
+
+# Frozen copy of apps.faces.identification.compute_prototypes at the time of
+# this migration (defaults: 3 prototypes, 5+ embeddings per cluster), so later
+# changes to the app code cannot change what the migration does.
+MAX_PROTOTYPES = 3
+MIN_CLUSTER_SIZE = 5
+KMEANS_ITERATIONS = 10
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans_centers(vectors, k):
+    centroid = _normalize(vectors.mean(axis=0))[0]
+    centers = [vectors[np.argmax(vectors @ centroid)]]
+    closest = vectors @ centers[0]
+    for _ in range(k - 1):
+        farthest = int(np.argmin(closest))
+        centers.append(vectors[farthest])
+        closest = np.maximum(closest, vectors @ vectors[farthest])
+    centers = np.stack(centers)
+
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centers.T, axis=1)
+        updated = centers.copy()
+        for c in range(k):
+            members = vectors[assignment == c]
+            if len(members):
+                updated[c] = _normalize(members.mean(axis=0))[0]
+        if np.allclose(updated, centers, atol=1e-5):
+            break
+        centers = updated
+    return centers
+
+
+def _prototypes(embeddings):
+    vectors = [e for e in (embeddings or []) if e is not None and len(e)]
+    if not vectors:
+        return []
+    dims = {len(v) for v in vectors}
+    if len(dims) > 1:
+        dim = max(dims, key=lambda d: sum(1 for v in vectors if len(v) == d))
+        vectors = [v for v in vectors if len(v) == dim]
+    vectors = _normalize(vectors)
+
+    k = min(MAX_PROTOTYPES, len(vectors) // MIN_CLUSTER_SIZE)
+    if k <= 1:
+        return [_normalize(vectors.mean(axis=0))[0].tolist()]
+    return _spherical_kmeans_centers(vectors, k).tolist()
+
+
+def compute_face_prototypes(apps, schema_editor):
+    """Prototypes for employees trained before the field existed."""
+    SaaSEmployee = apps.get_model('core', 'SaaSEmployee')
+    enrolled = SaaSEmployee.objects.filter(face_enrolled=True).values_list('id', 'face_embeddings')
+    for pk, embeddings in enrolled.iterator(chunk_size=100):
+        if embeddings:
+            SaaSEmployee.objects.filter(id=pk).update(face_prototypes=_prototypes(embeddings))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_customyolomodel_compliance_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saasemployee',
+            name='face_prototypes',
+            field=models.JSONField(blank=True, default=list, help_text='Centroid / k-means prototypes of face_embeddings (identification prefilter)'),
+        ),
+        migrations.RunPython(compute_face_prototypes, migrations.RunPython.noop),
+    ]
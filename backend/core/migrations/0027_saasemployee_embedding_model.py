@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-19 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_saasemployee_face_prototypes'),
+        ('ml_models', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saasemployee',
+            name='embedding_model',
+            field=models.ForeignKey(blank=True, help_text='Face model version face_embeddings were computed with', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ml_models.modelversion'),
+        ),
+        migrations.AddField(
+            model_name='saasemployee',
+            name='staged_embeddings',
+            field=models.JSONField(blank=True, default=list, help_text='Re-embedding output awaiting the model version switch'),
+        ),
+    ]
@@ -173,6 +173,16 @@ class SaaSEmployee(models.Model):
     # Old field kept for backward compatibility
     face_enrolled = models.BooleanField(default=False)
     face_embeddings = models.JSONField(default=list, blank=True, help_text="Active embeddings for recognition")
+    face_prototypes = models.JSONField(default=list, blank=True, help_text="Centroid / k-means prototypes of face_embeddings (identification prefilter)")
+    embedding_model = models.ForeignKey(
+        'ml_models.ModelVersion',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Face model version face_embeddings were computed with"
+    )
+    staged_embeddings = models.JSONField(default=list, blank=True, help_text="Re-embedding output awaiting the model version switch")
     face_image = models.ImageField(upload_to='employee_faces/', null=True, blank=True)
     
     # Dataset for training (images stored, not yet trained)
@@ -453,6 +463,21 @@ class CustomYoloModel(models.Model):
     classes = models.JSONField(default=list, help_text="Classes this model can detect")
     is_active = models.BooleanField(default=True)
     
+    # Optimized runtimes (ONNX / OpenVINO) produced by the background export job
+    EXPORT_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('ready', 'Ready'),
+        ('unvalidated', 'Exported, not validated'),
+        ('failed', 'Failed'),
+    ]
+    export_status = models.CharField(max_length=20, choices=EXPORT_STATUS_CHOICES, default='pending')
+    export_artifacts = models.JSONField(default=dict, blank=True, help_text='{"onnx": "yolo_models/ACME/x.onnx"} relative to MEDIA_ROOT')
+    export_report = models.JSONField(default=dict, blank=True, help_text='Validation of each artifact against the .pt')
+    
+    # Declarative rules (apps/detection/compliance_rules.py); empty = every required class
+    compliance_rules = models.JSONField(null=True, blank=True, help_text='{"all": [{"class": "helmet", "min_confidence": 0.6}, {"any": [...]}, {"not": {...}}]}')
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -463,6 +488,16 @@ class CustomYoloModel(models.Model):
     def __str__(self):
         return f"{self.name} ({self.organization.org_code})"
 
+    def clean(self):
+        super().clean()
+        if self.compliance_rules:
+            from django.core.exceptions import ValidationError
+            from apps.detection.compliance_rules import compile_rules
+            try:
+                compile_rules(self.compliance_rules)
+            except (ValueError, TypeError, KeyError) as e:
+                raise ValidationError({'compliance_rules': f'Invalid rules: {e}'})
+
 
 class DetectionRequirement(models.Model):
     """
@@ -549,8 +584,10 @@ class VehicleComplianceRecord(models.Model):
     )
     timestamp = models.DateTimeField(auto_now_add=True)
     
-    # Vehicle image
+    # Vehicle image (original photo; older records hold the annotated render)
     vehicle_image = models.ImageField(upload_to='vehicle_compliance/')
+    # Drawn lazily from the stored boxes on first view (apps/detection/annotation.py)
+    annotated_image = models.ImageField(upload_to='vehicle_compliance/annotated/', null=True, blank=True)
     
     # YOLO detections
     yolo_model = models.ForeignKey(
@@ -560,6 +597,9 @@ class VehicleComplianceRecord(models.Model):
         blank=True
     )
     detections = models.JSONField(default=dict, help_text='{"hooter": true, "number_plate": true}')
+    # Every box, packed (apps/detection/box_store.py): re-evaluate rules without inference
+    box_data = models.BinaryField(null=True, blank=True, editable=False, help_text='Packed boxes: uint16 class, float16 conf, float16 normalized xyxy')
+    box_classes = models.JSONField(default=list, blank=True, help_text='Class names indexed by box_data')
     
     # Compliance result
     compliance_passed = models.BooleanField(default=False)
@@ -1,11 +1,14 @@
 """
 Signal handlers for Core models.
 Auto-delete files from storage when model instances are deleted.
+Invalidate cached detection profiles when requirements change.
+Recompute face prototypes when an employee's active embeddings change
+(and discard re-embedding output staged from the previous images).
 """
 import os
-from django.db.models.signals import post_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save, post_init
 from django.dispatch import receiver
-from .models import LoginDetectionResult, VehicleComplianceRecord
+from .models import LoginDetectionResult, VehicleComplianceRecord, DetectionRequirement, SaaSEmployee
 
 
 @receiver(post_delete, sender=LoginDetectionResult)
@@ -49,6 +52,9 @@ def auto_delete_vehicle_image_on_delete(sender, instance, **kwargs):
     if instance.vehicle_image:
         if os.path.isfile(instance.vehicle_image.path):
             os.remove(instance.vehicle_image.path)
+    if instance.annotated_image:
+        if os.path.isfile(instance.annotated_image.path):
+            os.remove(instance.annotated_image.path)
 
 
 @receiver(pre_save, sender=VehicleComplianceRecord)
@@ -70,3 +76,84 @@ def auto_delete_vehicle_image_on_change(sender, instance, **kwargs):
     if old_file and old_file != new_file:
         if os.path.isfile(old_file.path):
             os.remove(old_file.path)
+
+
+@receiver(post_save, sender=DetectionRequirement)
+@receiver(post_delete, sender=DetectionRequirement)
+def invalidate_profile_on_requirement_change(sender, instance, **kwargs):
+    """
+    Bumps the YOLO model's profile version when a requirement is saved/deleted
+    (admin edits etc.). Bulk .update() calls must invalidate explicitly.
+    """
+    from apps.detection.detection_profile import invalidate_detection_profile
+    try:
+        invalidate_detection_profile(instance.yolo_model)
+    except Exception:
+        pass  # Parent model already deleted (cascade)
+
+
+def _snapshot_embeddings(embeddings):
+    """
+    Copy of the embedding rows to compare against in pre_save. The float
+    objects are shared, so this only copies the row lists - cheap enough for
+    every load, and unaffected by later in-place changes.
+    """
+    if embeddings is None:
+        return None
+    return [list(row) if isinstance(row, list) else row for row in embeddings]
+
+
+@receiver(post_init, sender=SaaSEmployee)
+def remember_loaded_face_embeddings(sender, instance, **kwargs):
+    """
+    Remembers the face_embeddings values that were loaded, so pre_save can
+    tell a real change (new or edited vectors, even in place) from a save
+    that reassigns equal values. Deferred (not loaded) fields are skipped.
+    """
+    instance._loaded_face_embeddings = _snapshot_embeddings(instance.__dict__.get('face_embeddings'))
+
+
+@receiver(pre_save, sender=SaaSEmployee)
+def update_face_prototypes(sender, instance, **kwargs):
+    """
+    Recomputes the identification prototypes when face_embeddings was replaced,
+    and tags the embeddings with the serving face model version.
+    """
+    embeddings = instance.__dict__.get('face_embeddings')
+    if embeddings is None:
+        return
+    if instance._state.adding:
+        if not embeddings:
+            return
+    elif isinstance(embeddings, list) and embeddings == getattr(instance, '_loaded_face_embeddings', None):
+        return
+    from apps.faces.identification import compute_prototypes
+    instance.face_prototypes = compute_prototypes(embeddings)
+    instance._face_prototypes_changed = True
+    instance._discard_staged = not instance._state.adding
+    from apps.faces.embedding_versions import serving_version
+    try:
+        instance.embedding_model = serving_version()
+    except Exception:
+        pass  # Untagged embeddings count as the serving version
+
+
+@receiver(post_save, sender=SaaSEmployee)
+def announce_face_prototypes(sender, instance, **kwargs):
+    """Drops the org's cached identification galleries in every worker (and stale staged embeddings)."""
+    instance._loaded_face_embeddings = _snapshot_embeddings(instance.__dict__.get('face_embeddings'))
+    if not getattr(instance, '_face_prototypes_changed', False):
+        return
+    instance._face_prototypes_changed = False
+    if getattr(instance, '_discard_staged', False):
+        instance._discard_staged = False
+        from apps.faces.embedding_versions import discard_staged
+        try:
+            discard_staged(instance)
+        except Exception:
+            pass  # switch_version() re-stages employees saved during the job anyway
+    from services.embedding_events import publish_change
+    try:
+        publish_change(instance.organization.org_code)
+    except Exception:
+        pass  # Galleries also expire on their own (FACE_IDENTIFICATION['GALLERY_TTL_SECONDS'])
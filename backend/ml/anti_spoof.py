@@ -36,6 +36,12 @@ def get_antispoof_session():
     """Lazy load the ONNX inference session."""
     global _ort_session, _input_name
     
+    # Held by the inference server when it is enabled
+    from apps.detection.inference_client import remote_onnx_session
+    remote, input_name = remote_onnx_session('antispoof')
+    if remote is not None:
+        return remote, input_name
+    
     if _ort_session is None:
         try:
             import onnxruntime as ort
@@ -181,10 +187,10 @@ def check_antispoof(image_path: str, face_bbox: tuple = None) -> dict:
         
         # Detect face if bbox not provided
         if face_bbox is None:
-            # Use InsightFace for face detection
+            # Use InsightFace for face detection (box only - no embedding needed)
             from apps.faces.deepface_service import get_insightface_app
-            app = get_insightface_app()
-            faces = app.get(img)
+            from apps.faces.detection_profiles import detect_faces
+            faces = detect_faces(get_insightface_app(), img, 'checkin')
             
             if not faces:
                 return {
@@ -60,41 +60,55 @@ class DeepPixBisService:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
 
-
-        # RetinaFace for accurate cropping
-        from deepface import DeepFace
+        # RetinaFace for accurate cropping (only used when no bbox is passed)
         self.detector_backend = 'retinaface'
 
-    def check_liveness(self, image_path):
+    def check_liveness(self, image_path, face_bbox=None):
         """
+        Args:
+            image_path: Path to face image
+            face_bbox: Optional (x1, y1, x2, y2) InsightFace bbox.
+                       If given, RetinaFace is skipped entirely.
+
         Returns:
             {'is_live': bool, 'score': float, 'reason': str}
         """
         try:
-            # 1. Detect and Crop Face using DeepFace (RetinaFace)
-            # We use extract_faces to get the aligned/cropped face
-            try:
-                from deepface import DeepFace
-                face_objs = DeepFace.extract_faces(
-                    img_path=image_path,
-                    detector_backend=self.detector_backend,
-                    enforce_detection=True,
-                    align=False
-                )
+            # 1a. Crop from the bbox we already have (InsightFace)
+            if face_bbox is not None:
+                import cv2
+                from ml.deep_pix_bis_onnx import crop_face_bbox
+                bgr = cv2.imread(image_path)
+                face_crop = crop_face_bbox(bgr, face_bbox) if bgr is not None else None
+                if face_crop is None:
+                    return {'is_live': False, 'score': 0, 'reason': 'Invalid face crop'}
+                img = Image.fromarray(cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB))
+
+            else:
+                # 1b. Detect and Crop Face using DeepFace (RetinaFace)
+                # We use extract_faces to get the aligned/cropped face
+                try:
+                    from deepface import DeepFace
+                    face_objs = DeepFace.extract_faces(
+                        img_path=image_path,
+                        detector_backend=self.detector_backend,
+                        enforce_detection=True,
+                        align=False
+                    )
                 
-                # Take the first/largest face
-                if not face_objs:
-                    return {'is_live': False, 'score': 0, 'reason': 'No face detected'}
+                    # Take the first/largest face
+                    if not face_objs:
+                        return {'is_live': False, 'score': 0, 'reason': 'No face detected'}
                 
-                # face_objs[0]['face'] is a normalized numpy array (0..1)
-                # We need to convert it back to PIL Image (0..255)
-                face_arr = face_objs[0]['face'] * 255
-                img = Image.fromarray(face_arr.astype('uint8')).convert('RGB')
+                    # face_objs[0]['face'] is a normalized numpy array (0..1)
+                    # We need to convert it back to PIL Image (0..255)
+                    face_arr = face_objs[0]['face'] * 255
+                    img = Image.fromarray(face_arr.astype('uint8')).convert('RGB')
                 
-            except Exception as e:
-                logger.warning(f"Face detection failed in liveness check: {e}")
-                # Fallback: Use full image if detection fails
-                img = Image.open(image_path).convert('RGB')
+                except Exception as e:
+                    logger.warning(f"Face detection failed in liveness check: {e}")
+                    # Fallback: Use full image if detection fails
+                    img = Image.open(image_path).convert('RGB')
 
             # 2. Run DeepPixBis Inference on Cropped Face
             img_tensor = self.transform(img).unsqueeze(0).to(self.device)
@@ -0,0 +1,214 @@
+"""
+DeepPixBiS ONNX Runtime
+CPU-friendly runtime for the DeepPixBiS anti-spoofing model.
+
+- Offline export of the PyTorch DenseNet model to ONNX (optionally INT8 quantized)
+- Inference through onnxruntime (no torch needed at request time)
+- Face crop from the InsightFace bbox we already have (no RetinaFace stack)
+
+Export (run once, needs torch + onnx):
+  cd backend
+  python scripts/export_deep_pix_bis_onnx.py --quantize
+"""
+import logging
+import numpy as np
+import cv2
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Model settings
+MODEL_IMG_SIZE = 224  # DenseNet input size
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+BBOX_MARGIN = 0.1  # Small margin around the InsightFace bbox (RetinaFace crops are tight too)
+LIVE_THRESHOLD = 0.5
+
+MODELS_DIR = Path(__file__).parent / "models"
+WEIGHTS_PATH = MODELS_DIR / "DeePixBiS.pth"
+ONNX_MODEL_PATH = MODELS_DIR / "DeePixBiS.onnx"
+ONNX_INT8_MODEL_PATH = MODELS_DIR / "DeePixBiS.int8.onnx"
+
+
+def export_onnx(weights_path=WEIGHTS_PATH, output_path=ONNX_MODEL_PATH, opset=13):
+    """
+    Export the PyTorch DeepPixBiS model to ONNX.
+    Batch dimension is dynamic so several faces can be scored in one run.
+    """
+    import torch
+    from ml.deep_pix_bis import DeepPixBis
+
+    model = DeepPixBis(pretrained=False)
+    state_dict = torch.load(str(weights_path), map_location='cpu')
+    model.load_state_dict(state_dict)
+    model.eval()
+
+    dummy = torch.randn(1, 3, MODEL_IMG_SIZE, MODEL_IMG_SIZE)
+    torch.onnx.export(
+        model,
+        dummy,
+        str(output_path),
+        input_names=['input'],
+        output_names=['out_map', 'out_score'],
+        dynamic_axes={'input': {0: 'batch'}, 'out_map': {0: 'batch'}, 'out_score': {0: 'batch'}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    logger.info(f"✅ DeepPixBiS exported to ONNX: {output_path}")
+    return str(output_path)
+
+
+def quantize_int8(onnx_path=ONNX_MODEL_PATH, output_path=ONNX_INT8_MODEL_PATH):
+    """Dynamic INT8 quantization of the exported model (weights int8, activations on the fly)."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(
+        model_input=str(onnx_path),
+        model_output=str(output_path),
+        weight_type=QuantType.QInt8,
+    )
+    logger.info(f"✅ DeepPixBiS INT8 model written: {output_path}")
+    return str(output_path)
+
+
+def crop_face_bbox(img: np.ndarray, bbox, margin: float = BBOX_MARGIN):
+    """
+    Crop face region from a BGR image using an (x1, y1, x2, y2) bbox.
+    Returns None if the bbox does not overlap the image.
+    """
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = [float(v) for v in bbox[:4]]
+    bw, bh = x2 - x1, y2 - y1
+    if bw <= 0 or bh <= 0:
+        return None
+
+    x1 = max(0, int(x1 - bw * margin))
+    y1 = max(0, int(y1 - bh * margin))
+    x2 = min(w, int(x2 + bw * margin))
+    y2 = min(h, int(y2 + bh * margin))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return img[y1:y2, x1:x2]
+
+
+def preprocess_face(face_crop: np.ndarray) -> np.ndarray:
+    """
+    BGR crop -> normalized CHW float32 (same as the torchvision transform
+    used by DeepPixBisService: Resize 224, ToTensor, ImageNet Normalize).
+    Resized with PIL like torchvision does for PIL images (antialiased
+    bilinear), so both runtimes see the same pixels.
+    """
+    from PIL import Image
+
+    rgb = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
+    rgb = np.asarray(Image.fromarray(rgb).resize((MODEL_IMG_SIZE, MODEL_IMG_SIZE), Image.BILINEAR))
+    x = rgb.astype(np.float32) / 255.0
+    x = (x - IMAGENET_MEAN) / IMAGENET_STD
+    return x.transpose(2, 0, 1)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class DeepPixBisOnnxService:
+    """
+    DeepPixBiS liveness via onnxruntime on CPU.
+    Same result format as DeepPixBisService.check_liveness.
+    """
+
+    def __init__(self, model_path=None, quantized=True):
+        if model_path is None:
+            model_path = ONNX_INT8_MODEL_PATH if quantized and ONNX_INT8_MODEL_PATH.exists() else ONNX_MODEL_PATH
+        self.model_path = Path(model_path)
+        self._session = None
+        self._input_name = None
+
+    def get_session(self):
+        """Lazy load the ONNX inference session."""
+        # Held by the inference server when it is enabled
+        from apps.detection.inference_client import remote_onnx_session
+        remote, input_name = remote_onnx_session('deeppixbis')
+        if remote is not None:
+            return remote, input_name
+        
+        if self._session is None:
+            import onnxruntime as ort
+
+            if not self.model_path.exists():
+                logger.error(f"DeepPixBiS ONNX model not found at {self.model_path}")
+                return None, None
+
+            self._session = ort.InferenceSession(
+                str(self.model_path),
+                providers=['CPUExecutionProvider']
+            )
+            self._input_name = self._session.get_inputs()[0].name
+            logger.info(f"✅ DeepPixBiS ONNX model loaded: {self.model_path}")
+        return self._session, self._input_name
+
+    def score_crops(self, face_crops):
+        """Score a list of BGR face crops in one batch. Returns live probabilities."""
+        session, input_name = self.get_session()
+        if session is None:
+            return None
+        batch = np.stack([preprocess_face(c) for c in face_crops]).astype(np.float32)
+        _, out_score = session.run(None, {input_name: batch})
+        return _softmax(out_score)[:, 1]
+
+    def check_liveness(self, image_path=None, face_bbox=None, img=None):
+        """
+        Args:
+            image_path: Path to image (ignored if img is given)
+            face_bbox: Optional (x1, y1, x2, y2) from InsightFace.
+                       If None, InsightFace detection is run once.
+            img: Optional already-decoded BGR image
+
+        Returns:
+            {'is_live': bool, 'score': float, 'reason': str}
+        """
+        try:
+            if img is None:
+                img = cv2.imread(image_path)
+            if img is None:
+                return {'is_live': False, 'score': 0, 'reason': 'Could not load image'}
+
+            if face_bbox is None:
+                from apps.faces.deepface_service import get_insightface_app
+                from apps.faces.detection_profiles import detect_faces
+                faces = detect_faces(get_insightface_app(), img, 'checkin')
+                if not faces:
+                    return {'is_live': False, 'score': 0, 'reason': 'No face detected'}
+                face = max(faces, key=lambda f: (f.bbox[2]-f.bbox[0]) * (f.bbox[3]-f.bbox[1]))
+                face_bbox = face.bbox
+
+            face_crop = crop_face_bbox(img, face_bbox)
+            if face_crop is None:
+                return {'is_live': False, 'score': 0, 'reason': 'Invalid face crop'}
+
+            scores = self.score_crops([face_crop])
+            if scores is None:
+                return {'is_live': True, 'score': 0.5, 'reason': 'Model not loaded'}
+
+            live_score = float(scores[0])
+            is_live = live_score > LIVE_THRESHOLD
+            return {
+                'is_live': is_live,
+                'score': live_score,
+                'reason': 'Real face' if is_live else 'Spoof detected (Texture/Pixel mismatch)'
+            }
+
+        except Exception as e:
+            logger.error(f"DeepPixBiS ONNX Check Failed: {e}")
+            return {'is_live': False, 'score': 0, 'reason': f"Error: {str(e)}"}
+
+
+# Singleton instance
+_service = None
+
+def get_deep_pix_bis_onnx_service():
+    global _service
+    if _service is None:
+        _service = DeepPixBisOnnxService()
+    return _service
@@ -17,6 +17,8 @@ import urllib.request
 import random
 import mediapipe as mp
 
+from ml.texture_features import texture_scores
+
 logger = logging.getLogger(__name__)
 
 # MediaPipe Model
@@ -304,7 +306,7 @@ def detect_texture_liveness(frames):
     """
     try:
         landmarker = get_face_landmarker()
-        scores = []
+        rois = []
         
         # Analyze a few sharp frames
         step = max(1, len(frames) // 5)
@@ -344,45 +346,23 @@ def detect_texture_liveness(frames):
             if roi.shape[0] < 8 or roi.shape[1] < 8:
                  continue
             
-            # 2. Calculate LBP (NumPy Vectorized)
-            # Center pixel
-            center = roi[1:-1, 1:-1]
-            
-            # Neighbors (Top-Left, Top, Top-Right, etc.)
-            val_ar = []
-            val_ar.append(roi[:-2, :-2] >= center) # Top-Left
-            val_ar.append(roi[:-2, 1:-1] >= center) # Top
-            val_ar.append(roi[:-2, 2:] >= center)  # Top-Right
-            val_ar.append(roi[1:-1, 2:] >= center) # Right
-            val_ar.append(roi[2:, 2:] >= center)   # Bottom-Right
-            val_ar.append(roi[2:, 1:-1] >= center) # Bottom
-            val_ar.append(roi[2:, :-2] >= center)  # Bottom-Left
-            val_ar.append(roi[1:-1, :-2] >= center) # Left
-            
-            # Convert binary array to decimal LBP codes
-            lbp_code = np.zeros_like(center, dtype=np.uint8)
-            for i, val in enumerate(val_ar):
-                lbp_code += (val.astype(np.uint8) << i)
-                
-            # 3. Calculate Histogram Entropy
-            hist, _ = np.histogram(lbp_code.ravel(), bins=256, range=(0, 256))
-            hist = hist.astype("float")
-            hist /= (hist.sum() + 1e-7)
-            
-            # Shannon Entropy
-            entropy = -np.sum(hist * np.log2(hist + 1e-7))
-            scores.append(entropy)
+            rois.append(roi)
             
-        if not scores:
+        if not rois:
             return 0.5, "No face found for texture scan"
-            
-        avg_entropy = np.mean(scores)
+        
+        # 2. LBP Entropy + Sharpness for all sampled ROIs in one batch
+        entropies, sharpness = texture_scores(rois)
+        avg_entropy = float(np.mean(entropies))
         
         # QUALITY CHECK: Detect if camera is blurry/low-quality
-        # Calculate Laplacian Variance of the face ROI (Sharpness)
+        # Laplacian Variance per frame (Sharpness), median across the burst
         # Sharp image > 100, Blurry < 50
-        laplacian_var = cv2.Laplacian(roi, cv2.CV_64F).var()
-        logger.info(f"🧬 Texture Entropy: {avg_entropy:.4f} | Sharpness: {laplacian_var:.2f}")
+        laplacian_var = float(np.median(sharpness))
+        logger.info(
+            f"🧬 Texture Entropy: {avg_entropy:.4f} | Sharpness: {laplacian_var:.2f} "
+            f"(per-frame: {', '.join(f'{v:.0f}' for v in sharpness)})"
+        )
         
         # Adaptive Threshold
         if laplacian_var < 50.0:
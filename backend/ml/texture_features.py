@@ -0,0 +1,105 @@
+"""
+Texture Features for Passive Liveness
+Batched LBP entropy + Laplacian sharpness over all sampled face ROIs of a burst.
+
+- ROIs are scored at their own size (no cropping to the smallest face of the
+  burst - entropy and sharpness are compared against absolute thresholds);
+  same-sized ROIs are stacked and processed together
+- LBP codes: one strided 3x3 window view + bit-weight lookup table (no per-neighbour loop)
+- Histograms: single np.bincount over all frames (frame-offset codes, ragged sizes)
+- Sharpness: per-frame Laplacian variance (same kernel/border as cv2.Laplacian ksize=1)
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Bit weight of each neighbour in the 3x3 window (centre = 0).
+# Order matches the legacy implementation:
+# TL=1, T=2, TR=4, R=8, BR=16, B=32, BL=64, L=128
+LBP_WEIGHTS = np.array([
+    [1, 2, 4],
+    [128, 0, 8],
+    [64, 32, 16],
+], dtype=np.uint8)
+
+LBP_BINS = 256
+
+LAPLACIAN_KERNEL = np.array([
+    [0, 1, 0],
+    [1, -4, 1],
+    [0, 1, 0],
+], dtype=np.float64)
+
+
+def group_by_shape(rois):
+    """
+    Stack same-sized ROIs together.
+
+    Returns:
+        List of (indices into rois, (N, H, W) stack)
+    """
+    groups = {}
+    for i, r in enumerate(rois):
+        groups.setdefault(r.shape[:2], []).append(i)
+    return [(indices, np.stack([rois[i] for i in indices])) for indices in groups.values()]
+
+
+def lbp_codes(stack: np.ndarray) -> np.ndarray:
+    """
+    8-neighbour LBP codes for a (N, H, W) uint8 stack -> (N, H-2, W-2) uint8.
+    """
+    windows = sliding_window_view(stack, (3, 3), axis=(1, 2))  # (N, H-2, W-2, 3, 3), no copy
+    center = stack[:, 1:-1, 1:-1, None, None]
+    bits = (windows >= center).view(np.uint8)
+    # Max sum is 255, so uint8 accumulation cannot overflow
+    return np.einsum('nhwij,ij->nhw', bits, LBP_WEIGHTS, dtype=np.uint8)
+
+
+def lbp_histograms(codes) -> np.ndarray:
+    """
+    Per-frame 256-bin histograms via one bincount -> (N, 256).
+    codes: (N, H, W) array, or a list of per-frame code arrays of any sizes.
+    """
+    n = len(codes)
+    sizes = np.array([c.size for c in codes], dtype=np.int64)
+    flat = np.concatenate([np.ravel(c) for c in codes]).astype(np.int64) if n else np.zeros(0, dtype=np.int64)
+    flat += np.repeat(np.arange(n, dtype=np.int64) * LBP_BINS, sizes)
+    return np.bincount(flat, minlength=n * LBP_BINS).reshape(n, LBP_BINS)
+
+
+def entropy_from_histograms(hist: np.ndarray) -> np.ndarray:
+    """Shannon entropy of each histogram row -> (N,)."""
+    hist = hist.astype(np.float64)
+    hist /= (hist.sum(axis=1, keepdims=True) + 1e-7)
+    return -np.sum(hist * np.log2(hist + 1e-7), axis=1)
+
+
+def lbp_entropy(stack: np.ndarray) -> np.ndarray:
+    """Shannon entropy of the LBP histogram for each frame -> (N,)."""
+    return entropy_from_histograms(lbp_histograms(lbp_codes(stack)))
+
+
+def laplacian_variance(stack: np.ndarray) -> np.ndarray:
+    """
+    Per-frame Laplacian variance (sharpness) -> (N,).
+    'reflect' padding == cv2.BORDER_REFLECT_101, the cv2.Laplacian default.
+    """
+    padded = np.pad(stack.astype(np.float64), ((0, 0), (1, 1), (1, 1)), mode='reflect')
+    windows = sliding_window_view(padded, (3, 3), axis=(1, 2))
+    lap = np.einsum('nhwij,ij->nhw', windows, LAPLACIAN_KERNEL)
+    return lap.reshape(lap.shape[0], -1).var(axis=1)
+
+
+def texture_scores(rois):
+    """
+    Score a burst of grayscale face ROIs in one batch.
+
+    Returns:
+        (entropies, sharpness): two float arrays of shape (N,)
+    """
+    codes = [None] * len(rois)
+    sharpness = np.zeros(len(rois), dtype=np.float64)
+    for indices, stack in group_by_shape(rois):
+        for i, frame_codes in zip(indices, lbp_codes(stack)):
+            codes[i] = frame_codes
+        sharpness[indices] = laplacian_variance(stack)
+    return entropy_from_histograms(lbp_histograms(codes)), sharpness
@@ -0,0 +1,136 @@
+"""
+Accuracy vs latency comparison for DeepPixBiS runtimes:
+  - PyTorch (original DeepPixBisService, InsightFace bbox crop)
+  - ONNX FP32
+  - ONNX INT8 (dynamic quantization)
+
+All runtimes get the same InsightFace bbox per image, so only the model differs.
+
+Dataset layout (labels taken from the folder name):
+  <data_dir>/live/*.jpg
+  <data_dir>/spoof/*.jpg
+
+Usage:
+  cd backend
+  python scripts/compare_deep_pix_bis.py path/to/data_dir [--skip-torch]
+"""
+import os
+import sys
+import time
+import argparse
+import django
+
+# Add backend directory to Python path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings.development')
+django.setup()
+
+import cv2
+import numpy as np
+
+from ml.deep_pix_bis_onnx import (
+    DeepPixBisOnnxService, ONNX_MODEL_PATH, ONNX_INT8_MODEL_PATH, LIVE_THRESHOLD
+)
+
+
+def load_samples(data_dir):
+    """Return list of (path, label) where label 1 = live, 0 = spoof."""
+    samples = []
+    for label_name, label in (('live', 1), ('spoof', 0)):
+        folder = os.path.join(data_dir, label_name)
+        if not os.path.isdir(folder):
+            continue
+        for f in sorted(os.listdir(folder)):
+            if f.lower().endswith(('.jpg', '.jpeg', '.png')):
+                samples.append((os.path.join(folder, f), label))
+    return samples
+
+
+def detect_bboxes(samples):
+    """Run InsightFace once per image; images without a face are dropped."""
+    from apps.faces.deepface_service import get_insightface_app
+    app = get_insightface_app()
+
+    prepared = []
+    for path, label in samples:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        faces = app.get(img)
+        if not faces:
+            print(f"  ⚠️ No face: {path}")
+            continue
+        face = max(faces, key=lambda f: (f.bbox[2]-f.bbox[0]) * (f.bbox[3]-f.bbox[1]))
+        prepared.append((path, label, face.bbox.tolist()))
+    return prepared
+
+
+def run_runtime(name, score_fn, prepared, warmup=3):
+    """Score every sample, return (scores, latencies_ms)."""
+    for path, _, bbox in prepared[:warmup]:
+        score_fn(path, bbox)
+
+    scores, latencies = [], []
+    for path, _, bbox in prepared:
+        t0 = time.perf_counter()
+        scores.append(score_fn(path, bbox))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    print(f"  ✓ {name}: {len(scores)} images scored")
+    return np.array(scores), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DeepPixBiS accuracy vs latency')
+    parser.add_argument('data_dir', help='Folder with live/ and spoof/ subfolders')
+    parser.add_argument('--skip-torch', action='store_true', help='Do not load the PyTorch model')
+    args = parser.parse_args()
+
+    samples = load_samples(args.data_dir)
+    if not samples:
+        print("❌ No images found (expected live/ and spoof/ subfolders)")
+        sys.exit(1)
+
+    print(f"📸 {len(samples)} images, detecting faces with InsightFace...")
+    prepared = detect_bboxes(samples)
+    labels = np.array([label for _, label, _ in prepared])
+
+    runtimes = {}
+    if not args.skip_torch:
+        from ml.deep_pix_bis import get_antispoof_service
+        torch_service = get_antispoof_service()
+        runtimes['pytorch'] = lambda p, b: torch_service.check_liveness(p, face_bbox=b)['score']
+
+    for name, model_path in (('onnx_fp32', ONNX_MODEL_PATH), ('onnx_int8', ONNX_INT8_MODEL_PATH)):
+        if not model_path.exists():
+            print(f"  ⚠️ Skipping {name}: {model_path} not found")
+            continue
+        service = DeepPixBisOnnxService(model_path=model_path)
+        runtimes[name] = (lambda s: lambda p, b: s.check_liveness(p, face_bbox=b)['score'])(service)
+
+    results = {name: run_runtime(name, fn, prepared) for name, fn in runtimes.items()}
+    reference = results.get('pytorch', results.get('onnx_fp32'))
+
+    print("\n" + "=" * 86)
+    print(f"{'runtime':<12}{'accuracy':>10}{'agree w/ ref':>14}{'mean |Δscore|':>15}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    print("=" * 86)
+    for name, (scores, latencies) in results.items():
+        preds = (scores > LIVE_THRESHOLD).astype(int)
+        accuracy = (preds == labels).mean() * 100
+        if reference is not None:
+            ref_preds = (reference[0] > LIVE_THRESHOLD).astype(int)
+            agreement = (preds == ref_preds).mean() * 100
+            score_diff = np.abs(scores - reference[0]).mean()
+        else:
+            agreement, score_diff = 100.0, 0.0
+        print(
+            f"{name:<12}{accuracy:>9.1f}%{agreement:>13.1f}%{score_diff:>15.4f}"
+            f"{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 95):>10.1f}{latencies.mean():>10.1f}"
+        )
+    print("=" * 86)
+    print("Latency includes image decode + crop + preprocessing + inference (bbox given).")
+
+
+if __name__ == '__main__':
+    main()
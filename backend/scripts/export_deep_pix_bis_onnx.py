@@ -0,0 +1,51 @@
+"""
+Export DeepPixBiS (PyTorch) to ONNX, optionally with dynamic INT8 quantization.
+Run once on a machine with torch + onnx installed; the API servers only need onnxruntime.
+
+Usage:
+  cd backend
+  python scripts/export_deep_pix_bis_onnx.py
+  python scripts/export_deep_pix_bis_onnx.py --quantize
+"""
+import os
+import sys
+import argparse
+
+# Add backend directory to Python path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from ml.deep_pix_bis_onnx import (
+    export_onnx, quantize_int8,
+    WEIGHTS_PATH, ONNX_MODEL_PATH, ONNX_INT8_MODEL_PATH
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export DeepPixBiS to ONNX')
+    parser.add_argument('--weights', default=str(WEIGHTS_PATH), help='Path to DeePixBiS.pth')
+    parser.add_argument('--output', default=str(ONNX_MODEL_PATH), help='Output .onnx path')
+    parser.add_argument('--quantize', action='store_true', help='Also write a dynamic INT8 model')
+    parser.add_argument('--int8-output', default=str(ONNX_INT8_MODEL_PATH), help='Output INT8 .onnx path')
+    parser.add_argument('--opset', type=int, default=13)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        print(f"❌ Weights not found: {args.weights}")
+        sys.exit(1)
+
+    print(f"🔄 Exporting {args.weights} -> {args.output}")
+    export_onnx(args.weights, args.output, opset=args.opset)
+    print(f"✅ FP32 model: {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+    if args.quantize:
+        print(f"🔄 Quantizing -> {args.int8_output}")
+        quantize_int8(args.output, args.int8_output)
+        print(f"✅ INT8 model: {args.int8_output} ({os.path.getsize(args.int8_output) / 1e6:.1f} MB)")
+
+    print("\nNext: python scripts/compare_deep_pix_bis.py <labelled_dir> to check accuracy vs latency")
+
+
+if __name__ == '__main__':
+    main()
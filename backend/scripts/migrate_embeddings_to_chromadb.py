@@ -46,6 +46,8 @@ def migrate_embeddings():
         )
         
         org_migrated = 0
+        # Written per model type in one bulk upsert after the loop
+        chroma_rows = {'light': [], 'heavy': []}
         
         for emp in employees:
             # Migrate light embeddings (128-dim)
@@ -70,30 +72,22 @@ def migrate_embeddings():
                 print(f"  ✓ Fixed database record for {emp.full_name}")
 
             if len(light_embeddings) >= 3:
-                success = vector_db.add_embeddings(
-                    org_code=org.org_code,
-                    model_type='light',
-                    employee_id=emp.employee_id,
-                    embeddings=light_embeddings,
-                    employee_name=emp.full_name
-                )
-                if success:
-                    total_light += 1
-                    print(f"  ✓ ChromaDB Light: {emp.full_name} ({len(light_embeddings)} embeddings)")
+                chroma_rows['light'].append({
+                    'employee_id': emp.employee_id,
+                    'employee_name': emp.full_name,
+                    'embeddings': light_embeddings
+                })
+                print(f"  ✓ ChromaDB Light: {emp.full_name} ({len(light_embeddings)} embeddings)")
             
             # Migrate heavy embeddings (512-dim)
             heavy_embeddings = emp.heavy_embeddings or []
             if len(heavy_embeddings) >= 3:
-                success = vector_db.add_embeddings(
-                    org_code=org.org_code,
-                    model_type='heavy',
-                    employee_id=emp.employee_id,
-                    embeddings=heavy_embeddings,
-                    employee_name=emp.full_name
-                )
-                if success:
-                    total_heavy += 1
-                    print(f"  ✓ Heavy: {emp.full_name} ({len(heavy_embeddings)} embeddings)")
+                chroma_rows['heavy'].append({
+                    'employee_id': emp.employee_id,
+                    'employee_name': emp.full_name,
+                    'embeddings': heavy_embeddings
+                })
+                print(f"  ✓ Heavy: {emp.full_name} ({len(heavy_embeddings)} embeddings)")
             
             # Also try face_embeddings field (active model)
             if not light_embeddings and not heavy_embeddings:
@@ -103,24 +97,22 @@ def migrate_embeddings():
                     dim = len(active_embeddings[0]) if active_embeddings else 0
                     model_type = 'light' if dim <= 200 else 'heavy'
                     
-                    success = vector_db.add_embeddings(
-                        org_code=org.org_code,
-                        model_type=model_type,
-                        employee_id=emp.employee_id,
-                        embeddings=active_embeddings,
-                        employee_name=emp.full_name
-                    )
-                    if success:
-                        if model_type == 'light':
-                            total_light += 1
-                        else:
-                            total_heavy += 1
-                        print(f"  ✓ {model_type.title()}: {emp.full_name} ({len(active_embeddings)} embeddings, {dim}-dim)")
+                    chroma_rows[model_type].append({
+                        'employee_id': emp.employee_id,
+                        'employee_name': emp.full_name,
+                        'embeddings': active_embeddings
+                    })
+                    print(f"  ✓ {model_type.title()}: {emp.full_name} ({len(active_embeddings)} embeddings, {dim}-dim)")
             
             org_migrated += 1
         
         total_migrated += org_migrated
         
+        if vector_db.bulk_upsert_embeddings(org.org_code, 'light', chroma_rows['light']):
+            total_light += len(chroma_rows['light'])
+        if vector_db.bulk_upsert_embeddings(org.org_code, 'heavy', chroma_rows['heavy']):
+            total_heavy += len(chroma_rows['heavy'])
+        
         # Print organization stats
         stats = vector_db.get_collection_stats(org.org_code, 'heavy')
         print(f"  📊 {org.org_code}: {stats}")
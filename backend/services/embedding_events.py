@@ -0,0 +1,157 @@
+"""
+Embedding Change Events
+Cross-process invalidation for everything that caches face embeddings in a
+worker (VectorDBService stats / collection handles, DeepFaceService's JSON
+cache, kiosk preview identities).
+
+Every embedding write calls publish_change(org_code, model_type):
+1. PUBLISH {'org_code', 'model_type', 'seq', 'origin'} on CHANNEL, seq
+   numbering this process' events
+2. Run this process' own callbacks right away
+
+Each worker runs one subscriber thread (started lazily after fork by
+ensure_listening()) that drops only the affected org's caches; they reload on
+next use. Events are deduplicated by (origin, seq). On every (re)subscribe
+the subscriber invalidates everything, since events may have been missed
+before it was listening - pub/sub keeps no history, so that resync is what
+recovers from a missed event.
+
+Without REDIS_URL (development, single process) only the local callbacks run.
+"""
+import os
+import json
+import time
+import socket
+import threading
+import logging
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'EMBEDDING_EVENTS', {})
+REDIS_URL = _config.get('REDIS_URL', '')
+CHANNEL = _config.get('CHANNEL', 'embeddings:changed')
+RECONNECT_SECONDS = _config.get('RECONNECT_SECONDS', 5)
+
+# org_code for stores that are not scoped to an organization
+GLOBAL = '*'
+
+_callbacks = []  # (callback, local)
+_seq = 0  # Events published by this process
+_seen = deque(maxlen=1024)  # (origin, seq) of recently handled events
+_lock = threading.Lock()
+_listener_pid = None
+_redis = None
+
+
+def _origin():
+    # Per process - module state is shared by forked workers, the pid is not
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def on_change(callback, local=True):
+    """
+    Register callback(org_code, model_type), run when embeddings change.
+    org_code None means "anything may have changed".
+
+    Args:
+        local: Also run for writes made by this process (False when the
+            writer already updated its own cache in place)
+    """
+    _callbacks.append((callback, local))
+    return callback
+
+
+def _dispatch(org_code, model_type, local):
+    for callback, wants_local in list(_callbacks):
+        if local and not wants_local:
+            continue
+        try:
+            callback(org_code, model_type)
+        except Exception as e:
+            logger.error(f"Embedding change callback failed: {e}")
+
+
+def _client():
+    global _redis
+    if not REDIS_URL:
+        return None
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(REDIS_URL, socket_timeout=2)
+    return _redis
+
+
+def publish_change(org_code, model_type=None):
+    """
+    Announce an embedding write for an org (None: anything may have changed).
+    Never raises - a lost event only delays other workers until their next
+    resync.
+    """
+    global _seq
+    client = _client()
+    if client is not None:
+        with _lock:
+            _seq += 1
+            seq = _seq
+        try:
+            client.publish(CHANNEL, json.dumps({
+                'org_code': org_code,
+                'model_type': model_type,
+                'seq': seq,
+                'origin': _origin(),
+            }))
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding change for {org_code} not published: {e}")
+
+    _dispatch(org_code, model_type, local=True)
+
+
+def _handle(message):
+    try:
+        event = json.loads(message['data'])
+    except (TypeError, ValueError):
+        return
+    if event.get('origin') == _origin():
+        return  # Our own write - already applied locally
+
+    org_code = event.get('org_code')
+    key = (event.get('origin'), event.get('seq'))
+    if key[1] is not None:
+        with _lock:
+            if key in _seen:
+                return  # Redelivered
+            _seen.append(key)
+    logger.debug(f"Embeddings changed for {org_code} ({event.get('model_type')})")
+    _dispatch(org_code, event.get('model_type'), local=False)
+
+
+def _listen():
+    import redis
+
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(REDIS_URL).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # Events published before we (re)subscribed are gone - caches filled
+            # meanwhile may be stale
+            _dispatch(None, None, local=False)
+            for message in pubsub.listen():
+                _handle(message)
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding events subscriber disconnected: {e}")
+            time.sleep(RECONNECT_SECONDS)
+
+
+def ensure_listening():
+    """Start this process' subscriber (no-op once running; call from request paths, not import time)."""
+    global _listener_pid
+    pid = os.getpid()
+    if not REDIS_URL or _listener_pid == pid:
+        return
+    with _lock:
+        if _listener_pid == pid:
+            return
+        _listener_pid = pid
+    threading.Thread(target=_listen, name='embedding-events', daemon=True).start()
@@ -0,0 +1,27 @@
+"""
+Vector index backends behind services.vector_db.VectorDBService.
+
+    chroma  ChromaDB PersistentClient (default)
+    numpy   exact search over per-org memory-mapped .npy files
+    faiss   FAISS HNSW graph over the same files, for large tenants
+
+Chosen by VECTOR_DB['BACKEND'].
+"""
+from .base import VectorBackend
+
+
+def get_backend(name: str) -> VectorBackend:
+    """Backend instance by name."""
+    if name == 'chroma':
+        from .chroma import ChromaBackend
+        return ChromaBackend()
+    if name == 'numpy':
+        from .file_index import NumpyBackend
+        return NumpyBackend()
+    if name == 'faiss':
+        from .file_index import FaissBackend
+        return FaissBackend()
+    raise ValueError(f"Unknown vector backend: {name}")
+
+
+__all__ = ['VectorBackend', 'get_backend']
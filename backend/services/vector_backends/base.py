@@ -0,0 +1,68 @@
+"""
+Vector backend interface.
+
+Every backend stores rows in per-(org, model_type) collections:
+    id         '{employee_id}_{embedding_index}'
+    embedding  unit-normalized vector
+    metadata   {'employee_id', 'employee_name', 'embedding_index', 'model_version'}
+and scores queries by cosine similarity (0-1).
+"""
+from typing import List, Dict, Optional, Tuple
+
+
+class VectorBackend:
+    """Storage + nearest-neighbour search for one kind of index."""
+
+    name = ''
+
+    @staticmethod
+    def collection_name(org_code: str, model_type: str) -> str:
+        """Collection (or index directory) name for org + model type."""
+        # ChromaDB collection names: only alphanumeric and underscores
+        safe_org = org_code.replace('-', '_').replace(' ', '_').lower()
+        return f"{safe_org}_{model_type}_embeddings"
+
+    def upsert(self, org_code: str, model_type: str, ids: List[str],
+               embeddings: List[List[float]], metadatas: List[Dict]):
+        """Insert or overwrite rows by id."""
+        raise NotImplementedError
+
+    def delete(self, org_code: str, model_type: str, ids: List[str]):
+        """Remove rows by id (unknown ids are ignored)."""
+        raise NotImplementedError
+
+    def replace(self, org_code: str, model_type: str, delete_ids: List[str], ids: List[str],
+                embeddings: List[List[float]], metadatas: List[Dict]):
+        """Delete delete_ids, then upsert the given rows."""
+        if delete_ids:
+            self.delete(org_code, model_type, delete_ids)
+        if ids:
+            self.upsert(org_code, model_type, ids, embeddings, metadatas)
+
+    def get_rows(self, org_code: str, model_type: str, employee_ids: Optional[List[str]] = None,
+                 ids: Optional[List[str]] = None) -> List[Tuple[str, Dict]]:
+        """(id, metadata) of all rows, or of the given employees / ids."""
+        raise NotImplementedError
+
+    def query(self, org_code: str, model_type: str, query_embeddings: List[List[float]],
+              n_results: int, count: Optional[int] = None) -> List[List[Tuple[str, float, float, Dict]]]:
+        """
+        Per query, up to n_results (id, distance, similarity, metadata), most similar first.
+        count: rows in the collection when the caller tracks it (VectorDBService stats).
+        """
+        raise NotImplementedError
+
+    def drop(self, org_code: str, model_type: str):
+        """Delete the whole collection."""
+        raise NotImplementedError
+
+    def promote(self, org_code: str, source_model_type: str, target_model_type: str):
+        """Replace the target collection with the source one (which goes away)."""
+        raise NotImplementedError
+
+    def invalidate(self, org_code: Optional[str] = None, model_type: Optional[str] = None):
+        """Forget cached handles / loaded indexes (all, one org, or one org + model type)."""
+
+    def rebuild_legacy(self) -> List[str]:
+        """Re-index collections created with outdated index settings. Returns their names."""
+        return []
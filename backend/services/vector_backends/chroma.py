@@ -0,0 +1,215 @@
+"""
+ChromaDB backend: one PersistentClient collection per org + model type.
+"""
+import os
+import logging
+import threading
+from typing import List
+import chromadb
+from chromadb.config import Settings
+from django.conf import settings
+
+from .base import VectorBackend
+
+logger = logging.getLogger(__name__)
+
+# Get the base directory for ChromaDB storage
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_config = getattr(settings, 'VECTOR_DB', {})
+CHROMA_DB_PATH = _config.get('CHROMA_PATH', os.path.join(BASE_DIR, 'chroma_db'))
+
+# ArcFace embeddings are compared by cosine everywhere else (0.4-0.5 distance thresholds),
+# so collections index in cosine space: distance = 1 - cos, similarity = cos.
+HNSW_METADATA = {
+    'hnsw:space': 'cosine',
+    'hnsw:M': _config.get('HNSW_M', 32),
+    'hnsw:construction_ef': _config.get('HNSW_CONSTRUCTION_EF', 200),
+    'hnsw:search_ef': _config.get('HNSW_SEARCH_EF', 64),
+}
+REBUILD_BATCH_SIZE = 1000
+UPSERT_BATCH_SIZE = 2000  # Below Chroma's max batch size (~5k rows)
+
+
+class ChromaBackend(VectorBackend):
+    """ChromaDB PersistentClient in VECTOR_DB['CHROMA_PATH'] (default backend/chroma_db)."""
+
+    name = 'chroma'
+
+    def __init__(self):
+        # Collection handles per (org_code, model_type), so calls skip get_or_create round trips
+        self._collections = {}
+        self._lock = threading.Lock()
+        try:
+            # Ensure directory exists
+            os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+
+            # Create persistent client
+            self._client = chromadb.PersistentClient(
+                path=CHROMA_DB_PATH,
+                settings=Settings(
+                    anonymized_telemetry=False,
+                    allow_reset=True
+                )
+            )
+            logger.info(f"ChromaDB initialized at: {CHROMA_DB_PATH}")
+        except Exception as e:
+            logger.error(f"Failed to initialize ChromaDB: {e}")
+            raise
+
+    def _collection(self, org_code: str, model_type: str):
+        """Get or create a collection for an organization's embeddings (handle cached per process)."""
+        key = (org_code, model_type)
+        collection = self._collections.get(key)
+        if collection is not None:
+            return collection
+
+        name = self.collection_name(org_code, model_type)
+        try:
+            # Existing collections are opened as they are: on chromadb 0.4.x
+            # get_or_create_collection(metadata=...) overwrites the stored metadata,
+            # relabelling a legacy L2 index as cosine (see _similarity / rebuild_legacy)
+            collection = self._client.get_collection(name)
+            if (collection.metadata or {}).get('hnsw:space', 'l2') != 'cosine':
+                logger.warning(
+                    f"⚠️ Collection {name} is still indexed in L2 space; "
+                    f"run `python manage.py rebuild_vector_index`"
+                )
+        except Exception:
+            # Determine embedding dimension based on model type
+            # Light model: 128-dim, Heavy model: 512-dim
+            metadata = {"model_type": model_type, "org_code": org_code, **HNSW_METADATA}
+            collection = self._client.get_or_create_collection(name=name, metadata=metadata)
+        with self._lock:
+            self._collections[key] = collection
+        return collection
+
+    @staticmethod
+    def _similarity(collection, distance: float) -> float:
+        """
+        Cosine similarity (0-1) from a Chroma distance.
+        Collections created before the cosine switch use squared L2, which
+        for unit vectors is 2 - 2*cos.
+        """
+        space = (collection.metadata or {}).get('hnsw:space', 'l2')
+        if space == 'l2':
+            similarity = 1 - distance / 2
+        else:  # 'cosine' (1 - cos) and 'ip' (1 - dot)
+            similarity = 1 - distance
+        return min(max(similarity, 0.0), 1.0)
+
+    def upsert(self, org_code, model_type, ids, embeddings, metadatas):
+        collection = self._collection(org_code, model_type)
+        for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+            batch = slice(start, start + UPSERT_BATCH_SIZE)
+            collection.upsert(ids=ids[batch], embeddings=embeddings[batch], metadatas=metadatas[batch])
+
+    def delete(self, org_code, model_type, ids):
+        if ids:
+            self._collection(org_code, model_type).delete(ids=list(ids))
+
+    def get_rows(self, org_code, model_type, employee_ids=None, ids=None):
+        collection = self._collection(org_code, model_type)
+        if ids is not None:
+            results = collection.get(ids=list(ids), include=['metadatas'])
+        elif employee_ids is not None:
+            results = collection.get(where={"employee_id": {"$in": list(employee_ids)}}, include=['metadatas'])
+        else:
+            results = collection.get(include=['metadatas'])
+        metadatas = results['metadatas'] or [{}] * len(results['ids'])
+        return [(id_, meta or {}) for id_, meta in zip(results['ids'], metadatas)]
+
+    def query(self, org_code, model_type, query_embeddings, n_results, count=None):
+        collection = self._collection(org_code, model_type)
+        if count is None:
+            count = collection.count()  # Callers with cached stats pass it: no extra round trip
+        if count == 0:
+            return [[] for _ in query_embeddings]
+
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=min(n_results, count),
+            include=['metadatas', 'distances']
+        )
+        all_hits = []
+        for q, ids in enumerate(results['ids']):
+            hits = []
+            for i, id_ in enumerate(ids):
+                distance = results['distances'][q][i] if results['distances'] else 0
+                metadata = results['metadatas'][q][i] if results['metadatas'] else {}
+                hits.append((id_, distance, self._similarity(collection, distance), metadata or {}))
+            hits.sort(key=lambda hit: hit[2], reverse=True)
+            all_hits.append(hits)
+        return all_hits
+
+    def drop(self, org_code, model_type):
+        collection_name = self.collection_name(org_code, model_type)
+        try:
+            self._client.delete_collection(collection_name)
+            logger.info(f"Deleted collection: {collection_name}")
+        except Exception:
+            pass  # Collection may not exist
+        self.invalidate(org_code, model_type)
+
+    def promote(self, org_code, source_model_type, target_model_type):
+        source = self._client.get_collection(self.collection_name(org_code, source_model_type))
+        self.drop(org_code, target_model_type)
+        source.modify(name=self.collection_name(org_code, target_model_type))
+        self.invalidate(org_code)
+        logger.info(f"Promoted {source_model_type} collection of {org_code} to {target_model_type}")
+
+    def invalidate(self, org_code=None, model_type=None):
+        with self._lock:
+            for key in list(self._collections):
+                if org_code is None or (key[0] == org_code and model_type in (None, key[1])):
+                    del self._collections[key]
+
+    def rebuild_collection(self, collection_name: str) -> int:
+        """
+        Re-create a collection with the current HNSW settings (space, M, ef).
+        Chroma can't change the space of an existing index, so the data is
+        copied into a new collection which then takes over the name.
+
+        Returns:
+            Number of embeddings copied
+        """
+        old = self._client.get_collection(collection_name)
+        data = old.get(include=['embeddings', 'metadatas', 'documents'])
+        metadata = {k: v for k, v in (old.metadata or {}).items() if not k.startswith('hnsw:')}
+
+        staging_name = f"{collection_name}_rebuild"
+        try:
+            self._client.delete_collection(staging_name)  # Left over from an interrupted rebuild
+        except Exception:
+            pass
+        staging = self._client.create_collection(name=staging_name, metadata={**metadata, **HNSW_METADATA})
+
+        ids = data['ids']
+        for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+            batch = slice(start, start + REBUILD_BATCH_SIZE)
+            staging.add(
+                ids=ids[batch],
+                embeddings=data['embeddings'][batch],
+                metadatas=data['metadatas'][batch] if data['metadatas'] else None,
+                documents=data['documents'][batch] if data['documents'] else None
+            )
+
+        self._client.delete_collection(collection_name)
+        staging.modify(name=collection_name)
+        self.invalidate()  # Cached handles point at the deleted collection
+        logger.info(f"Rebuilt collection {collection_name} ({len(ids)} embeddings, cosine)")
+        return len(ids)
+
+    def rebuild_legacy(self) -> List[str]:
+        """Rebuild every embeddings collection not yet indexed in cosine space."""
+        rebuilt = []
+        for entry in self._client.list_collections():
+            # Chroma >= 0.6 lists names, older versions Collection objects
+            name = entry if isinstance(entry, str) else entry.name
+            if not name.endswith('_embeddings'):
+                continue
+            collection = self._client.get_collection(name)
+            if (collection.metadata or {}).get('hnsw:space') == 'cosine':
+                continue
+            self.rebuild_collection(name)
+            rebuilt.append(name)
+        return rebuilt
@@ -0,0 +1,473 @@
+"""
+Memory-mapped per-org index files (numpy / faiss backends).
+
+Layout under VECTOR_DB['INDEX_PATH'], one directory per org + model type:
+    <org>_<model>_embeddings/
+        CURRENT          version number of the live snapshot
+        b<N>/vectors.npy base segment: float32, unit-normalized, one row per embedding
+        b<N>/index.faiss HNSW graph of the base (faiss backend, ANN_MIN_ROWS+ rows only)
+        v<N>/rows.json   {'ids', 'metadatas', 'base', 'base_rows', 'deleted'}
+        v<N>/delta.npy   rows appended since the base was built
+
+Workers np.load(mmap_mode='r') the vectors, so every gunicorn worker reads
+the same pages from the OS page cache instead of holding a private copy.
+Each query re-reads CURRENT (a few bytes) and remaps when it moved on.
+
+Base segments are immutable. A write (under an flock) only appends the new
+rows to the delta and tombstones deleted / overwritten rows (row positions in
+'deleted'), then publishes v<N+1> and swaps CURRENT atomically, so readers
+never see a half-written index and a single-employee write costs O(delta),
+not a full copy plus an HNSW rebuild. Queries search the base (graph or
+exact) plus the delta (exact) and skip tombstones.
+
+When the delta passes DELTA_MAX_ROWS or tombstones TOMBSTONE_MAX_FRACTION of
+the rows, a background thread compacts: it builds a new base from the live
+rows without holding the write lock, then swaps it in, carrying over rows
+written meanwhile. The previous snapshot (and its base) is kept for readers
+still mapping it.
+"""
+import os
+import json
+import fcntl
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+
+from .base import VectorBackend
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_config = getattr(settings, 'VECTOR_DB', {})
+INDEX_PATH = _config.get('INDEX_PATH', os.path.join(BASE_DIR, 'vector_index'))
+ANN_MIN_ROWS = _config.get('ANN_MIN_ROWS', 5000)  # Below this, exact search is faster than the graph
+HNSW_M = _config.get('HNSW_M', 32)
+HNSW_CONSTRUCTION_EF = _config.get('HNSW_CONSTRUCTION_EF', 200)
+HNSW_SEARCH_EF = _config.get('HNSW_SEARCH_EF', 64)
+DELTA_MAX_ROWS = _config.get('DELTA_MAX_ROWS', 2000)  # Appended rows before compaction
+TOMBSTONE_MAX_FRACTION = _config.get('TOMBSTONE_MAX_FRACTION', 0.2)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    """(similarities, column positions), each (n_queries, k), best first."""
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+class LoadedIndex:
+    """One mapped snapshot (version) of a collection: base segment + delta + tombstones."""
+
+    def __init__(self, version, directory):
+        self.version = version
+        self.directory = directory
+        with open(os.path.join(directory, 'rows.json')) as f:
+            rows = json.load(f)
+        self.ids = rows['ids']
+        self.metadatas = rows['metadatas']
+        # Snapshots written before base segments: the version directory is its own base
+        self.base = rows.get('base', os.path.basename(directory))
+        self.base_rows = rows.get('base_rows', len(self.ids))
+        self.deleted = np.array(sorted(rows.get('deleted', [])), dtype=np.int64)
+        self.deleted_in_base = int(np.searchsorted(self.deleted, self.base_rows))
+
+        dead = set(self.deleted.tolist())
+        self.positions = {id_: i for i, id_ in enumerate(self.ids) if i not in dead}
+
+        base_dir = os.path.join(os.path.dirname(directory), self.base)
+        self.base_directory = base_dir
+        if self.base_rows:
+            self.base_vectors = np.load(os.path.join(base_dir, 'vectors.npy'), mmap_mode='r')
+        else:
+            self.base_vectors = None
+        delta_path = os.path.join(directory, 'delta.npy')
+        if len(self.ids) > self.base_rows and os.path.exists(delta_path):
+            self.delta = np.load(delta_path, mmap_mode='r')
+        else:
+            self.delta = None
+        self.ann = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def rows(self):
+        return len(self.ids)
+
+    @property
+    def dimension(self):
+        for vectors in (self.base_vectors, self.delta):
+            if vectors is not None:
+                return vectors.shape[1]
+        return None
+
+    def gather(self, positions):
+        """Vectors of the given row positions (base and/or delta)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        dim = self.dimension or 0
+        out = np.zeros((len(positions), dim), dtype=np.float32)
+        in_base = positions < self.base_rows
+        if in_base.any():
+            out[in_base] = self.base_vectors[positions[in_base]]
+        if (~in_base).any():
+            out[~in_base] = self.delta[positions[~in_base] - self.base_rows]
+        return out
+
+    def needs_compaction(self):
+        delta_rows = self.rows - self.base_rows
+        return delta_rows > DELTA_MAX_ROWS or len(self.deleted) > TOMBSTONE_MAX_FRACTION * max(self.rows, 1)
+
+
+class FileIndexBackend(VectorBackend):
+    """Exact cosine search over the mapped vectors."""
+
+    name = 'numpy'
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        os.makedirs(INDEX_PATH, exist_ok=True)
+        logger.info(f"Vector index ({self.name}) at: {INDEX_PATH}")
+
+    def _directory(self, org_code, model_type):
+        return os.path.join(INDEX_PATH, self.collection_name(org_code, model_type))
+
+    @staticmethod
+    def _current_version(directory):
+        try:
+            with open(os.path.join(directory, 'CURRENT')) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _load(self, org_code, model_type):
+        """The live snapshot (remapped if another process wrote since), or None."""
+        key = (org_code, model_type)
+        directory = self._directory(org_code, model_type)
+        version = self._current_version(directory)
+        if version is None:
+            return None
+
+        index = self._indexes.get(key)
+        if index is not None and index.version == version:
+            return index
+
+        index = LoadedIndex(version, os.path.join(directory, f'v{version}'))
+        self._after_load(index)
+        with self._lock:
+            self._indexes[key] = index
+        return index
+
+    def _after_load(self, index):
+        """Hook for backends with extra base index files."""
+
+    def _build_extra(self, vectors, directory):
+        """Hook: write extra index files for a new base segment."""
+
+    @contextmanager
+    def _write_lock(self, directory, name='.lock', blocking=True):
+        """flock on a file in the collection directory; yields False if non-blocking and busy."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, name), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _build_base(self, directory, vectors, tmp_name):
+        """Write an immutable base segment (vectors + extra index files) into a .tmp directory."""
+        tmp = os.path.join(directory, f'{tmp_name}.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        if len(vectors):
+            np.save(os.path.join(tmp, 'vectors.npy'), np.ascontiguousarray(vectors, dtype=np.float32))
+            self._build_extra(vectors, tmp)
+        return tmp
+
+    def _commit(self, directory, current, ids, metadatas, deleted, delta, base, base_rows):
+        """Publish a new version (call with the write lock held)."""
+        version = (current.version if current else 0) + 1
+        snapshot = os.path.join(directory, f'v{version}')
+        shutil.rmtree(snapshot, ignore_errors=True)  # Leftover of a crashed write
+        os.makedirs(snapshot)
+        if delta is not None and len(delta):
+            np.save(os.path.join(snapshot, 'delta.npy'), np.ascontiguousarray(delta, dtype=np.float32))
+        with open(os.path.join(snapshot, 'rows.json'), 'w') as f:
+            json.dump({
+                'ids': ids, 'metadatas': metadatas,
+                'base': base, 'base_rows': base_rows, 'deleted': sorted(deleted),
+            }, f)
+
+        tmp = os.path.join(directory, 'CURRENT.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(version))
+        os.replace(tmp, os.path.join(directory, 'CURRENT'))
+
+        # Keep the previous snapshot (and its base) for readers that mapped it just before the swap
+        keep = {f'v{version}', base}
+        if current is not None:
+            keep.update({f'v{current.version}', current.base})
+        for entry in os.listdir(directory):
+            if entry in keep or entry[:1] not in ('v', 'b') or not entry[1:].isdigit():
+                continue  # Live, lock / CURRENT files, or a base being built (.tmp)
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+    def upsert(self, org_code, model_type, ids, embeddings, metadatas):
+        self.replace(org_code, model_type, [], ids, embeddings, metadatas)
+
+    def replace(self, org_code, model_type, delete_ids, ids, embeddings, metadatas):
+        """Tombstone delete_ids (and overwritten ids), append the new rows: one snapshot write."""
+        directory = self._directory(org_code, model_type)
+        new_vectors = _normalize(embeddings) if ids else None
+
+        with self._write_lock(directory):
+            current = self._load(org_code, model_type)
+            if current is not None:
+                all_ids, all_metadatas = list(current.ids), list(current.metadatas)
+                deleted = set(current.deleted.tolist())
+                live = dict(current.positions)
+                delta = np.array(current.delta) if current.delta is not None else None
+                base, base_rows, dim = current.base, current.base_rows, current.dimension
+            else:
+                all_ids, all_metadatas, deleted, live = [], [], set(), {}
+                delta, base, base_rows, dim = None, 'b0', 0, None
+
+            for id_ in delete_ids:
+                position = live.pop(id_, None)
+                if position is not None:
+                    deleted.add(position)
+
+            if new_vectors is not None:
+                if dim is not None and new_vectors.shape[1] != dim:
+                    raise ValueError(f"Embedding dimension {new_vectors.shape[1]} != index dimension {dim}")
+                for id_, meta in zip(ids, metadatas):
+                    if id_ in live:
+                        deleted.add(live[id_])
+                    live[id_] = len(all_ids)
+                    all_ids.append(id_)
+                    all_metadatas.append(meta)
+                delta = new_vectors if delta is None else np.concatenate([delta, new_vectors])
+
+            self._commit(directory, current, all_ids, all_metadatas, deleted, delta, base, base_rows)
+
+        updated = self._load(org_code, model_type)
+        if updated is not None and updated.needs_compaction():
+            self._compact_in_background(org_code, model_type)
+
+    def delete(self, org_code, model_type, ids):
+        if ids:
+            self.replace(org_code, model_type, ids, [], [], [])
+
+    def _compact_in_background(self, org_code, model_type):
+        threading.Thread(
+            target=self.compact, args=(org_code, model_type), name='vector-compaction', daemon=True
+        ).start()
+
+    def compact(self, org_code, model_type):
+        """
+        Rebuild the base from the live rows (drops tombstones, folds in the delta).
+        The base is built without the write lock; rows written meanwhile are
+        carried over into the new snapshot's delta.
+        """
+        directory = self._directory(org_code, model_type)
+        try:
+            with self._write_lock(directory, '.compact.lock', blocking=False) as acquired:
+                if not acquired:
+                    return  # Another process is compacting this collection
+                snapshot = self._load(org_code, model_type)
+                if snapshot is None or not snapshot.needs_compaction():
+                    return
+                live = sorted(snapshot.positions.values())
+                tmp = self._build_base(directory, snapshot.gather(live), 'compact')
+
+                with self._write_lock(directory):
+                    current = self._load(org_code, model_type)
+                    if current is None or current.base != snapshot.base:
+                        shutil.rmtree(tmp, ignore_errors=True)  # Dropped or replaced meanwhile
+                        return
+                    name = f'b{current.version + 1}'  # Named after the version that introduces it: unique
+                    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+                    os.replace(tmp, os.path.join(directory, name))
+
+                    # Rows only ever get appended to a base, so current = snapshot rows + appended rows
+                    moved = {old: new for new, old in enumerate(live)}
+                    appended = range(snapshot.rows, current.rows)
+                    ids = [snapshot.ids[p] for p in live] + current.ids[snapshot.rows:]
+                    metadatas = [snapshot.metadatas[p] for p in live] + current.metadatas[snapshot.rows:]
+                    deleted = set()
+                    for p in current.deleted.tolist():
+                        if p in moved:
+                            deleted.add(moved[p])
+                        elif p >= snapshot.rows:
+                            deleted.add(len(live) + p - snapshot.rows)
+                    delta = current.gather(list(appended)) if len(appended) else None
+                    self._commit(directory, current, ids, metadatas, deleted, delta, name, len(live))
+
+            logger.info(f"Compacted {self.collection_name(org_code, model_type)}: {len(live)} rows in the base")
+        except Exception as e:
+            logger.error(f"Vector index compaction failed for {org_code}/{model_type}: {e}")
+
+    def get_rows(self, org_code, model_type, employee_ids=None, ids=None):
+        index = self._load(org_code, model_type)
+        if index is None:
+            return []
+        if ids is not None:
+            return [(id_, index.metadatas[index.positions[id_]]) for id_ in ids if id_ in index.positions]
+        wanted = set(employee_ids) if employee_ids is not None else None
+        return [
+            (index.ids[p], index.metadatas[p]) for p in sorted(index.positions.values())
+            if wanted is None or index.metadatas[p].get('employee_id') in wanted
+        ]
+
+    def _search_base(self, index, queries, k):
+        """(similarities, row positions) over the base segment, each (n_queries, k), best first."""
+        return _top_k(queries @ index.base_vectors.T, k)
+
+    def query(self, org_code, model_type, query_embeddings, n_results, count=None):
+        index = self._load(org_code, model_type)
+        if index is None or not len(index):
+            return [[] for _ in query_embeddings]
+
+        queries = _normalize(query_embeddings)
+        k = min(n_results, len(index))
+        similarities, positions = [], []
+        if index.base_rows:
+            # Over-fetch by the tombstones in each segment so k live rows remain
+            sims, rows = self._search_base(index, queries, min(k + index.deleted_in_base, index.base_rows))
+            similarities.append(sims)
+            positions.append(rows)
+        if index.delta is not None:
+            deleted_in_delta = len(index.deleted) - index.deleted_in_base
+            sims, rows = _top_k(queries @ index.delta.T, min(k + deleted_in_delta, len(index.delta)))
+            similarities.append(sims)
+            positions.append(rows + index.base_rows)
+        similarities = np.concatenate(similarities, axis=1)
+        positions = np.concatenate(positions, axis=1)
+        dead = (positions < 0) | np.isin(positions, index.deleted)
+        similarities = np.where(dead, -np.inf, similarities)
+        order = np.argsort(-similarities, axis=1)[:, :k]
+
+        all_hits = []
+        for sims, rows in zip(np.take_along_axis(similarities, order, axis=1), np.take_along_axis(positions, order, axis=1)):
+            hits = []
+            for similarity, row in zip(sims, rows):
+                if not np.isfinite(similarity):
+                    continue  # Tombstone, or ANN returned fewer than k
+                similarity = min(max(float(similarity), 0.0), 1.0)
+                hits.append((index.ids[row], 1.0 - similarity, similarity, index.metadatas[row]))
+            all_hits.append(hits)
+        return all_hits
+
+    def drop(self, org_code, model_type):
+        directory = self._directory(org_code, model_type)
+        with self._write_lock(directory):
+            for entry in os.listdir(directory):
+                if entry not in ('.lock', '.compact.lock'):
+                    path = os.path.join(directory, entry)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.unlink(path)
+        self.invalidate(org_code, model_type)
+
+    def promote(self, org_code, source_model_type, target_model_type):
+        """Publish the source's live rows as the target's next version, as a freshly built base."""
+        source = self._load(org_code, source_model_type)
+        if source is None:
+            raise FileNotFoundError(self._directory(org_code, source_model_type))
+        live = sorted(source.positions.values())
+        ids = [source.ids[p] for p in live]
+        metadatas = [source.metadatas[p] for p in live]
+
+        directory = self._directory(org_code, target_model_type)
+        with self._write_lock(directory):
+            current = self._load(org_code, target_model_type)
+            name = f'b{(current.version if current else 0) + 1}'
+            tmp = self._build_base(directory, source.gather(live), 'promote')
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+            os.replace(tmp, os.path.join(directory, name))
+            self._commit(directory, current, ids, metadatas, set(), None, name, len(live))
+
+        self.drop(org_code, source_model_type)
+        shutil.rmtree(self._directory(org_code, source_model_type), ignore_errors=True)
+        logger.info(f"Promoted {source_model_type} index of {org_code} to {target_model_type}")
+
+    def invalidate(self, org_code=None, model_type=None):
+        with self._lock:
+            for key in list(self._indexes):
+                if org_code is None or (key[0] == org_code and model_type in (None, key[1])):
+                    del self._indexes[key]
+
+
+class NumpyBackend(FileIndexBackend):
+    """
+    Exact search. Scans every vector (memory-bandwidth bound): about 1 ms per
+    5k 512-d embeddings, so large tenants should use the faiss backend.
+    """
+
+    name = 'numpy'
+
+
+class FaissBackend(FileIndexBackend):
+    """
+    FAISS HNSW (inner product on unit vectors = cosine) over the base segment
+    for large tenants; the delta is searched exactly. Bases below
+    ANN_MIN_ROWS keep using the exact search. The graph is only built when a
+    base is (compaction), never inside a write.
+    """
+
+    name = 'faiss'
+
+    def __init__(self):
+        import faiss  # noqa: F401 - fail at startup, not on the first large tenant
+        super().__init__()
+
+    def _build_extra(self, vectors, directory):
+        import faiss
+
+        if len(vectors) < ANN_MIN_ROWS:
+            return
+        index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_CONSTRUCTION_EF
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        faiss.write_index(index, os.path.join(directory, 'index.faiss'))
+
+    def _after_load(self, index):
+        import faiss
+
+        path = os.path.join(index.base_directory, 'index.faiss')
+        if not os.path.exists(path):
+            return
+        flags = getattr(faiss, 'IO_FLAG_MMAP', 0) | getattr(faiss, 'IO_FLAG_READ_ONLY', 0)
+        try:
+            ann = faiss.read_index(path, flags)
+        except RuntimeError:
+            ann = faiss.read_index(path)  # Build without mmap support for this index type
+        ann.hnsw.efSearch = max(HNSW_SEARCH_EF, 1)
+        index.ann = ann
+
+    def _search_base(self, index, queries, k):
+        if index.ann is None:
+            return super()._search_base(index, queries, k)
+        similarities, positions = index.ann.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return similarities, positions
@@ -1,78 +1,113 @@
 """
-Vector Database Service using ChromaDB
+Vector Database Service
 Handles storage and similarity search for face embeddings.
-Free, self-hosted, no Docker required.
+The index itself lives in a pluggable backend (services/vector_backends):
+ChromaDB by default, or memory-mapped per-org numpy / FAISS index files
+(VECTOR_DB['BACKEND']).
 """
-import os
 import logging
+import threading
+from collections import Counter
 from typing import List, Dict, Optional, Tuple
-import chromadb
-from chromadb.config import Settings
+from django.conf import settings
+
+from .vector_backends import get_backend
+from .embedding_events import on_change, publish_change, ensure_listening
 
 logger = logging.getLogger(__name__)
 
-# Get the base directory for ChromaDB storage
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CHROMA_DB_PATH = os.path.join(BASE_DIR, 'chroma_db')
+_config = getattr(settings, 'VECTOR_DB', {})
+BACKEND = _config.get('BACKEND', 'chroma')
+
+
+class CollectionStats:
+    """Embedding total and per-employee embedding counts of one collection, kept in step with writes."""
+
+    def __init__(self, metadatas):
+        self.employees = Counter(m['employee_id'] for m in metadatas if m and m.get('employee_id'))
+        self.count = len(metadatas)
+
+    def added(self, employee_id: str, n: int):
+        self.count += n
+        self.employees[employee_id] += n
+
+    def removed(self, employee_id: str, n: int):
+        self.count = max(self.count - n, 0)
+        self.employees[employee_id] -= n
+        if self.employees[employee_id] <= 0:
+            del self.employees[employee_id]
 
 
 class VectorDBService:
     """
-    ChromaDB-based vector database for face embeddings.
+    Vector database for face embeddings.
     Supports both light (128-dim) and heavy (512-dim) embeddings.
     Organization-scoped collections for multi-tenant support.
     """
     
     _instance = None
-    _client = None
+    _backend = None
     
     def __new__(cls):
-        """Singleton pattern to reuse ChromaDB client."""
+        """Singleton pattern to reuse the backend (client / mapped indexes)."""
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
     
     def __init__(self):
-        if self._client is None:
-            self._initialize_client()
+        if self._backend is None:
+            self._initialize_backend()
     
-    def _initialize_client(self):
-        """Initialize ChromaDB client with persistent storage."""
-        try:
-            # Ensure directory exists
-            os.makedirs(CHROMA_DB_PATH, exist_ok=True)
-            
-            # Create persistent client
-            self._client = chromadb.PersistentClient(
-                path=CHROMA_DB_PATH,
-                settings=Settings(
-                    anonymized_telemetry=False,
-                    allow_reset=True
-                )
-            )
-            logger.info(f"ChromaDB initialized at: {CHROMA_DB_PATH}")
-        except Exception as e:
-            logger.error(f"Failed to initialize ChromaDB: {e}")
-            raise
+    def _initialize_backend(self):
+        """Create the configured backend."""
+        # Per-process CollectionStats keyed by (org_code, model_type)
+        self._stats = {}
+        self._cache_lock = threading.Lock()
+        self._backend = get_backend(BACKEND)
+        # Writes by other workers; our own writes update the caches in place
+        on_change(self.invalidate, local=False)
+
+    @property
+    def backend(self):
+        return self._backend
     
     def _get_collection_name(self, org_code: str, model_type: str) -> str:
         """Generate collection name for org + model type."""
-        # ChromaDB collection names: only alphanumeric and underscores
-        safe_org = org_code.replace('-', '_').replace(' ', '_').lower()
-        return f"{safe_org}_{model_type}_embeddings"
-    
-    def _get_or_create_collection(self, org_code: str, model_type: str):
-        """Get or create a collection for an organization's embeddings."""
-        collection_name = self._get_collection_name(org_code, model_type)
-        
-        # Determine embedding dimension based on model type
-        # Light model: 128-dim, Heavy model: 512-dim
-        metadata = {"model_type": model_type, "org_code": org_code}
-        
-        return self._client.get_or_create_collection(
-            name=collection_name,
-            metadata=metadata
-        )
+        return self._backend.collection_name(org_code, model_type)
+
+    def _get_stats(self, org_code: str, model_type: str) -> CollectionStats:
+        """CollectionStats for a collection, loaded once from its metadata rows."""
+        ensure_listening()
+        key = (org_code, model_type)
+        stats = self._stats.get(key)
+        if stats is None:
+            rows = self._backend.get_rows(org_code, model_type)
+            stats = CollectionStats([meta for _, meta in rows])
+            with self._cache_lock:
+                stats = self._stats.setdefault(key, stats)
+        return stats
+
+    def _update_stats(self, org_code: str, model_type: str, removed=(), added=()):
+        """Apply (employee_id, n) changes to loaded stats."""
+        with self._cache_lock:
+            stats = self._stats.get((org_code, model_type))
+            if stats is None:
+                return
+            for employee_id, n in removed:
+                stats.removed(employee_id, n)
+            for employee_id, n in added:
+                stats.added(employee_id, n)
+
+    def invalidate(self, org_code: Optional[str] = None, model_type: Optional[str] = None):
+        """
+        Drop cached handles/stats (all, one org, or one org + model type) - after
+        the collection was deleted or re-created, or written by another process.
+        """
+        with self._cache_lock:
+            for key in list(self._stats):
+                if org_code is None or (key[0] == org_code and model_type in (None, key[1])):
+                    del self._stats[key]
+        self._backend.invalidate(org_code, model_type)
     
     def add_embeddings(
         self, 
@@ -95,34 +130,70 @@ class VectorDBService:
         Returns:
             True if successful
         """
+        return self.bulk_upsert_embeddings(org_code, model_type, [{
+            'employee_id': employee_id,
+            'employee_name': employee_name,
+            'embeddings': embeddings,
+        }])
+
+    def bulk_upsert_embeddings(self, org_code: str, model_type: str, employees: List[Dict],
+                               model_version: Optional[str] = None) -> bool:
+        """
+        Replace the embeddings of many employees in a few backend calls.
+
+        Ids are deterministic ({employee_id}_{index}), so rows are upserted in
+        place; only ids past an employee's new count are stale and deleted -
+        found with one employee_id $in lookup.
+
+        Args:
+            org_code: Organization code
+            model_type: 'light' or 'heavy'
+            employees: [{'employee_id', 'employee_name', 'embeddings'}]
+            model_version: Version tag of the embeddings (default: the serving face model)
+
+        Returns:
+            True if successful
+        """
+        employees = [e for e in employees if e.get('employee_id')]
+        if not employees:
+            return True
+        if model_version is None:
+            from apps.faces.embedding_versions import serving_tag
+            model_version = serving_tag()
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
-            
-            # First, delete existing embeddings for this employee
-            self.delete_embeddings(org_code, model_type, employee_id)
-            
-            # Add new embeddings with unique IDs
-            ids = [f"{employee_id}_{i}" for i in range(len(embeddings))]
-            metadatas = [
-                {
-                    "employee_id": employee_id,
-                    "employee_name": employee_name,
-                    "embedding_index": i
-                } 
-                for i in range(len(embeddings))
-            ]
-            
-            collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                metadatas=metadatas
+            ids, embeddings, metadatas = [], [], []
+            for employee in employees:
+                for i, embedding in enumerate(employee['embeddings']):
+                    ids.append(f"{employee['employee_id']}_{i}")
+                    embeddings.append(embedding)
+                    metadatas.append({
+                        "employee_id": employee['employee_id'],
+                        "employee_name": employee.get('employee_name', ''),
+                        "embedding_index": i,
+                        "model_version": model_version
+                    })
+
+            existing = self._backend.get_rows(org_code, model_type, employee_ids=[e['employee_id'] for e in employees])
+            new_ids = set(ids)
+            stale = [id_ for id_, _ in existing if id_ not in new_ids]
+            self._backend.replace(org_code, model_type, stale, ids, embeddings, metadatas)
+
+            self._update_stats(
+                org_code, model_type,
+                removed=[(meta.get('employee_id', ''), 1) for _, meta in existing],
+                added=[(e['employee_id'], len(e['embeddings'])) for e in employees]
+            )
+
+            publish_change(org_code, model_type)
+            logger.info(
+                f"Upserted {len(ids)} embeddings for {len(employees)} employees ({model_type}), "
+                f"{len(stale)} stale removed"
             )
-            
-            logger.info(f"Added {len(embeddings)} embeddings for employee {employee_id} ({model_type})")
             return True
-            
+
         except Exception as e:
             logger.error(f"Failed to add embeddings: {e}")
+            self.invalidate(org_code, model_type)
             return False
     
     def search_similar(
@@ -141,36 +212,41 @@ class VectorDBService:
             model_type: 'light' or 'heavy'
             query_embedding: Query embedding vector
             n_results: Number of results to return
-            threshold: Minimum similarity score (0-1), 0 = no threshold
+            threshold: Minimum cosine similarity (0-1), 0 = no threshold
             
         Returns:
             List of matches with employee_id, distance, and metadata
         """
+        return self.search_similar_many(org_code, model_type, [query_embedding], n_results, threshold)[0]
+
+    def search_similar_many(
+        self,
+        org_code: str,
+        model_type: str,
+        query_embeddings: List[List[float]],
+        n_results: int = 5,
+        threshold: float = 0.0
+    ) -> List[List[Dict]]:
+        """
+        search_similar() for several queries (e.g. every face in a frame) in one backend query.
+
+        Returns:
+            One match list per query embedding, in the same order
+        """
+        empty = [[] for _ in query_embeddings]
+        if not query_embeddings:
+            return empty
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
-            
-            # Check if collection has any embeddings
-            if collection.count() == 0:
+            # Check if collection has any embeddings (cached counter, kept in step with writes)
+            count = self._get_stats(org_code, model_type).count
+            if count == 0:
                 logger.warning(f"No embeddings in collection for {org_code} ({model_type})")
-                return []
+                return empty
             
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=min(n_results, collection.count())
-            )
-            
-            matches = []
-            if results and results['ids'] and len(results['ids']) > 0:
-                for i, id_ in enumerate(results['ids'][0]):
-                    distance = results['distances'][0][i] if results['distances'] else 0
-                    metadata = results['metadatas'][0][i] if results['metadatas'] else {}
-                    
-                    # Convert L2 distance to similarity score (0-1)
-                    # Lower distance = higher similarity
-                    # Using exponential decay: similarity = exp(-distance)
-                    import math
-                    similarity = math.exp(-distance / 2)  # Normalize for better range
-                    
+            all_matches = []
+            for hits in self._backend.query(org_code, model_type, query_embeddings, n_results, count=count):
+                matches = []
+                for id_, distance, similarity, metadata in hits:
                     if threshold == 0 or similarity >= threshold:
                         matches.append({
                             'id': id_,
@@ -180,15 +256,17 @@ class VectorDBService:
                             'similarity': similarity,
                             'confidence': round(similarity * 100, 2)
                         })
+                
+                # Sort by similarity descending
+                matches.sort(key=lambda x: x['similarity'], reverse=True)
+                all_matches.append(matches)
             
-            # Sort by similarity descending
-            matches.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return matches
+            return all_matches
             
         except Exception as e:
             logger.error(f"Failed to search embeddings: {e}")
-            return []
+            self.invalidate(org_code, model_type)  # Collection may have been re-created elsewhere
+            return empty
     
     def find_best_match(
         self, 
@@ -209,21 +287,28 @@ class VectorDBService:
         Returns:
             Tuple of (employee_id, confidence, employee_name) or None if no match
         """
-        matches = self.search_similar(org_code, model_type, query_embedding, n_results=3)
-        
-        if not matches:
-            return None
-        
-        best_match = matches[0]
-        
-        if best_match['similarity'] >= min_confidence:
-            return (
-                best_match['employee_id'],
-                best_match['confidence'],
-                best_match['employee_name']
-            )
-        
-        return None
+        return self.find_best_matches(org_code, model_type, [query_embedding], min_confidence)[0]
+
+    def find_best_matches(
+        self,
+        org_code: str,
+        model_type: str,
+        query_embeddings: List[List[float]],
+        min_confidence: float = 0.7
+    ) -> List[Optional[Tuple[str, float, str]]]:
+        """find_best_match() for several embeddings with a single query."""
+        results = []
+        for matches in self.search_similar_many(org_code, model_type, query_embeddings, n_results=3):
+            best_match = matches[0] if matches else None
+            if best_match and best_match['similarity'] >= min_confidence:
+                results.append((
+                    best_match['employee_id'],
+                    best_match['confidence'],
+                    best_match['employee_name']
+                ))
+            else:
+                results.append(None)
+        return results
     
     def delete_embeddings(self, org_code: str, model_type: str, employee_id: str) -> bool:
         """
@@ -238,47 +323,40 @@ class VectorDBService:
             True if successful
         """
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
-            
             # Find all IDs for this employee
-            results = collection.get(
-                where={"employee_id": employee_id}
-            )
+            ids = [id_ for id_, _ in self._backend.get_rows(org_code, model_type, employee_ids=[employee_id])]
             
-            if results and results['ids']:
-                collection.delete(ids=results['ids'])
-                logger.info(f"Deleted {len(results['ids'])} embeddings for employee {employee_id}")
+            if ids:
+                self._backend.delete(org_code, model_type, ids)
+                self._update_stats(org_code, model_type, removed=[(employee_id, len(ids))])
+                publish_change(org_code, model_type)
+                logger.info(f"Deleted {len(ids)} embeddings for employee {employee_id}")
             
             return True
             
         except Exception as e:
             logger.error(f"Failed to delete embeddings: {e}")
+            self.invalidate(org_code, model_type)
             return False
     
     def get_employee_embeddings(self, org_code: str, model_type: str, employee_id: str) -> List[Dict]:
         """
-        Get all embeddings for an employee from ChromaDB.
+        Get all embeddings for an employee from the vector index.
         
         Returns:
             List of dicts with id, metadata, and embedding_index
         """
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
-            
-            results = collection.get(
-                where={"employee_id": employee_id}
-            )
+            rows = self._backend.get_rows(org_code, model_type, employee_ids=[employee_id])
             
             embeddings_list = []
-            if results and results['ids']:
-                for i, id_ in enumerate(results['ids']):
-                    meta = results['metadatas'][i] if results['metadatas'] else {}
-                    embeddings_list.append({
-                        'chroma_id': id_,
-                        'embedding_index': meta.get('embedding_index', i),
-                        'employee_id': meta.get('employee_id', ''),
-                        'employee_name': meta.get('employee_name', ''),
-                    })
+            for i, (id_, meta) in enumerate(rows):
+                embeddings_list.append({
+                    'chroma_id': id_,
+                    'embedding_index': meta.get('embedding_index', i),
+                    'employee_id': meta.get('employee_id', ''),
+                    'employee_name': meta.get('employee_name', ''),
+                })
             
             # Sort by embedding_index
             embeddings_list.sort(key=lambda x: x.get('embedding_index', 0))
@@ -286,6 +364,7 @@ class VectorDBService:
             
         except Exception as e:
             logger.error(f"Failed to get employee embeddings: {e}")
+            self.invalidate(org_code, model_type)
             return []
     
     def delete_embedding_by_id(self, org_code: str, model_type: str, chroma_id: str) -> bool:
@@ -301,9 +380,13 @@ class VectorDBService:
             True if successful
         """
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
-            collection.delete(ids=[chroma_id])
-            logger.info(f"Deleted embedding {chroma_id} from ChromaDB")
+            existing = self._backend.get_rows(org_code, model_type, ids=[chroma_id])
+            if not existing:
+                return True
+            self._backend.delete(org_code, model_type, [chroma_id])
+            self._update_stats(org_code, model_type, removed=[(existing[0][1].get('employee_id', ''), 1)])
+            publish_change(org_code, model_type)
+            logger.info(f"Deleted embedding {chroma_id} from the vector index")
             return True
         except Exception as e:
             logger.error(f"Failed to delete embedding {chroma_id}: {e}")
@@ -312,49 +395,61 @@ class VectorDBService:
     def get_employee_count(self, org_code: str, model_type: str) -> int:
         """Get number of unique employees with embeddings."""
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
-            
-            # Get all embeddings and count unique employee IDs
-            results = collection.get()
-            
-            if results and results['metadatas']:
-                unique_employees = set()
-                for meta in results['metadatas']:
-                    if meta.get('employee_id'):
-                        unique_employees.add(meta['employee_id'])
-                return len(unique_employees)
-            
-            return 0
-            
+            return len(self._get_stats(org_code, model_type).employees)
         except Exception as e:
             logger.error(f"Failed to get employee count: {e}")
             return 0
     
     def get_collection_stats(self, org_code: str, model_type: str) -> Dict:
-        """Get statistics for a collection."""
+        """Get statistics for a collection (from the cached counters)."""
         try:
-            collection = self._get_or_create_collection(org_code, model_type)
+            stats = self._get_stats(org_code, model_type)
             
             return {
-                'collection_name': collection.name,
-                'total_embeddings': collection.count(),
-                'unique_employees': self.get_employee_count(org_code, model_type)
+                'collection_name': self._get_collection_name(org_code, model_type),
+                'total_embeddings': stats.count,
+                'unique_employees': len(stats.employees)
             }
             
         except Exception as e:
             logger.error(f"Failed to get collection stats: {e}")
             return {'error': str(e)}
     
+    def rebuild_legacy_collections(self) -> List[str]:
+        """Rebuild every collection created with outdated index settings (Chroma: not in cosine space)."""
+        rebuilt = self._backend.rebuild_legacy()
+        if rebuilt:
+            self.invalidate()
+            publish_change(None)  # Every worker's handles point at the replaced collections
+        return rebuilt
+
+    def promote_index(self, org_code: str, source_model_type: str, target_model_type: str) -> bool:
+        """
+        Make a staged collection the live one (e.g. re-embedded 'heavy_<version>' -> 'heavy').
+        A missing source means nothing was staged: the target is dropped.
+        """
+        try:
+            if self._backend.get_rows(org_code, source_model_type):
+                self._backend.promote(org_code, source_model_type, target_model_type)
+            else:
+                self._backend.drop(org_code, target_model_type)
+                self._backend.drop(org_code, source_model_type)
+            self.invalidate(org_code)
+            publish_change(org_code)
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to promote {source_model_type} index of {org_code}: {e}")
+            self.invalidate(org_code)
+            return False
+
     def clear_organization(self, org_code: str) -> bool:
         """Clear all embeddings for an organization."""
         try:
             for model_type in ['light', 'heavy']:
-                collection_name = self._get_collection_name(org_code, model_type)
-                try:
-                    self._client.delete_collection(collection_name)
-                    logger.info(f"Deleted collection: {collection_name}")
-                except Exception:
-                    pass  # Collection may not exist
+                self._backend.drop(org_code, model_type)
+            self.invalidate(org_code)
+            publish_change(org_code)
             
             return True
             
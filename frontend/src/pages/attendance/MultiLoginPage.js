@@ -3,6 +3,7 @@
  * Optimized for Low Bandwidth.
  * - Client-side image compression (480px, 0.5 quality)
  * - Throttled server polling (1.2s)
+ * - Preview over a persistent WebSocket (/ws/preview/), HTTP fallback
  */
 import React, { useRef, useState, useEffect } from 'react';
 import Webcam from 'react-webcam';
@@ -11,6 +12,16 @@ import { Link } from 'react-router-dom';
 
 const API_BASE = '/api/v1/detection';  // Uses relative path for nginx proxy
 
+// Stable per-browser kiosk id so the server can keep a face tracking session
+const getKioskId = () => {
+    let id = localStorage.getItem('kiosk_id');
+    if (!id) {
+        id = `kiosk_${Date.now().toString(36)}_${Math.random().toString(36).slice(2, 8)}`;
+        localStorage.setItem('kiosk_id', id);
+    }
+    return id;
+};
+
 const MultiLoginPage = () => {
     const webcamRef = useRef(null);
     const canvasRef = useRef(null);
@@ -28,6 +39,7 @@ const MultiLoginPage = () => {
 
     // Ref to share detections between loops without re-renders
     const faceDetectionsRef = useRef([]);
+    const previewSocketRef = useRef(null);
 
     // Get org from session
     const org = JSON.parse(sessionStorage.getItem('attendanceOrg') || '{}');
@@ -173,11 +185,28 @@ const MultiLoginPage = () => {
                 return;
             }
 
+            const socket = previewSocketRef.current;
+            if (socket && socket.readyState === WebSocket.OPEN) {
+                // Don't queue frames locally if the last one hasn't left yet
+                if (socket.bufferedAmount > 0) return;
+                const scale = 640 / video.videoWidth;
+                window.previewScale = scale;
+                const frameCanvas = document.createElement('canvas');
+                frameCanvas.width = 640;
+                frameCanvas.height = video.videoHeight * scale;
+                frameCanvas.getContext('2d').drawImage(video, 0, 0, frameCanvas.width, frameCanvas.height);
+                frameCanvas.toBlob(blob => {
+                    if (blob && socket.readyState === WebSocket.OPEN) socket.send(blob);
+                }, 'image/jpeg', 0.8);
+                return;
+            }
+
             window.previewPending = true;
 
             try {
                 const formData = new FormData();
                 formData.append('org_code', orgCode);
+                formData.append('kiosk_id', getKioskId());
 
                 // 1. Get Full Image (resize to 640px)
                 const scale = 640 / video.videoWidth;
@@ -195,6 +224,8 @@ const MultiLoginPage = () => {
                 try {
                     const res = await fetch(`${API_BASE}/preview/`, { method: 'POST', body: formData });
                     const d = await res.json();
+                    // Server is busy with a check-in: keep the last overlay
+                    if (d.busy) return;
 
                     window.previewBoxes = d.boxes || [];
                     setFaceResults(d.face_results || []);
@@ -221,6 +252,46 @@ const MultiLoginPage = () => {
         };
     }, [modelsLoaded, isProcessing, lastResult, orgCode, detectedName]);
 
+    // 2b. Preview WebSocket (server keeps only the latest frame per kiosk)
+    useEffect(() => {
+        let closed = false;
+        let retryTimer = null;
+
+        const connect = () => {
+            const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
+            const params = new URLSearchParams({ org_code: orgCode, kiosk_id: getKioskId() });
+            const ws = new WebSocket(`${proto}://${window.location.host}/ws/preview/?${params}`);
+            ws.binaryType = 'arraybuffer';
+
+            ws.onmessage = (event) => {
+                try {
+                    const d = JSON.parse(event.data);
+                    window.previewBoxes = d.boxes || [];
+                    setFaceResults(d.face_results || []);
+                    if (d.boxes) {
+                        setDetectedClasses(new Set(d.boxes.map(b => b.class)));
+                    }
+                } catch (e) {
+                    // Ignore malformed messages
+                }
+            };
+            ws.onclose = () => {
+                previewSocketRef.current = null;
+                // Fall back to HTTP polling until the socket is back
+                if (!closed) retryTimer = setTimeout(connect, 5000);
+            };
+            previewSocketRef.current = ws;
+        };
+
+        connect();
+        return () => {
+            closed = true;
+            clearTimeout(retryTimer);
+            if (previewSocketRef.current) previewSocketRef.current.close();
+            previewSocketRef.current = null;
+        };
+    }, [orgCode]);
+
     // 3. Login Action
     const attemptLogin = async (mode) => {
         if (isProcessing) return;